@@ -0,0 +1,82 @@
+# aggregates.py - dashboard aggregation computed in Postgres
+
+# The dashboard only ever needs sums, so rather than pulling every
+# (meal x nutrient) row into pandas it reads the daily_nutrient_totals rollup
+# maintained by meal_store. The cost depends on the number of distinct days
+# and nutrients, not on raw row count.
+
+import os
+
+import pandas as pd
+
+from db import read_sql, connection
+from nutrient_storage import nutrient_source
+
+DASHBOARD_AGGREGATE_SQL = """
+    SELECT day AS date, nutrient_name, amount::float8 AS amount, percent_dv::float8 AS percent_dv
+    FROM daily_nutrient_totals
+    WHERE user_id = %s AND day >= %s;
+"""
+
+
+def get_daily_totals(user_id, start_date):
+    """One row per day per nutrient in a user's range: ``date``, ``nutrient_name``, ``amount``, ``percent_dv``.
+
+    Range totals, ratios and trends are derived from these rows in analytics.py.
+    """
+    return read_sql(DASHBOARD_AGGREGATE_SQL, params=(user_id, start_date))
+
+
+USER_DATA_SQL = """
+    SELECT m.id, m.meal_title, m.created_at, n.nutrient_name, n.amount::float8 AS amount, n.unit
+    FROM meals m {nutrients}
+    WHERE m.user_id = %s AND m.created_at >= %s ORDER BY m.created_at DESC;
+"""
+
+
+def get_user_data(user_id, start_date, layout=None):
+    """Raw (meal x nutrient) rows for a range, from either storage layout; the dashboard itself uses the rollup."""
+    source, params = nutrient_source(layout)
+    df = read_sql(USER_DATA_SQL.format(nutrients=source), params=(*params, user_id, start_date))
+    if not df.empty:
+        df['created_at'] = pd.to_datetime(df['created_at']).dt.tz_localize(None)
+    return df
+
+
+# Keyset pagination: each page continues strictly after the last (created_at, id)
+# seen, so a page costs the same at any depth and concurrent saves never shift it.
+MEAL_HISTORY_PAGE_SIZE = int(os.getenv("MEAL_HISTORY_PAGE_SIZE", "20"))
+MEAL_PAGE_SQL = """
+    SELECT id, meal_title, created_at
+    FROM meals
+    WHERE user_id = %s AND created_at >= %s {after}
+    ORDER BY created_at DESC, id DESC
+    LIMIT %s;
+"""
+
+
+def get_meal_page(user_id, start_date, after=None, page_size=MEAL_HISTORY_PAGE_SIZE):
+    """One page of meal history, newest first, and the cursor for the next page.
+
+    ``after`` is the cursor returned for the previous page (None for the first).
+    The returned cursor is None when there are no more meals.
+    """
+    if after is None:
+        df = read_sql(MEAL_PAGE_SQL.format(after=""), params=(user_id, start_date, page_size + 1))
+    else:
+        df = read_sql(MEAL_PAGE_SQL.format(after="AND (created_at, id) < (%s, %s)"),
+                      params=(user_id, start_date, after[0], after[1], page_size + 1))
+    if len(df) <= page_size:
+        return df, None
+    df = df.iloc[:page_size]
+    last = df.iloc[-1]
+    return df, (pd.Timestamp(last['created_at']).to_pydatetime(), int(last['id']))
+
+
+def get_data_version(user_id):
+    """The user's data version; it changes in the same transaction as any meal write."""
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT version FROM user_data_versions WHERE user_id = %s;", (user_id,))
+        row = cur.fetchone()
+        conn.commit()
+    return row[0] if row else 0
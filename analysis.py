@@ -0,0 +1,116 @@
+# analysis.py - the meal analysis pipeline: prompt, model call and response parsing
+
+import os
+import threading
+from dotenv import load_dotenv
+from analysis_cache import cache_key, get_analysis_cache
+from stub_model import StubModel
+from model_client import ModelClient
+from recordings import recording
+from response_parser import parse_summary_from_response, StreamingSummaryParser
+from nutrients import prompt_nutrient_list, response_schema
+from instrumentation import span, register_stats
+
+load_dotenv()
+MODEL_NAME = 'gemini-2.5-flash'
+ANALYSIS_MODEL = os.getenv("ANALYSIS_MODEL", "gemini")
+# markdown: free-text layout, streamed section by section; json: Gemini structured output against nutrients.response_schema()
+ANALYSIS_OUTPUT = os.getenv("ANALYSIS_OUTPUT", "markdown")
+
+# Both prompts list the nutrients from nutrients.NUTRIENTS, so the template cannot drift from the parser.
+MARKDOWN_PROMPT = f"""You are a world-class food scientist AI. Analyze the meal in the image and answer in exactly this format, with no other text:
+
+Meal Title: <descriptive title>
+
+- **Advantages:** <2-3 health benefits>
+- **Disadvantages:** <1-2 concerns or limitations>
+
+***Fun Fact:*** <one interesting fact about this food>
+
+```json
+[{{"nutrient": "<name>", "amount": <number>, "unit": "<unit>", "percent_dv": <number>}}, ...]
+```
+
+The JSON array MUST contain every nutrient below exactly once, in this order and unit, with amount 0 when absent or unknown. Include percent_dv only for nutrients marked *:
+{prompt_nutrient_list()}
+"""
+STRUCTURED_PROMPT = f"""You are a world-class food scientist AI. Analyze the meal in the image: give a descriptive title, 2-3 health advantages, 1-2 disadvantages or limitations, one interesting fun fact, and the amount of every nutrient for the portion shown (0 when absent or unknown), in these units, with percent_dv for nutrients marked *:
+{prompt_nutrient_list()}
+"""
+input_prompt = STRUCTURED_PROMPT if ANALYSIS_OUTPUT == 'json' else MARKDOWN_PROMPT
+
+# google.generativeai takes about a second to import, so it is loaded and configured on the first model call
+_gemini_model = None
+_gemini_lock = threading.Lock()
+def get_gemini_model():
+    global _gemini_model
+    if _gemini_model is None:
+        with _gemini_lock:
+            if _gemini_model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+                generation_config = genai.GenerationConfig(response_mime_type="application/json", response_schema=response_schema()) if ANALYSIS_OUTPUT == 'json' else None
+                _gemini_model = genai.GenerativeModel(MODEL_NAME, generation_config=generation_config)
+    return _gemini_model
+
+def get_gemini_response(image_data, prompt, timeout=None):
+    request_options = {"timeout": timeout} if timeout else None
+    return get_gemini_model().generate_content([image_data[0], prompt], request_options=request_options).text
+get_gemini_response.model_name = MODEL_NAME
+
+def stream_gemini_response(image_data, prompt, timeout=None):
+    request_options = {"timeout": timeout} if timeout else None
+    for chunk in get_gemini_model().generate_content([image_data[0], prompt], stream=True, request_options=request_options):
+        yield chunk.text
+get_gemini_response.stream = stream_gemini_response
+
+_client = None
+_client_lock = threading.Lock()
+def get_model():
+    """Process-wide ModelClient over Gemini, or over the offline stub when ANALYSIS_MODEL=stub.
+
+    Calls are also written to ANALYSIS_RECORD when it is set (see recordings.py).
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ModelClient(recording(StubModel() if ANALYSIS_MODEL == 'stub' else get_gemini_response))
+    return _client
+
+register_stats("app_model", lambda: _client.stats() if _client else {})
+
+def analyze_image(image_data, prompt, model=None, timeout=None):
+    # Identical image + prompt + model -> reuse the stored analysis instead of a new model call
+    model = model or get_model()
+    cache = get_analysis_cache()
+    key = cache_key(image_data[0]['data'], prompt, model.model_name)
+    cached = cache.get(key)
+    if cached: return cached['analysis']
+    response_text = model(image_data, prompt, timeout=timeout)
+    analysis = parse_summary_from_response(response_text)
+    cache.set(key, response_text, analysis)
+    return analysis
+
+def analyze_image_stream(image_data, prompt, model=None, timeout=None):
+    """Like analyze_image, but yields parser events while the response streams in.
+
+    Yields ``("title", str)``, ``("text", str)`` and ``("nutrients", list)`` as they
+    become available, then ``("done", analysis)`` with the same dict analyze_image returns.
+    """
+    model = model or get_model()
+    cache = get_analysis_cache()
+    key = cache_key(image_data[0]['data'], prompt, model.model_name)
+    cached = cache.get(key)
+    if cached:
+        yield ("done", cached['analysis']); return
+    parser = StreamingSummaryParser()
+    for chunk in model.stream(image_data, prompt, timeout=timeout):
+        with span("parse.feed"):
+            events = parser.feed(chunk)
+        yield from events
+    with span("parse.finish"):
+        events, analysis = parser.finish()
+    yield from events
+    cache.set(key, analysis['full_text'], analysis)
+    yield ("done", analysis)
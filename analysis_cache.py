@@ -0,0 +1,174 @@
+# analysis_cache.py - content-addressed cache for model analyses
+
+# A model call takes several seconds and is our biggest cost, yet the same photo
+# is often analysed twice (double clicks, re-uploads). Entries are keyed on a
+# hash of the image bytes, the prompt and the model name, and hold the raw
+# response text together with its parsed summary.
+#
+# Backends are chosen with ANALYSIS_CACHE_BACKEND = memory | disk | postgres | redis.
+# memory and redis are the state_store.py backends; postgres keeps its own table.
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+from db import connection
+from instrumentation import register_stats
+from state_store import MemoryStore, RedisStore
+
+ANALYSIS_CACHE_BACKEND = os.getenv("ANALYSIS_CACHE_BACKEND", "memory")
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR", ".analysis_cache")
+
+
+def cache_key(image_bytes, prompt, model_name):
+    digest = hashlib.sha256()
+    for part in (model_name.encode(), prompt.encode(), image_bytes):
+        # Length-prefix each part so different splits never collide.
+        digest.update(len(part).to_bytes(8, "big")); digest.update(part)
+    return digest.hexdigest()
+
+
+# --- BACKENDS ---
+class DiskBackend:
+    """One file per entry, prefixed with its expiry time; oldest files evicted past the byte budget.
+
+    The directory is only listed when the running size estimate passes the budget, or
+    every RESCAN_EVERY writes to account for other processes; a write is otherwise
+    just its own file. Eviction goes down to EVICT_TO of the budget, so the next
+    few writes do not list it again.
+    """
+
+    RESCAN_EVERY = 1000
+    EVICT_TO = 0.9
+
+    def __init__(self, directory=ANALYSIS_CACHE_DIR, max_bytes=ANALYSIS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._bytes = self._evict()     # running estimate of the directory's size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                expires_at, payload = f.read().split(b"\n", 1)
+        except FileNotFoundError:
+            return None
+        if float(expires_at) < time.time():
+            try: os.remove(path)
+            except FileNotFoundError: pass
+            return None
+        return payload
+
+    def set(self, key, payload, ttl):
+        tmp_path = self._path(key) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(f"{time.time() + ttl}\n".encode()); f.write(payload)
+            written = f.tell()
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._bytes += written; self._writes += 1
+            if self._bytes > self.max_bytes or self._writes % self.RESCAN_EVERY == 0:
+                self._bytes = self._evict()
+
+    def _evict(self):
+        """Remove the oldest files until the directory fits the budget; returns its size afterwards."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try: entries.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+                except FileNotFoundError: pass
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return total
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes * self.EVICT_TO:
+                break
+            total -= size
+            try: os.remove(path)
+            except FileNotFoundError: pass
+        return total
+
+
+class PostgresBackend:
+    """Shared across processes via the analysis_cache table (see migrations.py)."""
+
+    PURGE_EVERY = 100
+
+    def __init__(self):
+        self._writes = 0
+
+    def get(self, key):
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT payload FROM analysis_cache WHERE key = %s AND expires_at > now();", (key,))
+            row = cur.fetchone()
+            conn.commit()
+        return bytes(row[0]) if row else None
+
+    def set(self, key, payload, ttl):
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO analysis_cache (key, payload, expires_at) VALUES (%s, %s, now() + %s * interval '1 second')
+                ON CONFLICT (key) DO UPDATE SET payload = EXCLUDED.payload, expires_at = EXCLUDED.expires_at;
+            """, (key, payload, ttl))
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                cur.execute("DELETE FROM analysis_cache WHERE expires_at <= now();")
+            conn.commit()
+
+
+BACKENDS = {"memory": lambda: MemoryStore(ANALYSIS_CACHE_MAX_BYTES), "disk": DiskBackend, "postgres": PostgresBackend,
+            "redis": lambda: RedisStore(prefix="analysis_cache:")}
+
+
+# --- CACHE ---
+class AnalysisCache:
+    def __init__(self, backend, ttl=ANALYSIS_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return ``{"response_text", "analysis"}`` for a key, or None on a miss."""
+        payload = self.backend.get(key)
+        with self._lock:
+            if payload is None:
+                self.misses += 1; return None
+            self.hits += 1
+        return json.loads(payload)
+
+    def set(self, key, response_text, analysis):
+        payload = json.dumps({"response_text": response_text, "analysis": analysis}).encode()
+        self.backend.set(key, payload, self.ttl)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_analysis_cache():
+    """Process-wide cache using the backend named in ANALYSIS_CACHE_BACKEND."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnalysisCache(BACKENDS[ANALYSIS_CACHE_BACKEND]())
+    return _cache
+
+
+register_stats("app_analysis_cache", lambda: _cache.stats() if _cache else {})
@@ -0,0 +1,143 @@
+# analytics.py - dashboard metrics from one dense (day x nutrient) matrix
+
+# Nutrient rows are pivoted once into a float matrix: one row per day and one
+# column per nutrient, in canonical order (nutrients.NUTRIENTS). Nutrients
+# outside the canonical list are appended after it. Rows are placed with
+# categorical codes and np.bincount, so duplicates (several meals per day) are
+# summed in the same pass. Every dashboard figure is then a column
+# selection or a reduction over the matrix instead of another filter over the
+# long frame. %DVs are stored at save time and summed per day by the rollup, so
+# goal progress is a second matrix of the same shape, with no unit conversion.
+
+import numpy as np
+import pandas as pd
+
+from nutrients import NUTRIENT_NAMES, NUTRIENT_UNITS, DAILY_VALUES, MACROS, VITAMINS
+
+MACRO_LABELS = ['Protein', 'Carbohydrates', 'Fat']
+
+
+def nutrient_table(names=NUTRIENT_NAMES):
+    """Canonical unit and Daily Value per nutrient, indexed by name (NaN where unknown)."""
+    return pd.DataFrame({"unit": [NUTRIENT_UNITS.get(n) for n in names],
+                         "daily_value": [DAILY_VALUES.get(n, np.nan) for n in names]}, index=pd.Index(names, name="nutrient_name"))
+
+
+class NutrientMatrix:
+    def __init__(self, days, nutrients, values, present, percent=None):
+        self.days = days            # DatetimeIndex, ascending
+        self.nutrients = nutrients  # Index of nutrient names (matrix columns)
+        self.values = values        # float64 array, shape (len(days), len(nutrients))
+        self.present = present      # bool array, True where the source had a row
+        self.percent = percent      # stored %DV sums, same shape, NaN where none; None if the source had no %DV
+        self.columns = {name: i for i, name in enumerate(nutrients)}
+        self.totals = pd.Series(values.sum(axis=0), index=nutrients)[present.any(axis=0)]
+        self.percent_totals = None if percent is None else pd.Series(np.nansum(percent, axis=0), index=nutrients)[~np.isnan(percent).all(axis=0)]
+
+    @classmethod
+    def from_long(cls, df, date_column='date'):
+        """Build from rows of (date_column, nutrient_name, amount[, percent_dv]); repeated (day, nutrient) pairs are summed."""
+        # Factorize once, then map the few distinct names to their canonical column.
+        name_codes, names = pd.factorize(df['nutrient_name'])
+        extras = sorted(set(names) - set(NUTRIENT_NAMES))
+        nutrients = pd.Index(NUTRIENT_NAMES + extras, name="nutrient_name")
+        nutrient_codes = nutrients.get_indexer(names)[name_codes]
+        dates = df[date_column]
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates)
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_localize(None)
+        day_codes, days = pd.factorize(dates.to_numpy().astype('datetime64[D]'), sort=True)
+        shape = (len(days), len(nutrients))
+        flat = day_codes.astype(np.int64) * shape[1] + nutrient_codes
+        amounts = np.nan_to_num(df['amount'].to_numpy(dtype=np.float64, na_value=np.nan))
+        values = np.bincount(flat, weights=amounts, minlength=shape[0] * shape[1]).reshape(shape)
+        present = np.bincount(flat, minlength=shape[0] * shape[1]).reshape(shape) > 0
+        percent = None
+        if 'percent_dv' in df:
+            percent_dv = df['percent_dv'].to_numpy(dtype=np.float64, na_value=np.nan)
+            known = ~np.isnan(percent_dv)
+            percent = np.bincount(flat[known], weights=percent_dv[known], minlength=shape[0] * shape[1]).reshape(shape).astype(np.float64)
+            percent[np.bincount(flat[known], minlength=shape[0] * shape[1]).reshape(shape) == 0] = np.nan
+        return cls(pd.DatetimeIndex(days, name="date"), nutrients, values, present, percent)
+
+    @property
+    def empty(self):
+        return self.totals.empty
+
+    def key_totals(self, names):
+        """Totals for `names` in that order, NaN for nutrients without data."""
+        return self.totals.reindex(names)
+
+    def macro_breakdown(self):
+        """Total calories split across protein/carbs/fat in proportion to their grams.
+
+        None without calorie or macro data; an empty frame when the macro grams sum to 0.
+        """
+        if 'Calories' not in self.totals.index or not self.totals.index.isin(MACROS).any():
+            return None
+        grams = self.totals.reindex(MACROS).fillna(0).to_numpy()
+        if grams.sum() <= 0:
+            return pd.DataFrame(columns=['Macro', 'Calories', 'Grams', 'Tooltip'])
+        calories = self.totals['Calories'] * grams / grams.sum()
+        frame = pd.DataFrame({'Macro': MACRO_LABELS, 'Calories': calories, 'Grams': grams})
+        frame['Tooltip'] = (frame['Macro'] + ': ' + frame['Grams'].map('{:.1f}'.format) + 'g ('
+                            + frame['Calories'].map('{:.0f}'.format) + ' kcal)')
+        return frame
+
+    def vitamin_breakdown(self):
+        """Non-zero vitamin totals with unit, %DV, short name and tooltip columns.
+
+        percent_dv is the range total as % of one day's Daily Value, so vitamins
+        measured in mg and mcg can share one chart.
+        """
+        vitamins = self.totals.reindex(VITAMINS).dropna()
+        vitamins = vitamins[vitamins > 0]
+        if vitamins.empty:
+            return pd.DataFrame(columns=['nutrient_name', 'amount', 'unit', 'percent_dv', 'vitamin_short', 'tooltip'])
+        frame = vitamins.rename_axis('nutrient_name').reset_index(name='amount')
+        table = nutrient_table(frame['nutrient_name'])
+        frame['unit'] = table['unit'].to_numpy()
+        frame['percent_dv'] = self.percent_total(frame['nutrient_name']).fillna(0).to_numpy()
+        frame['vitamin_short'] = frame['nutrient_name'].str.replace(' \\(.*\\)', '', regex=True)
+        frame['tooltip'] = (frame['vitamin_short'] + ': ' + frame['amount'].map('{:.2f}'.format) + ' ' + frame['unit']
+                            + ' (' + frame['percent_dv'].map('{:.0f}'.format) + '% DV)')
+        return frame
+
+    def percent_total(self, names):
+        """Summed %DV over the range for `names`: the stored values, or computed from amounts for sources without them."""
+        names = pd.Index(names)
+        if self.percent_totals is not None:
+            return self.percent_totals.reindex(names)
+        table = nutrient_table(names)
+        return self.totals.reindex(names) / table['daily_value'] * 100
+
+    def percent_daily_value(self):
+        """Average daily intake as % of the Daily Value, for nutrients that have one."""
+        names = [name for name in self.totals.index if name in DAILY_VALUES]
+        return (self.percent_total(names) / len(self.days)).dropna()
+
+    def daily_value_progress(self):
+        """percent_daily_value() as a chart frame in registry order: nutrient_name, percent_dv, tooltip."""
+        percent = self.percent_daily_value()
+        if percent.empty:
+            return pd.DataFrame(columns=['nutrient_name', 'percent_dv', 'tooltip'])
+        frame = percent.rename_axis('nutrient_name').reset_index(name='percent_dv')
+        frame['tooltip'] = frame['nutrient_name'] + ': ' + frame['percent_dv'].map('{:.0f}'.format) + '% of the Daily Value per day'
+        return frame
+
+    def trend(self, names):
+        """Long frame of (date, nutrient_name, amount) for `names`, only where data exists."""
+        columns = [self.columns[n] for n in names if n in self.columns]
+        if not columns:
+            return pd.DataFrame(columns=['date', 'nutrient_name', 'amount'])
+        present = self.present[:, columns]
+        day_index, column_index = np.nonzero(present)
+        return pd.DataFrame({'date': self.days[day_index],
+                             'nutrient_name': self.nutrients[np.asarray(columns)[column_index]],
+                             'amount': self.values[:, columns][present]})
+
+
+def vitamin_summary(vitamins):
+    """The "• Vitamin C: 12.00 mg (13% DV)" lines shown under the vitamin chart."""
+    return ("• " + vitamins['tooltip'] + "\n").str.cat()
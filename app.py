@@ -1,223 +1,87 @@
 # app.py - FINAL, TESTED, AND CORRECTED VERSION
 
 # --- 1. IMPORTS ---
-import os
-import io
-import re
-import json
-from datetime import datetime, timedelta
-import pandas as pd
-import altair as alt
+# Only what the Analyzer page and the sidebar need is imported here. pandas, altair and the dashboard
+# modules are imported by the functions that draw with them, and Gemini's SDK on the first model call,
+# so a cold start (first page view after the server starts) does not pay for them.
 from dotenv import load_dotenv
 import streamlit as st
-import streamlit.components.v1
-from PIL import Image
-import psycopg2
-import sqlalchemy
-from passlib.context import CryptContext
-import google.generativeai as genai
+from users import LoginThrottled, PasswordServiceBusy, create_user, authenticate_user, client_ip
+from meal_store import add_meal_entry, add_meal_entries
+from migrations import ensure_schema
+from analysis import input_prompt, analyze_image_stream
+from image_prep import prepare_image
+from near_duplicates import NEAR_DUPLICATES, image_hash, find_near_duplicate
+from batch_analysis import analyze_batch
+from jobs import ANALYSIS_QUEUE, JOB_POLL_INTERVAL, DONE, FAILED, submit_job, get_job
+from instrumentation import PROFILER, span, begin_profile, end_profile, format_profile, start_metrics_server
+from sessions import SESSION_TTL, issue_token, resume, revoke, load_state, save_state
 
 # --- 2. CONFIGURATION & INITIALIZATION ---
 load_dotenv()
 st.set_page_config(page_title="AI Nutrition Platform", page_icon="🔬", layout="wide")
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # --- 3. DATABASE & CORE FUNCTIONS ---
-DB_URL = os.getenv("DATABASE_URL")
-def get_db_connection():
-    return psycopg2.connect(DB_URL)
-
+# Connections come from the shared pool in db.py; close() hands them back. Accounts live in users.py.
 def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY, username VARCHAR(50) UNIQUE NOT NULL,
-            email VARCHAR(100) UNIQUE NOT NULL, password_hash VARCHAR(255) NOT NULL
-        );
-    """)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS meals (
-            id SERIAL PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users(id),
-            meal_title TEXT NOT NULL, analysis_text TEXT,
-            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS meal_nutrients (
-            id SERIAL PRIMARY KEY, meal_id INTEGER NOT NULL REFERENCES meals(id) ON DELETE CASCADE,
-            nutrient_name TEXT NOT NULL, amount NUMERIC(10, 3), unit VARCHAR(20),
-            percent_dv NUMERIC(6, 2)
-        );
-    """)
-    conn.commit()
-    cur.close()
-    conn.close()
-
-def hash_password(password: str) -> str: return pwd_context.hash(password)
-def verify_password(plain_password: str, hashed_password: str) -> bool: return pwd_context.verify(plain_password, hashed_password)
-
-def create_user(username, email, password):
-    hashed_password = hash_password(password)
-    try:
-        conn = get_db_connection(); cur = conn.cursor()
-        cur.execute("INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s);", (username, email, hashed_password))
-        conn.commit(); return True
-    except psycopg2.IntegrityError: return False
-    finally: cur.close(); conn.close()
-
-def authenticate_user(username, password):
-    try:
-        conn = get_db_connection(); cur = conn.cursor()
-        cur.execute("SELECT id, password_hash FROM users WHERE username = %s;", (username,))
-        result = cur.fetchone()
-        if result and verify_password(password, result[1]): return result[0]
-        return None
-    finally: cur.close(); conn.close()
-
-def add_meal_entry(user_id, meal_analysis):
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("INSERT INTO meals (user_id, meal_title, analysis_text, created_at) VALUES (%s, %s, %s, %s) RETURNING id;",
-                        (user_id, meal_analysis['title'], meal_analysis['full_text'], datetime.now()))
-            meal_id = cur.fetchone()[0]
-            for nutrient in meal_analysis['nutrients']:
-                cur.execute("INSERT INTO meal_nutrients (meal_id, nutrient_name, amount, unit, percent_dv) VALUES (%s, %s, %s, %s, %s);",
-                            (meal_id, nutrient.get('nutrient'), nutrient.get('amount'), nutrient.get('unit'), nutrient.get('percent_dv')))
-            conn.commit()
-    finally: conn.close()
-
-def get_user_data(user_id, start_date):
-    conn = get_db_connection()
-    query = """
-        SELECT m.id, m.meal_title, m.created_at, n.nutrient_name, n.amount, n.unit
-        FROM meals m JOIN meal_nutrients n ON m.id = n.meal_id
-        WHERE m.user_id = %s AND m.created_at >= %s ORDER BY m.created_at DESC;
-    """
-    # Use engine instead of raw connection for pandas
-    engine = sqlalchemy.create_engine(DB_URL)
-    df = pd.read_sql_query(query, engine, params=(user_id, start_date))
-    engine.dispose()
-    if not df.empty:
-        df['created_at'] = pd.to_datetime(df['created_at']).dt.tz_localize(None)
-    return df
-
-def clean_meal_title(title):
-    """Clean meal title by removing prefixes like '1. Meal Title:' or 'Meal Title:'"""
-    if not title:
-        return "Untitled Meal"
-    
-    # Remove common prefixes
-    cleaned = title.strip()
-    
-    # Remove numbered prefixes like "1. Meal Title:", "2. Meal Title:", etc.
-    import re
-    cleaned = re.sub(r'^\d+\.\s*Meal Title:\s*', '', cleaned, flags=re.IGNORECASE)
-    
-    # Remove "Meal Title:" prefix
-    cleaned = re.sub(r'^Meal Title:\s*', '', cleaned, flags=re.IGNORECASE)
-    
-    # Remove any remaining asterisks or markdown formatting
-    cleaned = cleaned.replace('**', '').replace('*', '')
-    
-    return cleaned.strip() if cleaned.strip() else "Untitled Meal"
-
-input_prompt="""
-You are a world-class food scientist AI. Your task is to perform a comprehensive nutritional analysis of the meal in the image. Your response MUST strictly follow this structure:
+    # Schema lives in migrations.py; this applies anything pending once per process.
+    ensure_schema()
 
-1.  **Meal Title:** A descriptive title. Format: `Meal Title: [Your Title]`
-
-2.  Provide a brief analysis with the following content (do not include section headers):
-    - **Advantages:** 2-3 health benefits of this food
-    - **Disadvantages:** 1-2 potential concerns or limitations
-    
-    ***Fun Fact:*** One interesting fact about this food (format this exactly as shown with triple asterisks for bold italic)
-
-3.  Provide the nutritional data as a valid JSON array of objects, enclosed in triple backticks (do not include any text before the JSON).
-    **CRITICAL RULE:** You MUST provide a value for EVERY nutrient in the list below. If the meal does not contain a nutrient or if data is unavailable, you MUST include it with an `amount` of 0. Do not omit any nutrient from this list.
-
-    ```json
-    [
-      {"nutrient": "Calories", "amount": ..., "unit": "kcal"},
-      {"nutrient": "Protein", "amount": ..., "unit": "g", "percent_dv": ...},
-      {"nutrient": "Total Fat", "amount": ..., "unit": "g", "percent_dv": ...},
-      {"nutrient": "Saturated Fat", "amount": ..., "unit": "g", "percent_dv": ...},
-      {"nutrient": "Trans Fat", "amount": ..., "unit": "g"},
-      {"nutrient": "Polyunsaturated Fat", "amount": ..., "unit": "g"},
-      {"nutrient": "Monounsaturated Fat", "amount": ..., "unit": "g"},
-      {"nutrient": "Cholesterol", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Carbohydrates", "amount": ..., "unit": "g", "percent_dv": ...},
-      {"nutrient": "Dietary Fiber", "amount": ..., "unit": "g", "percent_dv": ...},
-      {"nutrient": "Total Sugars", "amount": ..., "unit": "g"},
-      {"nutrient": "Added Sugars", "amount": ..., "unit": "g", "percent_dv": ...},
-      {"nutrient": "Sodium", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Potassium", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Calcium", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Iron", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Magnesium", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Phosphorus", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Zinc", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Copper", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Manganese", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Selenium", "amount": ..., "unit": "mcg", "percent_dv": ...},
-      {"nutrient": "Vitamin A", "amount": ..., "unit": "mcg", "percent_dv": ...},
-      {"nutrient": "Vitamin C", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Vitamin D", "amount": ..., "unit": "mcg", "percent_dv": ...},
-      {"nutrient": "Vitamin E", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Vitamin K", "amount": ..., "unit": "mcg", "percent_dv": ...},
-      {"nutrient": "Thiamin (B1)", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Riboflavin (B2)", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Niacin (B3)", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Vitamin B6", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Folate (B9)", "amount": ..., "unit": "mcg", "percent_dv": ...},
-      {"nutrient": "Vitamin B12", "amount": ..., "unit": "mcg", "percent_dv": ...}
-    ]
-    ```
-      {"nutrient": "Zinc", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Copper", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Manganese", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Selenium", "amount": ..., "unit": "mcg", "percent_dv": ...},
-      {"nutrient": "Vitamin A", "amount": ..., "unit": "mcg", "percent_dv": ...},
-      {"nutrient": "Vitamin C", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Vitamin D", "amount": ..., "unit": "mcg", "percent_dv": ...},
-      {"nutrient": "Vitamin E", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Vitamin K", "amount": ..., "unit": "mcg", "percent_dv": ...},
-      {"nutrient": "Thiamin (B1)", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Riboflavin (B2)", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Niacin (B3)", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Vitamin B6", "amount": ..., "unit": "mg", "percent_dv": ...},
-      {"nutrient": "Folate (B9)", "amount": ..., "unit": "mcg", "percent_dv": ...},
-      {"nutrient": "Vitamin B12", "amount": ..., "unit": "mcg", "percent_dv": ...}
-    ]
-    ```
-"""
-def parse_summary_from_response(response_text):
-    results = {}
-    title_match = re.search(r"Meal Title: (.*)", response_text, re.IGNORECASE)
-    if title_match:
-        results['title'] = title_match.group(1).strip()
-    else:
-        lines = response_text.split('\n')
-        first_meaningful_line = next((line for line in lines if line.strip()), "Untitled Meal")
-        results['title'] = first_meaningful_line.strip().replace('**', '')
-    results['full_text'] = response_text
-    json_match = re.search(r"```json\n([\s\S]*?)\n```", response_text)
-    if json_match:
-        try: results['nutrients'] = json.loads(json_match.group(1))
-        except json.JSONDecodeError: results['nutrients'] = []
-    else: results['nutrients'] = []
-    return results
-
-def get_gemini_response(image_data, prompt):
-    model = genai.GenerativeModel('gemini-2.5-flash'); return model.generate_content([image_data[0], prompt]).text
+def get_prepared_image(uploaded_file):
+    # Decode + downscale once per upload; reruns reuse it for both the API call and the preview
+    cached = st.session_state.get('prepared_image')
+    if cached and cached[0] == uploaded_file.file_id: return cached[1]
+    prepared = prepare_image(uploaded_file.getvalue())
+    st.session_state['prepared_image'] = (uploaded_file.file_id, prepared)
+    return prepared
 
 def setup_image_for_api(uploaded_file):
-    if uploaded_file: return [{"mime_type": uploaded_file.type, "data": uploaded_file.getvalue()}]
+    if uploaded_file: return get_prepared_image(uploaded_file).api_payload()
     raise FileNotFoundError("No file uploaded.")
 
+def request_ip():
+    # The browser's address for login throttling; behind a proxy it comes from X-Forwarded-For (users.client_ip)
+    return client_ip(st.context.ip_address, st.context.headers.get("X-Forwarded-For"))
+
+init_db()
+start_metrics_server()
+
 # --- SESSION STATE INITIALIZATION ---
+# st.session_state only exists in this process. The login lives in a signed token kept in a cookie, which any
+# replica can check when a new connection arrives (resume(): the HMAC plus one store read, so logout can revoke it),
+# and these keys are copied to the shared state store at the end of every rerun. Reruns on an existing connection
+# read neither the cookie nor the store.
+SHARED_SESSION_KEYS = ['page', 'current_analysis']
+SESSION_COOKIE = 'session'
+
+def start_session(user_id=None, username=None):
+    session, token = issue_token(user_id, username)
+    st.session_state.session_id = session.session_id; st.session_state.synced_state = None
+    st.session_state.pending_cookie = token    # written to the browser by sync_session at the end of the rerun
+
+def restore_session():
+    # First rerun of this connection: the session may have begun on another replica
+    st.query_params.pop('session', None)    # tokens used to travel in the URL; never keep or honour one there
+    session = resume(st.context.cookies.get(SESSION_COOKIE, ''))
+    if session is None: start_session(); return
+    st.session_state.session_id = session.session_id
+    st.session_state.logged_in, st.session_state.user_id, st.session_state.username = session.user_id is not None, session.user_id, session.username
+    st.session_state.update({key: value for key, value in load_state(session.session_id).items() if key in SHARED_SESSION_KEYS})
+
+def sync_session():
+    values = {key: st.session_state.get(key) for key in SHARED_SESSION_KEYS}
+    st.session_state.synced_state = save_state(st.session_state.session_id, values, st.session_state.get('synced_state'))
+    token = st.session_state.pop('pending_cookie', None)
+    if token: set_session_cookie(token)
+
+def set_session_cookie(token):
+    # Streamlit has no HTTP response to set a cookie on, so a script sets it (and it cannot be HttpOnly).
+    # The browser sends it with the next connection's handshake, where st.context.cookies reads it.
+    st.html(f"<script>document.cookie = '{SESSION_COOKIE}={token}; path=/; max-age={SESSION_TTL}; SameSite=Strict'"
+            " + (location.protocol === 'https:' ? '; Secure' : '');</script>", unsafe_allow_javascript=True)
+
+if 'session_id' not in st.session_state:
+    restore_session()
 if 'logged_in' not in st.session_state: 
     st.session_state.logged_in = False
 if 'user_id' not in st.session_state: 
@@ -230,10 +94,49 @@ if 'current_analysis' not in st.session_state:
     st.session_state.current_analysis = None
 
 # --- UI RENDERING FUNCTIONS ---
+def nutrient_frame(nutrients):
+    import pandas as pd
+    return pd.DataFrame(nutrients).fillna(0)
+
+def stream_analysis_into(slot, events):
+    # Show title, text and table as they stream in; the full results view below replaces this when done
+    title, text, nutrients = None, "", None
+    for kind, value in events:
+        if kind == 'done': return value
+        if kind == 'title': title = value
+        elif kind == 'text': text += value
+        elif kind == 'nutrients': nutrients = value
+        with slot.container():
+            st.caption("⏳ Live analysis...")
+            if title: st.markdown(f"### {title}")
+            if text.strip(): st.markdown(text)
+            if nutrients: st.dataframe(nutrient_frame(nutrients), width='stretch', height=300)
+
+def finish_analysis_job(analysis=None, error=None):
+    st.session_state.pop('analysis_job', None); st.query_params.pop('job', None)
+    st.session_state['current_analysis'] = analysis
+    if error: st.session_state['analysis_error'] = error
+
+@st.fragment(run_every=max(JOB_POLL_INTERVAL, 1.0))
+def poll_analysis_job(job_key):
+    # Only this fragment reruns while the job is pending; the whole page reruns once it is finished
+    job = get_job(job_key)
+    if job is None:
+        finish_analysis_job(error="The analysis job could not be found. Please analyze the meal again."); st.rerun()
+    elif job['status'] in (DONE, FAILED):
+        finish_analysis_job(job['result'], job['error']); st.rerun()
+    elif job['status'] == 'queued':
+        st.info(f"⏳ Your meal is queued for analysis ({job['ahead']} ahead of it). You can refresh or leave this page; the analysis continues.")
+    else:
+        st.info("🔬 Performing deep nutritional analysis... You can refresh or leave this page; the analysis continues.")
+
 def render_analyzer_page():
     st.title("AI Nutrition Analyzer")
     st.markdown("Upload a picture of your meal for a complete A-to-Z nutritional breakdown.")
     
+    if st.toggle("📚 Batch mode - analyze several meals at once"):
+        render_batch_analyzer(); return
+    
     # Create two columns for layout
     col1, col2 = st.columns([1, 1])
     
@@ -242,30 +145,59 @@ def render_analyzer_page():
         st.info("💡 **How it works:** Upload a photo of your meal and click 'Analyze' to get detailed nutritional information powered by AI.")
         uploaded_file = st.file_uploader("Upload Your Meal Image...", type=["jpg", "jpeg", "png"])
         
-        if st.button("Analyze Meal", type="primary"):
+        # "Re-analyze anyway" (below the results) asks for the model call by setting 'reanalyze' and rerunning
+        reanalyze = st.session_state.pop('reanalyze', False)
+        if st.button("Analyze Meal", type="primary") or reanalyze:
+            st.session_state.pop('near_duplicate', None); match = None
             if uploaded_file:
+                st.session_state['analysis_image_hash'] = image_hash(get_prepared_image(uploaded_file).image)
+                if st.session_state['logged_in'] and NEAR_DUPLICATES == 'on' and not reanalyze:
+                    match = find_near_duplicate(st.session_state['user_id'], st.session_state['analysis_image_hash'])
+            if match:
+                # A photo of a meal this user already saved: reuse its analysis instead of a model call
+                st.session_state['near_duplicate'] = match; st.session_state['current_analysis'] = match['analysis']
+            elif uploaded_file and ANALYSIS_QUEUE == 'on':
+                # Queue it for the workers (jobs.py); the key in the URL survives a page refresh
+                try:
+                    job_key = submit_job(setup_image_for_api(uploaded_file), input_prompt, st.session_state['user_id'])
+                    st.session_state['analysis_job'] = job_key; st.query_params['job'] = job_key
+                    st.session_state['current_analysis'] = None
+                except Exception as e:
+                    st.error(f"An error occurred: {e}")
+            elif uploaded_file:
+                live = st.empty()
                 with st.spinner("Performing deep nutritional analysis... This may take a moment."):
                     try:
                         image_api_data = setup_image_for_api(uploaded_file)
-                        response_text = get_gemini_response(image_api_data, input_prompt)
-                        st.session_state['current_analysis'] = parse_summary_from_response(response_text)
+                        with span("analyzer.analyze"):
+                            st.session_state['current_analysis'] = stream_analysis_into(live, analyze_image_stream(image_api_data, input_prompt))
                     except Exception as e:
                         st.error(f"An error occurred: {e}"); st.session_state['current_analysis'] = None
+                live.empty()
             else: st.warning("Please upload an image first.")
     
     with col2:
         # Display the uploaded image on the right side in medium size
         if uploaded_file is not None:
-            image = Image.open(uploaded_file)
-            st.image(image, caption="Your Meal Image", width=350)
+            st.image(get_prepared_image(uploaded_file).preview, caption="Your Meal Image", width=350)
         else:
             st.info("Upload an image to see preview here")
+    job_key = st.session_state.get('analysis_job') or st.query_params.get('job')
+    if job_key:
+        poll_analysis_job(job_key)
+    if 'analysis_error' in st.session_state:
+        st.error(f"An error occurred: {st.session_state.pop('analysis_error')}")
     if st.session_state['current_analysis']:
         st.divider()
         st.subheader("🍽️ Analysis Results")
         st.info("🤖 **AI Analysis:** Below you'll find the meal identification, nutritional breakdown, and complete vitamin/mineral profile detected from your image.")
         
         analysis = st.session_state['current_analysis']
+        match = st.session_state.get('near_duplicate')
+        if match:
+            st.info(f"♻️ This looks like a meal you saved on {match['created_at']:%B %d, %Y}, so its analysis is shown instead of analyzing the photo again.")
+            if st.button("🔄 Re-analyze anyway"):
+                st.session_state['reanalyze'] = True; st.rerun()
         st.markdown(f"### {analysis.get('title')}")
         
         # Display the brief analysis text
@@ -279,34 +211,80 @@ def render_analyzer_page():
                 st.markdown(cleaned_text)
 
         if analysis['nutrients']:
-            df = pd.DataFrame(analysis['nutrients']).fillna(0)
+            df = nutrient_frame(analysis['nutrients'])
             st.markdown("#### 📊 Complete Nutritional Profile")
             st.dataframe(df, width='stretch', height=500)
             
         if st.session_state['logged_in']:
             if st.button("Save to My Dashboard"):
-                add_meal_entry(st.session_state['user_id'], analysis)
+                add_meal_entry(st.session_state['user_id'], {**analysis, 'image_hash': st.session_state.get('analysis_image_hash')})
                 st.success(f"'{analysis.get('title')}' saved!"); st.session_state['current_analysis'] = None
+                st.session_state.pop('near_duplicate', None)
+
+def render_batch_result(name, preview, analysis, error=None):
+    col1, col2 = st.columns([1, 4])
+    with col1:
+        if preview is not None: st.image(preview, width=120)
+    with col2:
+        if error is not None:
+            st.error(f"❌ **{name}:** {error}"); return
+        calories = next((n.get('amount') for n in analysis['nutrients'] if n.get('nutrient') == 'Calories'), None)
+        st.markdown(f"**{analysis.get('title')}**" + (f" — {calories} kcal" if calories is not None else ""))
+        st.caption(name)
+        if analysis['nutrients']:
+            with st.expander("📊 Nutritional Profile"):
+                st.dataframe(nutrient_frame(analysis['nutrients']), width='stretch')
+
+def render_batch_analyzer():
+    st.markdown("### 📤 Batch Upload & Analysis")
+    st.info("💡 **How it works:** Upload all of your meal photos, analyze them together, and save the whole day in one click. Results appear as soon as each meal is done.")
+    uploaded_files = st.file_uploader("Upload Your Meal Images...", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
+    
+    if st.button("Analyze All Meals", type="primary"):
+        if uploaded_files:
+            st.session_state['batch_results'] = None
+            progress = st.progress(0.0, text="Analyzing meals...")
+            slots = [st.empty() for _ in uploaded_files]
+            for slot, uploaded in zip(slots, uploaded_files):
+                slot.info(f"⏳ {uploaded.name}: waiting for analysis...")
+            results = [None] * len(uploaded_files)
+            # Results stream into their slots as each concurrent model call finishes
+            for done, result in enumerate(analyze_batch([f.getvalue() for f in uploaded_files], input_prompt), start=1):
+                name = uploaded_files[result.index].name
+                preview = result.prepared.preview if result.prepared else None
+                analysis = {**result.analysis, 'image_hash': image_hash(result.prepared.image)} if result.analysis else None
+                results[result.index] = (name, preview, analysis, result.error)
+                with slots[result.index].container():
+                    render_batch_result(name, preview, analysis, result.error)
+                progress.progress(done / len(uploaded_files), text=f"Analyzed {done} of {len(uploaded_files)} meals")
+            st.session_state['batch_results'] = results
+        else: st.warning("Please upload at least one image first.")
+    elif st.session_state.get('batch_results'):
+        for name, preview, analysis, error in st.session_state['batch_results']:
+            render_batch_result(name, preview, analysis, error)
+    
+    successful = [analysis for _, _, analysis, error in st.session_state.get('batch_results') or [] if error is None]
+    if successful and st.session_state['logged_in']:
+        if st.button(f"Save All {len(successful)} Meals to My Dashboard"):
+            add_meal_entries(st.session_state['user_id'], successful)
+            st.success(f"{len(successful)} meals saved!"); st.session_state['batch_results'] = None
 
 def render_dashboard_page():
+    import altair as alt
+    from dashboard_cache import TIME_RANGES, range_start, get_dashboard_data, meal_page
+    from analytics import vitamin_summary
+    from nutrients import NUTRIENT_UNITS
+    from export import FORMATS, available_formats, export_file
+
     st.title(f"Nutrition Dashboard for {st.session_state['username']}")
     
-    time_options = {
-        "Last Day": timedelta(days=1), "Last 7 Days": timedelta(days=7),
-        "Last 15 Days": timedelta(days=15), "Last 30 Days": timedelta(days=30),
-        "Last 3 Months": timedelta(days=90), "Last 6 Months": timedelta(days=180),
-        "Last 12 Months": timedelta(days=365), "All Time": None
-    }
-    selected_range_key = st.selectbox("Select Time Range", options=list(time_options.keys()), index=1)
-    
-    if time_options[selected_range_key]:
-        start_date = datetime.now().date() - time_options[selected_range_key]
-    else:
-        start_date = datetime(1970, 1, 1).date()
+    selected_range_key = st.selectbox("Select Time Range", options=list(TIME_RANGES.keys()), index=1)
+    start_date = range_start(selected_range_key)
 
-    df = get_user_data(st.session_state['user_id'], start_date)
+    data = get_dashboard_data(st.session_state['user_id'], start_date)
+    totals = data.totals
 
-    if df.empty:
+    if totals.empty:
         st.info("No data found for this period. Analyze and save a meal to get started!"); return
 
     st.subheader(f"Data for: {selected_range_key}")
@@ -314,199 +292,125 @@ def render_dashboard_page():
     
     col1, col2 = st.columns(2)
     
-    with col1:
+    with col1, span("dashboard.macros"):
         st.markdown("#### 🍞 Macronutrient Distribution")
         st.caption("💡 Shows how your calories are distributed across protein, carbs, and fats as percentages.")
-        # Get actual calories from database - this is the source of truth
-        calories_df = df[df['nutrient_name'] == 'Calories']
-        macros = ['Protein', 'Total Fat', 'Carbohydrates']
-        macros_df = df[df['nutrient_name'].isin(macros)]
-        
-        if not macros_df.empty and not calories_df.empty:
-            # Use database values directly - no manual calculation
-            macro_totals_grams = macros_df.groupby('nutrient_name')['amount'].sum()
-            total_db_calories = calories_df['amount'].sum()
-            
-            protein_grams = macro_totals_grams.get('Protein', 0)
-            carbs_grams = macro_totals_grams.get('Carbohydrates', 0)
-            fat_grams = macro_totals_grams.get('Total Fat', 0)
-            
-            # Calculate proportional calories based on database total
-            total_macro_grams = protein_grams + carbs_grams + fat_grams
-            
-            if total_macro_grams > 0:
-                # Distribute database calories proportionally based on gram ratios
-                protein_ratio = protein_grams / total_macro_grams
-                carbs_ratio = carbs_grams / total_macro_grams  
-                fat_ratio = fat_grams / total_macro_grams
-                
-                protein_calories = total_db_calories * protein_ratio
-                carbs_calories = total_db_calories * carbs_ratio
-                fat_calories = total_db_calories * fat_ratio
-                
-                pie_data = pd.DataFrame({
-                    'Macro': ['Protein', 'Carbohydrates', 'Fat'], 
-                    'Calories': [protein_calories, carbs_calories, fat_calories],
-                    'Grams': [protein_grams, carbs_grams, fat_grams],
-                    'Tooltip': [
-                        f'Protein: {protein_grams:.1f}g ({protein_calories:.0f} kcal)',
-                        f'Carbohydrates: {carbs_grams:.1f}g ({carbs_calories:.0f} kcal)',
-                        f'Fat: {fat_grams:.1f}g ({fat_calories:.0f} kcal)'
-                    ]
-                })
-                pie_chart = alt.Chart(pie_data).mark_arc(innerRadius=50, outerRadius=100).encode(
-                    theta=alt.Theta(field="Calories", type="quantitative", stack=True),
-                    color=alt.Color(field="Macro", type="nominal", legend=alt.Legend(title="Macronutrient")),
-                    tooltip=['Tooltip:N']
-                ).properties(title=f"Macronutrient Breakdown (Total: {total_db_calories:.0f} kcal)")
-                st.altair_chart(pie_chart, use_container_width=True)
-            else: 
-                st.info("No macronutrient gram data available for proportional distribution.")
-        else: 
+        # Calories come from the database and are split in proportion to macro grams
+        if data.macros is None:
             st.info("No calorie or macronutrient data for this period.")
+        elif data.macros.empty:
+            st.info("No macronutrient gram data available for proportional distribution.")
+        else:
+            pie_chart = alt.Chart(data.macros).mark_arc(innerRadius=50, outerRadius=100).encode(
+                theta=alt.Theta(field="Calories", type="quantitative", stack=True),
+                color=alt.Color(field="Macro", type="nominal", legend=alt.Legend(title="Macronutrient")),
+                tooltip=['Tooltip:N']
+            ).properties(title=f"Macronutrient Breakdown (Total: {totals['Calories']:.0f} kcal)")
+            st.altair_chart(pie_chart, use_container_width=True)
 
-    with col2:
+    with col2, span("dashboard.vitamins"):
         st.markdown("#### 🍊 Vitamins Breakdown")
-        st.caption("💡 Displays the distribution of essential vitamins you've consumed from your meals.")
-        vitamins = ['Vitamin A', 'Vitamin C', 'Vitamin D', 'Vitamin E', 'Vitamin K', 
-                   'Thiamin (B1)', 'Riboflavin (B2)', 'Niacin (B3)', 'Vitamin B6', 
-                   'Folate (B9)', 'Vitamin B12']
-        vitamins_df = df[df['nutrient_name'].isin(vitamins)]
+        st.caption("💡 Displays the distribution of essential vitamins you've consumed, each weighted by its % Daily Value so mg and mcg compare fairly.")
+        vitamin_totals = data.vitamins
         
-        if not vitamins_df.empty:
-            vitamin_totals = vitamins_df.groupby('nutrient_name')['amount'].sum().reset_index()
-            # Filter out vitamins with zero values for cleaner chart
-            vitamin_totals = vitamin_totals[vitamin_totals['amount'] > 0]
+        if not vitamin_totals.empty:
+            vitamin_pie_chart = alt.Chart(vitamin_totals).mark_arc(innerRadius=50, outerRadius=100).encode(
+                theta=alt.Theta(field="percent_dv", type="quantitative", stack=True),
+                color=alt.Color(field="vitamin_short", type="nominal", legend=alt.Legend(title="Vitamin Type")),
+                tooltip=['tooltip:N']
+            ).properties(title="Vitamin Intake Distribution")
+            st.altair_chart(vitamin_pie_chart, use_container_width=True)
             
-            if not vitamin_totals.empty:
-                # Add proper units and create detailed tooltips
-                def get_vitamin_unit(vitamin_name):
-                    if vitamin_name in ['Vitamin A', 'Vitamin D', 'Vitamin K', 'Folate (B9)', 'Vitamin B12']:
-                        return 'mcg'
-                    else:
-                        return 'mg'
-                
-                vitamin_totals['unit'] = vitamin_totals['nutrient_name'].apply(get_vitamin_unit)
-                vitamin_totals['vitamin_short'] = vitamin_totals['nutrient_name'].str.replace(' \\(.*\\)', '', regex=True)
-                vitamin_totals['tooltip'] = vitamin_totals.apply(
-                    lambda row: f"{row['vitamin_short']}: {row['amount']:.2f} {row['unit']}", axis=1
-                )
-                
-                vitamin_pie_chart = alt.Chart(vitamin_totals).mark_arc(innerRadius=50, outerRadius=100).encode(
-                    theta=alt.Theta(field="amount", type="quantitative", stack=True),
-                    color=alt.Color(field="vitamin_short", type="nominal", legend=alt.Legend(title="Vitamin Type")),
-                    tooltip=['tooltip:N']
-                ).properties(title="Vitamin Intake Distribution")
-                st.altair_chart(vitamin_pie_chart, use_container_width=True)
-                
-                # Show vitamin summary with units
-                st.markdown("**Vitamin Summary:**")
-                vitamin_summary = ""
-                for _, row in vitamin_totals.iterrows():
-                    vitamin_summary += f"• {row['vitamin_short']}: {row['amount']:.2f} {row['unit']}\n"
-                st.text(vitamin_summary)
-                
-            else: st.info("No vitamin data available for this period.")
-        else: st.info("No vitamin data for this period.")
+            # Show vitamin summary with units
+            st.markdown("**Vitamin Summary:**")
+            st.text(vitamin_summary(vitamin_totals))
+        else: st.info("No vitamin data available for this period.")
     
     # Move the key nutrient totals to a new row
     st.markdown("#### 🔢 Key Nutrient Totals")
     st.caption("💡 Your total intake of essential nutrients over the selected time period.")
-    col3, col4, col5 = st.columns(3)
-    with col3:
-        key_nutrients = ['Calories', 'Protein']
-        key_nutrients_df = df[df['nutrient_name'].isin(key_nutrients)]
-        
-        if not key_nutrients_df.empty:
-            totals = key_nutrients_df.groupby('nutrient_name')['amount'].sum().reindex(key_nutrients).reset_index()
-            for index, row in totals.iterrows():
-                nutrient_name = row['nutrient_name']; total_amount = row['amount']
-                if pd.notna(total_amount):
-                    if nutrient_name == 'Calories': st.metric(f"Total {nutrient_name}", f"{total_amount:.0f} kcal")
-                    else: st.metric(f"Total {nutrient_name}", f"{total_amount:.0f} g")
-        else: st.info("No key nutrient data for this period.")
-    
-    with col4:
-        key_nutrients2 = ['Total Fat', 'Carbohydrates']
-        key_nutrients_df2 = df[df['nutrient_name'].isin(key_nutrients2)]
-        
-        if not key_nutrients_df2.empty:
-            totals2 = key_nutrients_df2.groupby('nutrient_name')['amount'].sum().reindex(key_nutrients2).reset_index()
-            for index, row in totals2.iterrows():
-                nutrient_name = row['nutrient_name']; total_amount = row['amount']
-                if pd.notna(total_amount):
-                    st.metric(f"Total {nutrient_name}", f"{total_amount:.0f} g")
-    
-    with col5:
-        key_nutrients3 = ['Dietary Fiber', 'Sodium']
-        key_nutrients_df3 = df[df['nutrient_name'].isin(key_nutrients3)]
-        
-        if not key_nutrients_df3.empty:
-            totals3 = key_nutrients_df3.groupby('nutrient_name')['amount'].sum().reindex(key_nutrients3).reset_index()
-            for index, row in totals3.iterrows():
-                nutrient_name = row['nutrient_name']; total_amount = row['amount']
-                if pd.notna(total_amount):
-                    if nutrient_name == 'Sodium': st.metric(f"Total {nutrient_name}", f"{total_amount:.0f} mg")
-                    else: st.metric(f"Total {nutrient_name}", f"{total_amount:.0f} g")
+    key_columns = [['Calories', 'Protein'], ['Total Fat', 'Carbohydrates'], ['Dietary Fiber', 'Sodium']]
+    for column, key_nutrients in zip(st.columns(3), key_columns):
+        with column, span("dashboard.key_totals"):
+            key_totals = data.matrix.key_totals(key_nutrients).dropna()
+            for nutrient_name, total_amount in key_totals.items():
+                st.metric(f"Total {nutrient_name}", f"{total_amount:.0f} {NUTRIENT_UNITS[nutrient_name]}")
+            if key_totals.empty and key_nutrients == key_columns[0]: st.info("No key nutrient data for this period.")
+
+    st.markdown("#### 🎯 Daily Value Progress")
+    st.caption("💡 Your average daily intake of each nutrient as a percentage of its Daily Value; the line marks 100%.")
+    with span("dashboard.progress"):
+        # %DVs were computed when each meal was saved and summed per day by the rollup
+        if not data.progress.empty:
+            bars = alt.Chart(data.progress).mark_bar().encode(
+                x=alt.X('percent_dv:Q', title='% Daily Value per day'),
+                y=alt.Y('nutrient_name:N', title=None, sort=None),
+                color=alt.condition(alt.datum.percent_dv >= 100, alt.value('#4caf50'), alt.value('#4a90e2')),
+                tooltip=['tooltip:N'])
+            goal = alt.Chart(alt.Data(values=[{'goal': 100}])).mark_rule(color='#ff6b35', strokeDash=[4, 4]).encode(x='goal:Q')
+            st.altair_chart(bars + goal, use_container_width=True)
+        else: st.info("No Daily Value data for this period.")
 
     st.divider()
     
     st.subheader("📅 Recent Meals History")
     st.info("🍽️ **Meal History:** All the meals you've analyzed and saved are listed below with dates and times.")
     
-    # Get unique meals with their details
-    meals_query = """
-        SELECT DISTINCT m.id, m.meal_title, m.created_at
-        FROM meals m
-        WHERE m.user_id = %s AND m.created_at >= %s 
-        ORDER BY m.created_at DESC;
-    """
-    
-    # Use engine instead of raw connection for pandas
-    engine = sqlalchemy.create_engine(DB_URL)
-    meals_df = pd.read_sql_query(meals_query, engine, params=(st.session_state['user_id'], start_date))
-    engine.dispose()
+    # The first page comes with the cached dashboard data; later pages are fetched by keyset cursor on demand
+    history_key = (st.session_state['user_id'], start_date, data.version)
+    history = st.session_state.get('meal_history')
+    if not history or history['key'] != history_key:
+        history = st.session_state['meal_history'] = {'key': history_key, 'pages': [data.meals], 'cursor': data.meals_cursor}
     
-    if not meals_df.empty:
-        # Format the datetime for better display
-        meals_df['created_at'] = pd.to_datetime(meals_df['created_at'])
-        meals_df['Date'] = meals_df['created_at'].dt.strftime('%Y-%m-%d')
-        meals_df['Time'] = meals_df['created_at'].dt.strftime('%H:%M')
-        
-        # Display meals in a nice format
-        for index, meal in meals_df.iterrows():
-            with st.container():
-                col1, col2, col3 = st.columns([3, 1, 1])
-                with col1:
-                    clean_title = clean_meal_title(meal['meal_title'])
-                    st.write(f"🍽️ **{clean_title}**")
-                with col2:
-                    st.write(f"📅 {meal['Date']}")
-                with col3:
-                    st.write(f"⏰ {meal['Time']}")
-                st.divider()
-    else:
-        st.info("No meals saved in this time period. Start analyzing meals to build your history!")
+    with span("dashboard.history"):
+        if not data.meals.empty:
+            for page in history['pages']:
+                for meal in page.itertuples():
+                    with st.container():
+                        col1, col2, col3 = st.columns([3, 1, 1])
+                        with col1: st.write(f"🍽️ **{meal.meal_title}**")
+                        with col2: st.write(f"📅 {meal.Date}")
+                        with col3: st.write(f"⏰ {meal.Time}")
+                        st.divider()
+            if history['cursor'] is not None and st.button("Load more meals"):
+                page, history['cursor'] = meal_page(st.session_state['user_id'], start_date, history['cursor'])
+                history['pages'].append(page); st.rerun()
+        else:
+            st.info("No meals saved in this time period. Start analyzing meals to build your history!")
 
     st.divider()
     
     st.subheader("📈 Nutrient Intake Over Time")
     st.info("📉 **Trend Analysis:** Select nutrients below to see how your daily intake changes over time. Great for tracking consistency!")
-    all_nutrients = sorted(df['nutrient_name'].unique())
+    all_nutrients = sorted(totals.index)
     
     selected_nutrients = st.multiselect("Select nutrients to chart:", all_nutrients, default=['Calories', 'Protein'])
     
-    if selected_nutrients:
-        chart_df = df[df['nutrient_name'].isin(selected_nutrients)].copy()  # Use .copy() to avoid warning
-        chart_df['date'] = chart_df['created_at'].dt.date
-        daily_chart_df = chart_df.groupby(['date', 'nutrient_name'])['amount'].sum().reset_index()
-        chart = alt.Chart(daily_chart_df).mark_line(point=True).encode(
-            x=alt.X('date:T', title='Date'), y=alt.Y('amount:Q', title='Total Daily Amount'),
-            color='nutrient_name:N', tooltip=['date', 'nutrient_name', 'amount']
-        ).interactive()
-        st.altair_chart(chart, use_container_width=True)
+    with span("dashboard.trend"):
+        if selected_nutrients:
+            # Daily sums come straight from the (day x nutrient) matrix
+            daily_chart_df = data.matrix.trend(selected_nutrients)
+            chart = alt.Chart(daily_chart_df).mark_line(point=True).encode(
+                x=alt.X('date:T', title='Date'), y=alt.Y('amount:Q', title='Total Daily Amount'),
+                color='nutrient_name:N', tooltip=['date', 'nutrient_name', 'amount']
+            ).interactive()
+            st.altair_chart(chart, use_container_width=True)
+
+    st.divider()
+
+    st.subheader("📤 Export My History")
+    st.caption(f"💡 Every saved meal and nutrient in {selected_range_key.lower()}, one row per nutrient.")
+    fmt = st.radio("Format", available_formats(), format_func=str.upper, horizontal=True)
+    user_id = st.session_state['user_id']
+    # The callable runs only on click, off the script thread; the export streams into a temp file,
+    # which Streamlit then reads into memory once to serve
+    st.download_button("⬇️ Download", data=lambda: export_file(user_id, fmt, start_date), on_click="ignore",
+                       file_name=f"nutrition_history_{start_date:%Y%m%d}.{FORMATS[fmt][1]}", mime=FORMATS[fmt][0])
 
 # --- SIDEBAR & PAGE ROUTING ---
+# Spans opened during this rerun go into a tree only while the profiler switch is on for this session
+profile_root = begin_profile(PROFILER == 'on' and st.session_state.get('profiling', False))
+
 with st.sidebar:
     st.markdown("""
     <div style='text-align: center; padding: 20px;'>
@@ -533,9 +437,10 @@ with st.sidebar:
         st.markdown("---")
         
         if st.button("🚪 Logout", width='stretch', type="secondary"):
-            for key in ['logged_in', 'user_id', 'username', 'current_analysis']: 
+            for key in ['logged_in', 'user_id', 'username', 'current_analysis', 'prepared_image', 'batch_results', 'meal_history', 'analysis_job', 'near_duplicate', 'analysis_image_hash']: 
                 st.session_state.pop(key, None)
             st.session_state.page = 'Analyzer'
+            revoke(st.session_state.session_id); start_session()
             st.rerun()
     else:
         st.markdown("""
@@ -575,15 +480,20 @@ with st.sidebar:
             
             if login_btn:
                 if username and password:
-                    user_id = authenticate_user(username, password)
-                    if user_id:
-                        st.session_state.logged_in = True
-                        st.session_state.user_id = user_id
-                        st.session_state.username = username
-                        st.success("✅ Login successful!")
-                        st.rerun()
-                    else: 
-                        st.error("❌ Invalid username or password")
+                    try:
+                        user_id = authenticate_user(username, password, request_ip())
+                    except (LoginThrottled, PasswordServiceBusy) as e:
+                        st.error(f"⏳ {e}")
+                    else:
+                        if user_id:
+                            st.session_state.logged_in = True
+                            st.session_state.user_id = user_id
+                            st.session_state.username = username
+                            revoke(st.session_state.session_id); start_session(user_id, username)
+                            st.success("✅ Login successful!")
+                            st.rerun()
+                        else: 
+                            st.error("❌ Invalid username or password")
                 else:
                     st.warning("⚠️ Please fill in both fields")
         
@@ -606,28 +516,36 @@ with st.sidebar:
                         elif '@' not in email:
                             st.error("❌ Please enter a valid email address")
                         else:
-                            if create_user(username, email, password): 
-                                st.success("🎉 Account created successfully! Please log in above.")
-                                st.balloons()
-                            else: 
-                                st.error("❌ Username or email already exists. Try different ones.")
+                            try:
+                                created = create_user(username, email, password, request_ip())
+                            except (LoginThrottled, PasswordServiceBusy) as e:
+                                st.error(f"⏳ {e}")
+                            else:
+                                if created: 
+                                    st.success("🎉 Account created successfully! Please log in above.")
+                                    st.balloons()
+                                else: 
+                                    st.error("❌ Username or email already exists. Try different ones.")
                     else:
                         st.warning("⚠️ Please fill in all fields")
 
+    if PROFILER == 'on': st.toggle("🧪 Profile this page", key='profiling')
+
     # Add the "Made with ❤️ by Rohan and Nithin" text at the bottom of the sidebar
     st.markdown("---")
     st.markdown("<div style='text-align: center; padding: 10px;'>\n                <p style='color: #888; font-size: 12px;'>Made with ❤️ by Rohan and Nithin</p>\n                </div>", unsafe_allow_html=True)
 
 if st.session_state.page == 'Analyzer':
-    render_analyzer_page()
+    with span("page.analyzer"): render_analyzer_page()
 elif st.session_state.page == 'Dashboard':
     if st.session_state.logged_in:
-        render_dashboard_page()
+        with span("page.dashboard"): render_dashboard_page()
     else:
         st.error("You must be logged in to view the dashboard.")
-        render_analyzer_page()
+        with span("page.analyzer"): render_analyzer_page()
+
+sync_session()
 
-# --- One-time DB setup ---
-# if __name__ == '__main__':
-#     init_db()
-#     print("Database initialized with professional, normalized schema.")
\ No newline at end of file
+if end_profile(profile_root) is not None:
+    with st.sidebar.expander("🧪 Profile of this rerun", expanded=True):
+        st.code(format_profile(profile_root))
@@ -0,0 +1,61 @@
+# batch_analysis.py - analyse many meal photos concurrently
+
+# Model calls are network-bound, so a bounded thread pool gives near-linear
+# speed-up until the upstream rate limit. The pool is shared by every session
+# in the process, which caps total concurrent calls at ANALYSIS_CONCURRENCY
+# no matter how many users start a batch at once.
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from analysis import analyze_image
+from image_prep import prepare_image
+
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "4"))
+ANALYSIS_TIMEOUT = float(os.getenv("ANALYSIS_TIMEOUT", "60"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=ANALYSIS_CONCURRENCY, thread_name_prefix="analysis")
+    return _executor
+
+
+class BatchResult:
+    def __init__(self, index, prepared=None, analysis=None, error=None):
+        self.index = index          # position in the submitted list
+        self.prepared = prepared    # PreparedImage (preview + bytes sent)
+        self.analysis = analysis    # parsed summary, or None on failure
+        self.error = error          # exception raised for this image, if any
+
+
+def _analyze_one(index, raw_bytes, prompt, model, timeout):
+    prepared = None
+    try:
+        prepared = prepare_image(raw_bytes)
+        return BatchResult(index, prepared, analyze_image(prepared.api_payload(), prompt, model=model, timeout=timeout))
+    except Exception as e:
+        return BatchResult(index, prepared, error=e)
+
+
+def analyze_batch(images, prompt, model=None, timeout=ANALYSIS_TIMEOUT, executor=None):
+    """Analyse raw image bytes concurrently, yielding a BatchResult as each one finishes.
+
+    Failures are reported per image instead of aborting the batch. If the caller
+    stops iterating early, images that have not started yet are cancelled.
+    """
+    executor = executor or get_executor()
+    futures = [executor.submit(_analyze_one, i, raw, prompt, model, timeout) for i, raw in enumerate(images)]
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
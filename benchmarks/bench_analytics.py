@@ -0,0 +1,132 @@
+# benchmarks/bench_analytics.py - dashboard data prep: per-metric pandas passes vs NutrientMatrix
+#
+# Generates N raw (created_at, nutrient_name, amount) rows and prepares
+# everything the dashboard renders (macro pie, vitamin table + summary, key
+# totals, nutrient list, Calories/Protein trend) two ways: with the original
+# dashboard code (an isin/groupby pass per metric, apply(axis=1), iterrows) and
+# with analytics.NutrientMatrix (one pivot, then column reductions). It checks
+# that both produce the same numbers and reports the median prep time per size,
+# plus the cost of just the trend step, which is all a multiselect change redoes.
+# No DB or network needed.
+#
+# Usage: python benchmarks/bench_analytics.py [rows ...]
+
+import sys
+import time
+import statistics
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+import numpy as np
+import pandas as pd
+
+from analytics import NutrientMatrix, vitamin_summary
+from nutrients import NUTRIENT_NAMES
+
+VITAMINS = ['Vitamin A', 'Vitamin C', 'Vitamin D', 'Vitamin E', 'Vitamin K', 'Thiamin (B1)', 'Riboflavin (B2)',
+            'Niacin (B3)', 'Vitamin B6', 'Folate (B9)', 'Vitamin B12']
+KEY_NUTRIENTS = [['Calories', 'Protein'], ['Total Fat', 'Carbohydrates'], ['Dietary Fiber', 'Sodium']]
+TREND = ['Calories', 'Protein']
+
+
+def synthetic_rows(rows, seed=0):
+    """Three meals a day, every nutrient per meal, like meal_nutrients joined to meals."""
+    rng = np.random.default_rng(seed)
+    meals = -(-rows // len(NUTRIENT_NAMES))
+    created_at = pd.Timestamp("2020-01-01") + pd.to_timedelta(np.arange(meals) * 8, unit="h")
+    return pd.DataFrame({"created_at": np.repeat(created_at, len(NUTRIENT_NAMES))[:rows],
+                         "nutrient_name": np.tile(NUTRIENT_NAMES, meals)[:rows],
+                         "amount": rng.uniform(0, 500, meals * len(NUTRIENT_NAMES))[:rows]})
+
+
+def legacy_prep(df):
+    """The original dashboard code, minus the Streamlit calls."""
+    out = {}
+    calories_df = df[df['nutrient_name'] == 'Calories']
+    macros_df = df[df['nutrient_name'].isin(['Protein', 'Total Fat', 'Carbohydrates'])]
+    macro_totals_grams = macros_df.groupby('nutrient_name')['amount'].sum()
+    total_db_calories = calories_df['amount'].sum()
+    grams = [macro_totals_grams.get('Protein', 0), macro_totals_grams.get('Carbohydrates', 0), macro_totals_grams.get('Total Fat', 0)]
+    calories = [total_db_calories * g / sum(grams) for g in grams]
+    out['macros'] = pd.DataFrame({'Macro': ['Protein', 'Carbohydrates', 'Fat'], 'Calories': calories, 'Grams': grams,
+                                  'Tooltip': [f'Protein: {grams[0]:.1f}g ({calories[0]:.0f} kcal)',
+                                              f'Carbohydrates: {grams[1]:.1f}g ({calories[1]:.0f} kcal)',
+                                              f'Fat: {grams[2]:.1f}g ({calories[2]:.0f} kcal)']})
+
+    vitamin_totals = df[df['nutrient_name'].isin(VITAMINS)].groupby('nutrient_name')['amount'].sum().reset_index()
+    vitamin_totals = vitamin_totals[vitamin_totals['amount'] > 0]
+
+    def get_vitamin_unit(vitamin_name):
+        return 'mcg' if vitamin_name in ['Vitamin A', 'Vitamin D', 'Vitamin K', 'Folate (B9)', 'Vitamin B12'] else 'mg'
+    vitamin_totals['unit'] = vitamin_totals['nutrient_name'].apply(get_vitamin_unit)
+    vitamin_totals['vitamin_short'] = vitamin_totals['nutrient_name'].str.replace(' \\(.*\\)', '', regex=True)
+    vitamin_totals['tooltip'] = vitamin_totals.apply(lambda row: f"{row['vitamin_short']}: {row['amount']:.2f} {row['unit']}", axis=1)
+    summary = ""
+    for _, row in vitamin_totals.iterrows():
+        summary += f"• {row['vitamin_short']}: {row['amount']:.2f} {row['unit']}\n"
+    out['vitamins'], out['summary'] = vitamin_totals, summary
+
+    out['key'] = {}
+    for names in KEY_NUTRIENTS:
+        totals = df[df['nutrient_name'].isin(names)].groupby('nutrient_name')['amount'].sum().reindex(names).reset_index()
+        for _, row in totals.iterrows():
+            out['key'][row['nutrient_name']] = row['amount']
+    out['all_nutrients'] = sorted(df['nutrient_name'].unique())
+    out['trend'] = legacy_trend(df)
+    return out
+
+
+def matrix_prep(df):
+    matrix = NutrientMatrix.from_long(df, date_column='created_at')
+    vitamins = matrix.vitamin_breakdown()
+    key = {}
+    for names in KEY_NUTRIENTS:
+        key.update(matrix.key_totals(names).items())
+    return {'macros': matrix.macro_breakdown(), 'vitamins': vitamins, 'summary': vitamin_summary(vitamins), 'key': key,
+            'all_nutrients': sorted(matrix.totals.index), 'trend': matrix.trend(TREND)}
+
+
+def legacy_trend(df):
+    chart_df = df[df['nutrient_name'].isin(TREND)].copy()
+    chart_df['date'] = chart_df['created_at'].dt.date
+    return chart_df.groupby(['date', 'nutrient_name'])['amount'].sum().reset_index()
+
+
+def same_results(a, b):
+    trend_a = a['trend'].sort_values(['date', 'nutrient_name'])['amount'].to_numpy()
+    trend_b = b['trend'].sort_values(['date', 'nutrient_name'])['amount'].to_numpy()
+    return (np.allclose(a['macros']['Calories'], b['macros']['Calories']) and list(a['macros']['Tooltip']) == list(b['macros']['Tooltip'])
+            # the matrix tooltips go on to add each vitamin's %DV
+            and all(tb.startswith(ta + ' (') for ta, tb in zip(a['vitamins']['tooltip'], b['vitamins'].set_index('nutrient_name').loc[a['vitamins']['nutrient_name'], 'tooltip']))
+            and all(np.isclose(a['key'][k], b['key'][k]) for k in a['key']) and a['all_nutrients'] == b['all_nutrients']
+            and np.allclose(trend_a, trend_b))
+
+
+def median_seconds(fn, df, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn(df)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def main(sizes):
+    print(f"{'':>10} {'full prep':^32}  {'trend change only':^32}")
+    print(f"{'rows':>10} {'legacy ms':>11} {'matrix ms':>11} {'speedup':>8}  {'legacy ms':>11} {'matrix ms':>11} {'speedup':>8}  results")
+    failures = 0
+    for rows in sizes:
+        df = synthetic_rows(rows)
+        repeats = 7 if rows <= 100_000 else 3
+        legacy, matrix = median_seconds(legacy_prep, df, repeats), median_seconds(matrix_prep, df, repeats)
+        # Changing the trend multiselect only re-runs the trend step on an already built matrix.
+        built = NutrientMatrix.from_long(df, date_column='created_at')
+        legacy_t, matrix_t = median_seconds(legacy_trend, df, repeats), median_seconds(lambda _: built.trend(TREND), df, repeats)
+        ok = same_results(legacy_prep(df), matrix_prep(df))
+        failures += not ok
+        print(f"{rows:>10} {legacy * 1000:>11.1f} {matrix * 1000:>11.1f} {legacy / matrix:>7.1f}x  "
+              f"{legacy_t * 1000:>11.1f} {matrix_t * 1000:>11.2f} {legacy_t / matrix_t:>7.0f}x  {'same' if ok else 'DIFFERENT'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
@@ -0,0 +1,37 @@
+# benchmarks/bench_batch_analysis.py - batch throughput vs concurrency with the stub model
+#
+# Runs analyze_batch over distinct synthetic photos with StubModel (fixed
+# latency, no network) at several pool sizes and reports images/sec.
+#
+# Usage: python benchmarks/bench_batch_analysis.py [images] [stub_latency_seconds]
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from analysis import input_prompt
+from batch_analysis import analyze_batch
+from bench_image_prep import synthetic_photo
+from stub_model import StubModel
+
+CONCURRENCY_LEVELS = [1, 2, 4, 8, 16]
+
+
+def main(image_count, latency):
+    model = StubModel(latency=latency)
+    print(f"{image_count} images, stub latency {latency}s")
+    print(f"{'workers':>8} {'seconds':>9} {'images/s':>9} {'errors':>7}")
+    for level, workers in enumerate(CONCURRENCY_LEVELS):
+        # Fresh images per level so the analysis cache never short-circuits a call.
+        images = [synthetic_photo(640, 480, "JPEG", seed=level * 10_000 + i) for i in range(image_count)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            started = time.perf_counter()
+            results = list(analyze_batch(images, input_prompt, model=model, executor=executor))
+            elapsed = time.perf_counter() - started
+        errors = sum(r.error is not None for r in results)
+        print(f"{workers:>8} {elapsed:9.2f} {image_count / elapsed:9.2f} {errors:>7}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 16, float(sys.argv[2]) if len(sys.argv) > 2 else 0.5)
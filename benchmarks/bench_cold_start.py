@@ -0,0 +1,85 @@
+# benchmarks/bench_cold_start.py - import time and first render of app.py in a fresh process
+#
+# Each sample runs in a new interpreter, as the first page view after a server
+# start does. "lazy" imports exactly what app.py imports at the top (read from
+# its source). "eager" also imports what app.py used to import at the top:
+# pandas, altair, google.generativeai and the dashboard modules. Reports the
+# median over `runs` and which heavy modules each left loaded.
+#
+# --render also times AppTest's first run of app.py (logged out, Analyzer page)
+# and a switch to the dashboard page in the same process, which needs the
+# database in DATABASE_URL.
+#
+# Usage: python benchmarks/bench_cold_start.py [runs] [--render]
+
+import os
+import ast
+import sys
+import json
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "app.py")
+HEAVY = ["pandas", "numpy", "altair", "google.generativeai", "sqlalchemy", "PIL.Image", "passlib.context"]
+FORMERLY_EAGER = ["import pandas", "import altair", "import google.generativeai",
+                  "import dashboard_cache", "import analytics"]
+
+IMPORT_PROBE = """
+import sys, time, json, warnings
+warnings.simplefilter("ignore")
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+{imports}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+RENDER_PROBE = """
+import sys, time, json, warnings
+warnings.simplefilter("ignore")
+sys.path.insert(0, {root!r})
+from streamlit.testing.v1 import AppTest
+started = time.perf_counter()
+at = AppTest.from_file({app!r}, default_timeout=120).run()
+first = time.perf_counter() - started
+errors = [e.value for e in at.exception]
+at.session_state["logged_in"] = True; at.session_state["user_id"] = 0; at.session_state["username"] = "bench"
+at.session_state["page"] = "Dashboard"
+started = time.perf_counter()
+at.run()
+dashboard = time.perf_counter() - started
+print(json.dumps({{"first": first, "dashboard": dashboard, "errors": errors + [e.value for e in at.exception]}}))
+"""
+
+
+def app_imports():
+    """The top-level import statements of app.py, as source lines."""
+    tree = ast.parse(open(APP, encoding="utf-8").read())
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+def probe(code):
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT)
+    if result.returncode != 0:
+        sys.exit(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "probe failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(runs, render):
+    imports = app_imports()
+    print(f"{runs} fresh interpreters per mode")
+    print(f"{'mode':<8}{'median s':>10}{'min s':>8}  heavy modules loaded")
+    for mode, lines in (("lazy", imports), ("eager", imports + FORMERLY_EAGER)):
+        samples = [probe(IMPORT_PROBE.format(root=ROOT, imports="\n".join(lines), heavy=HEAVY)) for _ in range(runs)]
+        seconds = [s["seconds"] for s in samples]
+        print(f"{mode:<8}{statistics.median(seconds):>10.3f}{min(seconds):>8.3f}  {', '.join(samples[-1]['loaded'])}")
+    if render:
+        result = probe(RENDER_PROBE.format(root=ROOT, app=APP))
+        print(f"\nfirst render (Analyzer, imports included) {result['first']:.3f} s, then dashboard page {result['dashboard']:.3f} s")
+        for error in result["errors"]:
+            print(f"  app error: {error}")
+
+
+if __name__ == '__main__':
+    main(int(next((a for a in sys.argv[1:] if a.isdigit()), 5)), "--render" in sys.argv)
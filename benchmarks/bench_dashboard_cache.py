@@ -0,0 +1,64 @@
+# benchmarks/bench_dashboard_cache.py - dashboard rerun cost with and without the cache
+#
+# Seeds a user with history, then times building the dashboard data from
+# scratch against a cache hit (which still reads the user's data version).
+# Finally a meal is saved from a separate process and the parent checks that
+# its next lookup misses and returns the new meal, i.e. that invalidation works
+# across server processes. Exits non-zero if it does not.
+#
+# Usage: DATABASE_URL=postgresql://... python benchmarks/bench_dashboard_cache.py [meals] [reruns]
+
+import sys
+import time
+import random
+import statistics
+import multiprocessing
+from datetime import datetime, timedelta
+
+from common import bench_user, sample_analysis
+from meal_store import bulk_import_meals, add_meal_entry
+from dashboard_cache import DashboardCache, build_dashboard_data, get_dashboard_data
+
+
+def save_in_other_process(user_id):
+    add_meal_entry(user_id, sample_analysis(random.Random(7)))
+
+
+def timed(fn, reruns):
+    samples = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main(meal_count, reruns):
+    rng = random.Random(42)
+    start_date = (datetime.now() - timedelta(days=90)).date()
+    with bench_user() as user_id:
+        bulk_import_meals({**sample_analysis(rng), "user_id": user_id,
+                           "created_at": (datetime.now() - timedelta(minutes=rng.randint(0, 90 * 24 * 60))).isoformat()}
+                          for _ in range(meal_count))
+        cache = DashboardCache()
+        uncached = timed(lambda: build_dashboard_data(user_id, start_date), reruns)
+        get_dashboard_data(user_id, start_date, cache)
+        cached = timed(lambda: get_dashboard_data(user_id, start_date, cache), reruns)
+        print(f"{meal_count} meals over 90 days, median of {reruns} reruns")
+        print(f"  uncached build     {uncached:8.2f} ms")
+        print(f"  cache hit          {cached:8.2f} ms  ({uncached / cached:.0f}x)")
+
+        before = get_dashboard_data(user_id, start_date, cache)
+        writer = multiprocessing.get_context("spawn").Process(target=save_in_other_process, args=(user_id,))
+        writer.start(); writer.join()
+        misses = cache.misses
+        after = get_dashboard_data(user_id, start_date, cache)
+        # Only the first history page is cached, so look for the new meal at its top.
+        ok = after.meals['id'].iloc[0] not in set(before.meals['id']) and cache.misses == misses + 1
+        print(f"  save in another process: version {before.version} -> {after.version}, "
+              f"{'invalidated' if ok else 'STALE'}; cache {cache.stats()}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000, int(sys.argv[2]) if len(sys.argv) > 2 else 20)
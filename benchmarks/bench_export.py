@@ -0,0 +1,102 @@
+# benchmarks/bench_export.py - history export: peak RSS and MB/s, streaming vs a whole-range DataFrame
+#
+# Seeds a throwaway user with `meals` meals (34 nutrients each, so 100k meals is
+# 3.4M rows) through meal_store.bulk_import_meals. Each export then runs in its
+# own fresh process, so that every peak RSS is measured on its own:
+#
+#   csv, parquet   export.export_history through the named cursor, to a counting sink
+#   dataframe      aggregates.get_user_data + DataFrame.to_csv, the obvious approach
+#
+# Reports rows, output MB, MB/s and rows/s, plus peak RSS above the process's
+# RSS after imports. Run it at two sizes to see that streaming stays flat while
+# the DataFrame grows with the history.
+#
+# Usage: DATABASE_URL=postgresql://... python benchmarks/bench_export.py [meals] [chunk_rows]
+
+import os
+import sys
+import json
+import time
+import random
+import resource
+import subprocess
+from datetime import date, datetime, timedelta
+
+from common import bench_user, sample_analysis
+from meal_store import bulk_import_meals
+
+MODES = ("csv", "parquet", "dataframe")
+
+
+class CountingSink:
+    """Binary file that only counts what is written to it."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.closed = False
+
+    def write(self, data):
+        self.bytes += len(data); return len(data)
+
+    def tell(self):
+        return self.bytes
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024     # KB on Linux
+
+
+def measure(mode, user_id, chunk_rows):
+    """Runs in the child process: one export, printed as JSON."""
+    from export import export_history
+    from aggregates import get_user_data
+    import pyarrow.parquet  # noqa: F401  (imported up front so it does not count as export memory)
+    baseline = peak_rss_mb()
+    sink = CountingSink()
+    started = time.perf_counter()
+    if mode == "dataframe":
+        df = get_user_data(user_id, date(1970, 1, 1))
+        rows = len(df)
+        sink.write(df.to_csv(index=False).encode("utf-8"))
+    else:
+        rows = export_history(user_id, sink, mode, chunk_rows=chunk_rows)
+    elapsed = time.perf_counter() - started
+    print(json.dumps({"rows": rows, "bytes": sink.bytes, "seconds": elapsed, "baseline_mb": baseline, "peak_mb": peak_rss_mb()}))
+
+
+def seed(user_id, meals, rng):
+    now = datetime.now()
+    records = ({**sample_analysis(rng), "user_id": user_id, "created_at": (now - timedelta(minutes=rng.randint(0, 5 * 365 * 24 * 60))).isoformat()}
+               for _ in range(meals))
+    started = time.perf_counter()
+    meal_count, nutrient_count = bulk_import_meals(records)
+    print(f"seeded {meal_count} meals / {nutrient_count} nutrient rows in {time.perf_counter() - started:.1f} s")
+
+
+def main(meals, chunk_rows):
+    with bench_user() as user_id:
+        seed(user_id, meals, random.Random(5))
+        print(f"{'mode':<11}{'rows':>11}{'MB':>9}{'seconds':>9}{'MB/s':>8}{'rows/s':>11}{'peak RSS over baseline MB':>27}")
+        for mode in MODES:
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), "_measure", mode, str(user_id), str(chunk_rows)],
+                                    capture_output=True, text=True)
+            if result.returncode != 0:
+                print(f"{mode:<11} failed: {result.stderr.strip().splitlines()[-1]}"); continue
+            r = json.loads(result.stdout.strip().splitlines()[-1])
+            mb = r["bytes"] / 1e6
+            print(f"{mode:<11}{r['rows']:>11}{mb:>9.1f}{r['seconds']:>9.2f}{mb / r['seconds']:>8.1f}{r['rows'] / r['seconds']:>11.0f}"
+                  f"{r['peak_mb'] - r['baseline_mb']:>27.1f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == "_measure":
+        measure(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    else:
+        args = [int(a) for a in sys.argv[1:]]
+        main(*(args + [100_000, 10_000][len(args):]))
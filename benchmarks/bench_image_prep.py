@@ -0,0 +1,60 @@
+# benchmarks/bench_image_prep.py - bytes sent and latency, raw upload vs prepare_image
+#
+# Synthesises photo-like JPEG/PNG inputs per size class and reports upload size,
+# bytes actually sent, preprocessing time and an end-to-end estimate of
+# preprocessing + upload at UPLINK_MBPS + a fixed model time. No network or DB.
+#
+# Usage: python benchmarks/bench_image_prep.py [uplink_mbps] [model_seconds]
+
+import io
+import sys
+import time
+import statistics
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+import numpy as np
+from PIL import Image, ImageFilter
+
+from image_prep import prepare_image
+
+SIZE_CLASSES = {"small (640x480)": (640, 480), "medium (2000x1500)": (2000, 1500),
+                "phone 12MP (4032x3024)": (4032, 3024)}
+REPEATS = 5
+
+
+def synthetic_photo(width, height, fmt, seed=0):
+    # Smoothed noise plus fine grain compresses roughly like a real photo.
+    rng = np.random.default_rng(seed)
+    base = Image.fromarray(rng.integers(0, 255, (height // 8, width // 8, 3), dtype=np.uint8)).resize((width, height), Image.BICUBIC)
+    base = base.filter(ImageFilter.GaussianBlur(2))
+    grain = rng.integers(-12, 12, (height, width, 3), dtype=np.int16)
+    pixels = np.clip(np.asarray(base, dtype=np.int16) + grain, 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format=fmt, **({"quality": 95} if fmt == "JPEG" else {}))
+    return buf.getvalue()
+
+
+def upload_seconds(size_bytes, uplink_mbps):
+    return size_bytes * 8 / (uplink_mbps * 1e6)
+
+
+def main(uplink_mbps, model_seconds):
+    print(f"end-to-end = prep + upload at {uplink_mbps} Mbit/s + {model_seconds}s model time")
+    print(f"{'input':<30} {'raw KB':>9} {'sent KB':>9} {'prep ms':>9} {'e2e raw s':>10} {'e2e prep s':>11}")
+    for label, (width, height) in SIZE_CLASSES.items():
+        for fmt in ("JPEG", "PNG"):
+            raw = synthetic_photo(width, height, fmt)
+            timings = []
+            for _ in range(REPEATS):
+                started = time.perf_counter()
+                prepared = prepare_image(raw)
+                timings.append(time.perf_counter() - started)
+            prep = statistics.median(timings)
+            e2e_raw = upload_seconds(len(raw), uplink_mbps) + model_seconds
+            e2e_prep = prep + upload_seconds(len(prepared.data), uplink_mbps) + model_seconds
+            print(f"{label + ' ' + fmt:<30} {len(raw) / 1024:9.0f} {len(prepared.data) / 1024:9.0f} "
+                  f"{prep * 1000:9.1f} {e2e_raw:10.2f} {e2e_prep:11.2f}")
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 10.0, float(sys.argv[2]) if len(sys.argv) > 2 else 3.0)
@@ -0,0 +1,78 @@
+# benchmarks/bench_instrumentation.py - cost of a span with and without a profile active
+#
+# Times an empty loop, then the same loop with a span around each iteration,
+# first with no profile (the normal case: histogram update only) and then
+# inside begin_profile() (tree nodes built too). The per-span cost is what
+# every instrumented call pays; compare it with the ~0.5-50 ms of a DB round
+# trip or the seconds of a model call. Also checks that /metrics serves the
+# recorded spans (on METRICS_PORT, or 9464). No database needed.
+#
+# Usage: python benchmarks/bench_instrumentation.py [iterations]
+
+import sys
+import time
+import urllib.request
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from instrumentation import METRICS_PORT, span, begin_profile, end_profile, format_profile, start_metrics_server
+
+
+def per_call_ns(fn, iterations):
+    started = time.perf_counter()
+    fn(iterations)
+    return (time.perf_counter() - started) / iterations * 1e9
+
+
+def bare(n):
+    for _ in range(n):
+        pass
+
+
+def spanned(n):
+    for _ in range(n):
+        with span("bench.span"):
+            pass
+
+
+def nested(n):
+    for _ in range(n):
+        with span("bench.outer"):
+            with span("bench.inner"):
+                pass
+
+
+def profiled(fn):
+    def run(n):
+        # A real rerun has a few hundred spans, so profile in rerun-sized slices.
+        for start in range(0, n, 500):
+            root = begin_profile(True)
+            fn(min(500, n - start))
+            end_profile(root)
+    return run
+
+
+def main(iterations):
+    loop = per_call_ns(bare, iterations)
+    print(f"{iterations} iterations, empty loop {loop:.0f} ns/iteration")
+    for label, fn, spans in (("span, no profile", spanned, 1), ("span, profiling", profiled(spanned), 1),
+                             ("nested pair, no profile", nested, 2), ("nested pair, profiling", profiled(nested), 2)):
+        cost = (per_call_ns(fn, iterations) - loop) / spans
+        print(f"  {label:<26}{cost:8.0f} ns/span")
+
+    root = begin_profile(True)
+    with span("page.dashboard"):
+        for _ in range(3):
+            with span("db.query"):
+                time.sleep(0.001)
+    print("\nsample profile:\n" + format_profile(end_profile(root)))
+
+    server = start_metrics_server(port=METRICS_PORT or 9464)
+    if server:
+        body = urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics").read().decode()
+        ok = 'app_span_duration_seconds_count{span="db.query"} 3' in body
+        print(f"\n/metrics on port {server.server_address[1]}: {len(body.splitlines())} lines -> {'ok' if ok else 'FAIL'}")
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,83 @@
+# benchmarks/bench_job_queue.py - analysis job queue under many concurrent submitters
+#
+# Starts a pool of jobs.py worker processes on the stub model, then has
+# `submitters` threads (standing in for Streamlit sessions) submit distinct
+# images, each one twice, as a double click would. Reports the submit
+# latency the web tier pays, the time from first submit to last job done, and
+# throughput against the ideal of jobs x stub latency / workers. Fails unless
+# every image produced exactly one job that ran once and finished.
+#
+# Usage: DATABASE_URL=postgresql://... python benchmarks/bench_job_queue.py [jobs] [workers] [submitters] [stub_latency]
+
+import os
+import sys
+import time
+import statistics
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+args = [float(a) for a in sys.argv[1:]]
+JOBS, WORKERS, SUBMITTERS, LATENCY = (args + [200, 8, 32, 0.5][len(args):])[:4]
+# Workers and the submitting side must both use the stub (it is also part of the job key).
+os.environ["ANALYSIS_MODEL"] = "stub"
+os.environ["STUB_MODEL_LATENCY"] = str(LATENCY)
+
+from common import percentile  # noqa: E402  (also puts the repo root on sys.path)
+from db import connection  # noqa: E402
+from migrations import migrate  # noqa: E402
+from analysis import input_prompt  # noqa: E402
+from jobs import submit_job, get_job, _worker_main, DONE, FAILED  # noqa: E402
+
+
+def main(jobs, workers, submitters, latency):
+    migrate()
+    images = [[{"mime_type": "image/jpeg", "data": os.urandom(64 * 1024)}] for _ in range(jobs)]
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    pool = [context.Process(target=_worker_main, args=(stop,)) for _ in range(workers)]
+    for process in pool:
+        process.start()
+    time.sleep(3)   # let the workers import before the clock starts
+
+    submit_ms = []
+
+    def submit(image):
+        keys = []
+        for _ in range(2):
+            started = time.perf_counter()
+            keys.append(submit_job(image, input_prompt))
+            submit_ms.append((time.perf_counter() - started) * 1000)
+        return keys
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=submitters) as executor:
+        key_pairs = list(executor.map(submit, images))
+    submitted = time.perf_counter() - started
+    keys = [pair[0] for pair in key_pairs]
+    pending = set(keys)
+    while pending:
+        pending = {key for key in pending if get_job(key)['status'] not in (DONE, FAILED)}
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for process in pool:
+        process.join()
+
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT status, attempts, count(*) FROM analysis_jobs WHERE job_key = ANY(%s) GROUP BY 1, 2;", (keys,))
+        outcome = {(status, attempts): count for status, attempts, count in cur.fetchall()}
+        cur.execute("DELETE FROM analysis_jobs WHERE job_key = ANY(%s);", (keys,))
+        conn.commit()
+
+    ideal = jobs * latency / workers
+    ok = all(a == b for a, b in key_pairs) and outcome == {(DONE, 1): jobs}
+    print(f"{jobs} jobs (each submitted twice), {workers} workers, {submitters} submitters, stub latency {latency}s")
+    print(f"  submit latency     p50 {statistics.median(submit_ms):7.2f} ms   p95 {percentile(submit_ms, 95):7.2f} ms   max {max(submit_ms):7.2f} ms")
+    print(f"  all submitted in   {submitted:7.2f} s")
+    print(f"  all done in        {elapsed:7.2f} s   ({jobs / elapsed:.1f} jobs/s, ideal {ideal:.2f} s -> {ideal / elapsed:.0%} of ideal)")
+    print(f"  jobs by (status, attempts): {outcome} -> {'ok' if ok else 'FAIL'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main(int(JOBS), int(WORKERS), int(SUBMITTERS), LATENCY)
@@ -0,0 +1,45 @@
+# benchmarks/bench_meal_insert.py - nutrient rows/sec: per-row loop vs batched VALUES vs COPY
+#
+# Usage: DATABASE_URL=postgresql://... python benchmarks/bench_meal_insert.py [meals]
+
+import sys
+import random
+from datetime import datetime
+
+from common import bench_user, sample_analysis, timer
+from db import connection
+from meal_store import add_meal_entry, bulk_import_meals
+
+
+def legacy_add_meal_entry(user_id, meal_analysis):
+    # The original implementation: one INSERT round trip per nutrient.
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO meals (user_id, meal_title, analysis_text, created_at) VALUES (%s, %s, %s, %s) RETURNING id;",
+                        (user_id, meal_analysis['title'], meal_analysis['full_text'], datetime.now()))
+            meal_id = cur.fetchone()[0]
+            for nutrient in meal_analysis['nutrients']:
+                cur.execute("INSERT INTO meal_nutrients (meal_id, nutrient_name, amount, unit, percent_dv) VALUES (%s, %s, %s, %s, %s);",
+                            (meal_id, nutrient.get('nutrient'), nutrient.get('amount'), nutrient.get('unit'), nutrient.get('percent_dv')))
+            conn.commit()
+
+
+def main(meal_count):
+    rng = random.Random(42)
+    analyses = [sample_analysis(rng) for _ in range(meal_count)]
+    rows = sum(len(a['nutrients']) for a in analyses)
+    results = {}
+    with bench_user() as user_id:
+        with timer(results, "per-row INSERT loop"):
+            for analysis in analyses: legacy_add_meal_entry(user_id, analysis)
+        with timer(results, "add_meal_entry (execute_values)"):
+            for analysis in analyses: add_meal_entry(user_id, analysis)
+        with timer(results, "bulk_import_meals (COPY)"):
+            bulk_import_meals({**analysis, "user_id": user_id} for analysis in analyses)
+    print(f"{meal_count} meals, {rows} nutrient rows per strategy")
+    for name, seconds in results.items():
+        print(f"{name:<34} {seconds:8.3f}s {rows / seconds:12.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,130 @@
+# benchmarks/bench_model_client.py - ModelClient behaviour against a fault-injecting stub
+#
+# Drives a ModelClient over StubModel with injected latency and transient errors
+# through three phases (healthy, flaky, outage) from several threads, and reports
+# outcome counts, latency percentiles and circuit-breaker trips per phase. During
+# the outage the breaker should open and calls should fail fast. First it streams
+# once to the end and once with a transient error after a few chunks, and checks
+# that the client records each over the whole stream (latency, outcome, breaker),
+# and that a half-open probe turned away by the rate limiter, or interrupted,
+# leaves the breaker open rather than stuck half-open.
+#
+# Usage: python benchmarks/bench_model_client.py [calls_per_phase] [threads]
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from model_client import ModelClient, TokenBucket, CircuitBreaker, ModelUnavailableError
+from stub_model import StubModel
+
+PHASES = [("healthy", 0.0), ("flaky (20% errors)", 0.2), ("outage (100% errors)", 1.0)]
+IMAGE = [{"mime_type": "image/jpeg", "data": b"benchmark"}]
+
+
+def call(client):
+    try:
+        client(IMAGE, "prompt", timeout=5)
+        return "ok"
+    except Exception as e:
+        return type(e).__name__
+
+
+class MidStreamFailure(StubModel):
+    """Streams a few chunks, then drops the connection."""
+
+    def stream(self, image_data, prompt, timeout=None, chunks=10):
+        for i, chunk in enumerate(super().stream(image_data, prompt, timeout, chunks)):
+            if i == 3:
+                raise ConnectionError("stream reset")
+            yield chunk
+
+
+def check_streams():
+    ok = True
+    for label, stub, expected in (("complete", StubModel(latency=0.2), "ok"), ("reset mid-stream", MidStreamFailure(latency=0.2), "failed")):
+        client = ModelClient(stub, breaker=CircuitBreaker(threshold=5))
+        started = time.perf_counter()
+        try:
+            for _ in client.stream(IMAGE, "prompt", timeout=5):
+                pass
+        except ConnectionError:
+            pass
+        elapsed = time.perf_counter() - started
+        stats = client.stats()
+        recorded = (stats["outcomes"] == {expected: 1} and stats["latency_p50"] >= elapsed * 0.9
+                    and client.breaker.failures == (expected == "failed"))
+        ok = ok and recorded
+        print(f"stream {label}: outcomes {stats['outcomes']}, recorded {stats['latency_p50'] * 1000:.0f} of "
+              f"{elapsed * 1000:.0f} ms, breaker failures {client.breaker.failures} -> {'ok' if recorded else 'WRONG'}")
+    return ok
+
+
+class Interrupted(BaseException):
+    """Stands in for KeyboardInterrupt / SystemExit escaping a call."""
+
+
+def check_breaker_probe():
+    """OPEN -> cooldown -> rate-rejected -> interrupted probe -> probe again -> CLOSED."""
+    stub = StubModel(latency=0.0, error_rate=1.0, seed=1)
+    limiter, breaker = TokenBucket(rate=1000, burst=1), CircuitBreaker(threshold=1, cooldown=0.05)
+    client = ModelClient(stub, limiter=limiter, breaker=breaker, max_retries=0)
+    steps = []
+    try:
+        client(IMAGE, "prompt", timeout=1)
+    except Exception:
+        pass
+    steps.append(("failure opens", breaker.state == breaker.OPEN))
+    time.sleep(0.06)
+    limiter.tokens, limiter.rate = 0.0, 1e-9      # no rate budget
+    try:
+        client(IMAGE, "prompt", timeout=0.01)
+    except ModelUnavailableError:
+        pass
+    steps.append(("rate-rejected call leaves it open", breaker.state == breaker.OPEN))
+    limiter.tokens, limiter.rate = 5.0, 1000
+
+    def interrupt(*args, **kwargs):
+        raise Interrupted()
+    client.transport = interrupt
+    try:
+        client(IMAGE, "prompt", timeout=1)
+    except Interrupted:
+        pass
+    steps.append(("interrupted probe reopens it", breaker.state == breaker.OPEN))
+    time.sleep(0.06)
+    client.transport, stub.error_rate = stub, 0.0
+    try:
+        client(IMAGE, "prompt", timeout=1)
+    except ModelUnavailableError:
+        pass
+    steps.append(("next probe closes it", breaker.state == breaker.CLOSED))
+    for label, ok in steps:
+        print(f"breaker {label}: {'ok' if ok else 'WRONG'}")
+    return all(ok for _, ok in steps)
+
+
+def main(calls, threads):
+    print(f"{calls} calls per phase, {threads} threads, rate limit 200/s burst 50, breaker 5 failures / 1s cooldown")
+    for label, error_rate in PHASES:
+        stub = StubModel(latency=0.02, jitter=0.03, error_rate=error_rate, seed=1)
+        client = ModelClient(stub, limiter=TokenBucket(rate=200, burst=50), breaker=CircuitBreaker(threshold=5, cooldown=1.0),
+                             backoff_base=0.02, backoff_max=0.2)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(lambda _: call(client), range(calls)))
+        elapsed = time.perf_counter() - started
+        stats = client.stats()
+        seen = {name: results.count(name) for name in sorted(set(results))}
+        print(f"\n[{label}] {elapsed:.2f}s, {calls / elapsed:.0f} calls/s")
+        print(f"  caller saw: {seen}")
+        print(f"  client outcomes: {stats['outcomes']}")
+        print(f"  latency p50 {stats['latency_p50'] * 1000:.0f} ms, p95 {stats['latency_p95'] * 1000:.0f} ms, "
+              f"breaker {stats['breaker_state']} (tripped {stats['breaker_trips']}x)")
+
+
+if __name__ == '__main__':
+    if not (check_streams() and check_breaker_probe()):
+        sys.exit(1)
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300, int(sys.argv[2]) if len(sys.argv) > 2 else 8)
@@ -0,0 +1,129 @@
+# benchmarks/bench_near_duplicates.py - near-duplicate photo lookup: latency at scale and model calls saved
+#
+#   lookup [hashes]    builds a HashIndex over `hashes` random 64-bit hashes (default 1M)
+#                      with a near neighbour planted for each query, then reports
+#                      lookup p50/p95 at several radii against a linear scan, and
+#                      checks both return the same matches.
+#   hitrate [meals]    draws `meals` synthetic meal photos, saves one shot of each,
+#                      then looks up re-shots (shifted, cropped, rotated, relit,
+#                      recompressed) and photos of other meals. Per distance threshold,
+#                      it reports the share of re-shots that skip the model call, and
+#                      the share of other meals wrongly matched.
+#
+# Images go through image_prep.prepare_image like uploads do. No database needed.
+#
+# Usage: python benchmarks/bench_near_duplicates.py lookup [1000000]
+#        python benchmarks/bench_near_duplicates.py hitrate [200]
+
+import io
+import sys
+import time
+import random
+
+from PIL import Image, ImageDraw, ImageEnhance
+
+from common import percentile
+from image_prep import prepare_image
+from near_duplicates import HashIndex, image_hash, NEAR_DUPLICATE_DISTANCE
+
+RADII = (2, 4, 6, 8, 10)
+THRESHOLDS = (2, 4, 6, 8, 10, 12, 16)
+
+
+# --- LOOKUP LATENCY ---
+def flip_bits(value, count, rng):
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def lookup(size, queries=500, seed=7):
+    rng = random.Random(seed)
+    hashes = [rng.getrandbits(64) for _ in range(size)]
+    started = time.perf_counter()
+    index = HashIndex()
+    for meal_id, value in enumerate(hashes):
+        index.add(value, meal_id)
+    build = time.perf_counter() - started
+    print(f"{size:,} hashes, index built in {build:.1f} s; {queries} queries per radius, each with a neighbour planted within the radius")
+    print(f"{'radius':>6}{'index p50 ms':>14}{'index p95 ms':>14}{'scan p50 ms':>13}{'matches agree':>15}")
+    for radius in RADII:
+        targets = [rng.randrange(size) for _ in range(queries)]
+        probes = [flip_bits(hashes[t], rng.randint(0, radius), rng) for t in targets]
+        index_ms, scan_ms, agree = [], [], True
+        for i, probe in enumerate(probes):
+            started = time.perf_counter()
+            found = index.search(probe, radius)
+            index_ms.append((time.perf_counter() - started) * 1000)
+            if i < 20:      # a full scan takes ~0.1 s per million; spot-check a few
+                started = time.perf_counter()
+                scanned = sorted(((value ^ probe).bit_count(), -meal_id) for meal_id, value in enumerate(hashes) if (value ^ probe).bit_count() <= radius)
+                scan_ms.append((time.perf_counter() - started) * 1000)
+                agree = agree and [(d, -m) for d, m in scanned] == found
+            agree = agree and any(meal_id == targets[i] for _, meal_id in found)
+        print(f"{radius:>6}{percentile(index_ms, 50):>14.3f}{percentile(index_ms, 95):>14.3f}{percentile(scan_ms, 50):>13.1f}{'yes' if agree else 'NO':>15}")
+    return agree
+
+
+# --- HIT RATE ---
+def synthetic_meal(rng, size=(800, 600)):
+    """A plate on a table: a few food-coloured blobs on a plate, on a textured background."""
+    image = Image.new("RGB", size, tuple(rng.randint(60, 200) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.line((x, y, x + rng.randint(-200, 200), y + rng.randint(-200, 200)), fill=tuple(rng.randint(40, 220) for _ in range(3)), width=rng.randint(2, 12))
+    cx, cy, r = size[0] // 2 + rng.randint(-80, 80), size[1] // 2 + rng.randint(-60, 60), rng.randint(180, 260)
+    draw.ellipse((cx - r, cy - r, cx + r, cy + r), fill=(245, 245, 240))
+    for _ in range(rng.randint(2, 5)):
+        fx, fy, fr = cx + rng.randint(-r // 2, r // 2), cy + rng.randint(-r // 2, r // 2), rng.randint(r // 5, r // 2)
+        draw.ellipse((fx - fr, fy - fr, fx + fr, fy + int(fr * rng.uniform(0.5, 1.2))), fill=tuple(rng.randint(30, 240) for _ in range(3)))
+    return image
+
+
+def reshoot(image, rng):
+    """Another photo of the same plate: reframed, slightly rotated, relit and re-encoded."""
+    w, h = image.size
+    dx, dy = int(w * rng.uniform(-0.04, 0.04)), int(h * rng.uniform(-0.04, 0.04))
+    crop = rng.uniform(0.0, 0.05)
+    shot = image.rotate(rng.uniform(-3, 3), resample=Image.BILINEAR, translate=(dx, dy), fillcolor=image.getpixel((0, 0)))
+    scale = rng.uniform(1.0, 2.0)     # another camera / distance, same aspect ratio
+    shot = shot.crop((int(w * crop), int(h * crop), w - int(w * crop), h - int(h * crop))).resize((int(w * scale), int(h * scale)))
+    shot = ImageEnhance.Brightness(shot).enhance(rng.uniform(0.85, 1.15))
+    shot = ImageEnhance.Contrast(shot).enhance(rng.uniform(0.9, 1.1))
+    return shot
+
+
+def jpeg_bytes(image, quality):
+    buf = io.BytesIO(); image.save(buf, format="JPEG", quality=quality); return buf.getvalue()
+
+
+def hitrate(meals, reshots=3, seed=11):
+    rng = random.Random(seed)
+    index = HashIndex()
+    originals = [synthetic_meal(rng) for _ in range(meals)]
+    for meal_id, image in enumerate(originals):
+        index.add(image_hash(prepare_image(jpeg_bytes(image, 90)).image), meal_id)
+    # Re-shots of saved meals, and first photos of meals never saved
+    same = [(meal_id, image_hash(prepare_image(jpeg_bytes(reshoot(image, rng), rng.randint(60, 95))).image))
+            for meal_id, image in enumerate(originals) for _ in range(reshots)]
+    other = [image_hash(prepare_image(jpeg_bytes(synthetic_meal(rng), 85)).image) for _ in range(meals)]
+    print(f"{meals} saved meals, {len(same)} re-shots of them, {len(other)} photos of other meals")
+    print(f"{'threshold':>9}{'re-shots matched':>18}{'model calls saved':>19}{'other meals matched':>21}")
+    for threshold in THRESHOLDS:
+        hits = [index.search(value, threshold) for _, value in same]
+        matched = sum(1 for found in hits if found)
+        correct = sum(1 for (meal_id, _), found in zip(same, hits) if found and found[0][1] == meal_id)
+        false = sum(1 for value in other if index.search(value, threshold))
+        marker = "  <- NEAR_DUPLICATE_DISTANCE" if threshold == NEAR_DUPLICATE_DISTANCE else ""
+        print(f"{threshold:>9}{matched / len(same):>18.1%}{correct / len(same):>19.1%}{false / len(other):>21.1%}{marker}")
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else "lookup"
+    if command == "lookup":
+        sys.exit(0 if lookup(int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000) else 1)
+    elif command == "hitrate":
+        hitrate(int(sys.argv[2]) if len(sys.argv) > 2 else 200)
+    else:
+        sys.exit("usage: bench_near_duplicates.py lookup [HASHES] | hitrate [MEALS]")
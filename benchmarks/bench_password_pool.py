@@ -0,0 +1,106 @@
+# benchmarks/bench_password_pool.py - logins/sec and stall of other sessions: bcrypt inline vs process pool
+#
+# `concurrency` threads stand in for sessions logging in at once, each
+# verifying a password for `duration` seconds, either inline in the thread (the
+# old behaviour) or through passwords.verify_and_update (the process pool).
+# A probe thread meanwhile sleeps 5 ms at a time and records how late it
+# wakes up: that lateness is what every other session on the server feels.
+#
+# Then checks admission control (a burst far above PASSWORD_QUEUE_LIMIT must
+# be partly refused with PasswordServiceBusy, not queued without bound) and
+# that a hash below PASSWORD_HASH_ROUNDS is upgraded on login. No database needed.
+#
+# Usage: python benchmarks/bench_password_pool.py [rounds] [duration] [concurrency,...]
+
+import os
+import sys
+import time
+import threading
+
+args = sys.argv[1:]
+ROUNDS = int(args[0]) if args else 10
+DURATION = float(args[1]) if len(args) > 1 else 5
+CONCURRENCY = [int(c) for c in args[2].split(",")] if len(args) > 2 else [1, 4, 16, 64]
+os.environ["PASSWORD_HASH_ROUNDS"] = str(ROUNDS)
+os.environ.setdefault("PASSWORD_ADMIT_TIMEOUT", "0.5")
+
+from common import percentile  # noqa: E402  (also puts the repo root on sys.path)
+from passlib.context import CryptContext  # noqa: E402
+import passwords  # noqa: E402
+
+PASSWORD = "load-test-password"
+
+
+def inline(hashed):
+    return passwords._verify_and_update(PASSWORD, hashed)
+
+
+def pooled(hashed):
+    return passwords.verify_and_update(PASSWORD, hashed)
+
+
+def run(verify, hashed, concurrency, duration):
+    ops, busy, lags = [0] * concurrency, [0] * concurrency, []
+    deadline = time.perf_counter() + duration
+
+    def session(i):
+        while time.perf_counter() < deadline:
+            try:
+                verify(hashed); ops[i] += 1
+            except passwords.PasswordServiceBusy:
+                busy[i] += 1
+
+    def probe():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            time.sleep(0.005)
+            lags.append((time.perf_counter() - started - 0.005) * 1000)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(concurrency)] + [threading.Thread(target=probe)]
+    started = time.perf_counter()
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    wall = time.perf_counter() - started
+    return sum(ops) / wall, sum(busy), percentile(lags, 95), max(lags)
+
+
+def admission_check(hashed, burst):
+    outcomes = []
+    threads = [threading.Thread(target=lambda: outcomes.append(_try(hashed))) for _ in range(burst)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    return outcomes.count("ok"), outcomes.count("busy")
+
+
+def _try(hashed):
+    try:
+        pooled(hashed); return "ok"
+    except passwords.PasswordServiceBusy:
+        return "busy"
+
+
+def main():
+    hashed = passwords._hash(PASSWORD)
+    pooled(hashed)      # start the worker processes before timing
+    print(f"bcrypt cost {ROUNDS}, {passwords.PASSWORD_WORKERS} pool workers, queue limit {passwords.PASSWORD_QUEUE_LIMIT}, "
+          f"{os.cpu_count()} CPUs, {DURATION}s per run")
+    print(f"{'mode':<8}{'sessions':>9}{'logins/s':>10}{'busy':>7}{'probe lag p95 ms':>18}{'max ms':>9}")
+    for concurrency in CONCURRENCY:
+        for mode, verify in (("inline", inline), ("pool", pooled)):
+            rate, busy, lag_p95, lag_max = run(verify, hashed, concurrency, DURATION)
+            print(f"{mode:<8}{concurrency:>9}{rate:>10.1f}{busy:>7}{lag_p95:>18.1f}{lag_max:>9.1f}")
+
+    started = time.perf_counter(); pooled(hashed); per_verify = time.perf_counter() - started
+    # Big enough that the last of the burst would wait well past PASSWORD_ADMIT_TIMEOUT
+    burst = max(passwords.PASSWORD_QUEUE_LIMIT * 4, int(3 * passwords.PASSWORD_ADMIT_TIMEOUT * max(passwords.PASSWORD_WORKERS, 1) / per_verify))
+    admitted, refused = admission_check(hashed, burst)
+    print(f"\nburst of {burst}: {admitted} verified, {refused} refused as busy -> {'ok' if refused else 'FAIL'}")
+    weaker = CryptContext(schemes=["bcrypt"], bcrypt__rounds=max(ROUNDS - 1, 4)).hash(PASSWORD)
+    matches, new_hash = pooled(weaker)
+    upgraded = matches and new_hash is not None and not passwords.pwd_context.needs_update(new_hash)
+    print(f"cost {max(ROUNDS - 1, 4)} hash on login: {'rehashed at cost ' + str(ROUNDS) if upgraded else 'not upgraded'} -> {'ok' if upgraded else 'FAIL'}")
+    sys.exit(0 if refused and upgraded else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# benchmarks/bench_prompt.py - prompt size, response size and latency per prompt variant
+#
+# Compares the original prompt (fixtures/legacy_prompt.txt, with its duplicated
+# nutrient block), the compact markdown prompt and the structured-output prompt.
+# Offline it reports prompt size and the size of a typical response for each
+# output format, using ~4 characters per token. With --live (needs
+# GOOGLE_API_KEY) it also counts prompt tokens with the Gemini tokenizer, runs
+# each variant over the sample images in assets/images and reports latency,
+# billed input/output tokens and how many responses parsed completely.
+#
+# Usage: python benchmarks/bench_prompt.py [--live] [runs_per_image]
+
+import os
+import sys
+import json
+import time
+import glob
+import statistics
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from analysis import MARKDOWN_PROMPT, STRUCTURED_PROMPT, MODEL_NAME
+from image_prep import prepare_image
+from nutrients import NUTRIENTS, coverage, response_schema
+from response_parser import parse_summary_from_response
+from stub_model import stub_response
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(HERE, "fixtures", "legacy_prompt.txt"), encoding="utf-8") as f:
+    LEGACY_PROMPT = f.read()
+IMAGES = sorted(glob.glob(os.path.join(HERE, "..", "assets", "images", "*")))
+
+
+def structured_equivalent(markdown_response):
+    """The structured-output JSON carrying the same content as a markdown response."""
+    analysis = parse_summary_from_response(markdown_response)
+    with_dv = {name for name, _, has_dv in NUTRIENTS if has_dv}
+    return json.dumps({
+        "title": analysis["title"], "advantages": ["Balanced mix of macronutrients and a decent amount of fiber."],
+        "disadvantages": ["Sodium is on the higher side."], "fun_fact": "This is a stub response generated offline.",
+        "nutrients": {n["nutrient"]: {"amount": n["amount"], **({"percent_dv": n["percent_dv"]} if n["nutrient"] in with_dv else {})}
+                      for n in analysis["nutrients"]},
+    })
+
+
+def approx_tokens(text):
+    return len(text) / 4
+
+
+def offline():
+    markdown_response = stub_response(b"benchmark")
+    responses = {"legacy": markdown_response, "markdown": markdown_response, "json": structured_equivalent(markdown_response)}
+    prompts = {"legacy": LEGACY_PROMPT, "markdown": MARKDOWN_PROMPT, "json": STRUCTURED_PROMPT}
+    print(f"{'variant':<10} {'prompt chars':>13} {'~prompt tok':>12} {'response chars':>15} {'~response tok':>14}")
+    for name, prompt in prompts.items():
+        print(f"{name:<10} {len(prompt):>13} {approx_tokens(prompt):>12.0f} {len(responses[name]):>15} {approx_tokens(responses[name]):>14.0f}")
+
+
+def live(runs):
+    import google.generativeai as genai
+    json_config = genai.GenerationConfig(response_mime_type="application/json", response_schema=response_schema())
+    variants = {"legacy": (LEGACY_PROMPT, None), "markdown": (MARKDOWN_PROMPT, None), "json": (STRUCTURED_PROMPT, json_config)}
+    images = []
+    for path in IMAGES:
+        with open(path, "rb") as f:
+            images.append(prepare_image(f.read()).api_payload()[0])
+    print(f"\nlive: {len(images)} images x {runs} runs per variant")
+    print(f"{'variant':<10} {'prompt tok':>11} {'in tok':>8} {'out tok':>8} {'p50 s':>7} {'max s':>7} {'parsed':>8}")
+    for name, (prompt, config) in variants.items():
+        model = genai.GenerativeModel(MODEL_NAME, generation_config=config)
+        prompt_tokens = model.count_tokens(prompt).total_tokens
+        latencies, usage_in, usage_out, parsed = [], [], [], 0
+        for image in images:
+            for _ in range(runs):
+                started = time.perf_counter()
+                response = model.generate_content([image, prompt])
+                latencies.append(time.perf_counter() - started)
+                usage_in.append(response.usage_metadata.prompt_token_count)
+                usage_out.append(response.usage_metadata.candidates_token_count)
+                parsed += coverage(parse_summary_from_response(response.text)["nutrients"]) == 1
+        print(f"{name:<10} {prompt_tokens:>11} {statistics.mean(usage_in):>8.0f} {statistics.mean(usage_out):>8.0f} "
+              f"{statistics.median(latencies):>7.2f} {max(latencies):>7.2f} {parsed:>4}/{len(latencies):<3}")
+
+
+if __name__ == '__main__':
+    offline()
+    if "--live" in sys.argv:
+        args = [a for a in sys.argv[1:] if a != "--live"]
+        live(int(args[0]) if args else 2)
@@ -0,0 +1,137 @@
+# benchmarks/bench_replicas.py - dashboard throughput as replicas are added, and work duplicated between them
+#
+# Starts `workers` processes that stand in for app replicas behind a load
+# balancer without sticky sessions. Every request picks a random user and
+# time range, as if the request had landed on whichever replica was free. It
+# then does what a dashboard rerun on a fresh replica does:
+#
+#   1. verify the user's signed session token (sessions.verify_token, no database;
+#      the revocation lookup in sessions.resume happens once per new connection, not per rerun)
+#   2. look up the range in dashboard_cache.SharedDashboardCache on the configured
+#      STATE_BACKEND, and on a miss build it and store it
+#
+# A build is NutrientMatrix.from_long over synthetic daily totals (34 nutrients
+# per day over the range) plus the derived frames. That stands in for the
+# aggregate query and the pandas work. With STATE_BACKEND=memory every replica
+# builds every range itself. With postgres or redis the first replica to build
+# a range shares it. Reports requests/s, p95 latency, scaling efficiency against
+# one worker, and builds (a build repeated on another replica is duplicated work).
+# First it checks that a token is accepted by sessions.resume until logout
+# revokes it, and rejected after that.
+# Throughput can only grow with workers while there are free cores: the script
+# prints os.cpu_count().
+#
+# Usage: [STATE_BACKEND=redis|postgres] python benchmarks/bench_replicas.py [workers,...] [duration] [users]
+
+import os
+import sys
+import time
+import random
+import secrets
+import multiprocessing
+from datetime import date
+
+os.environ.setdefault("SESSION_SECRET", secrets.token_hex(32))    # shared by every replica, as in production
+
+from common import percentile  # noqa: E402  (also puts the repo root on sys.path)
+
+WORKERS = [1, 2, 4]
+
+
+def synthetic_totals(user_id, start_date, today):
+    import numpy as np
+    import pandas as pd
+    from nutrients import NUTRIENT_NAMES, DAILY_VALUES
+    rng = np.random.default_rng(user_id)
+    days = pd.date_range(max(start_date, date(today.year - 2, today.month, 1)), today, freq="D")
+    names = np.tile(NUTRIENT_NAMES, len(days))
+    amounts = rng.uniform(0, 500, len(names))
+    daily_values = np.array([DAILY_VALUES.get(n, np.nan) for n in NUTRIENT_NAMES] * len(days))
+    return pd.DataFrame({"date": np.repeat(days, len(NUTRIENT_NAMES)), "nutrient_name": names,
+                         "amount": amounts, "percent_dv": amounts / daily_values * 100})
+
+
+def build(key, today):
+    import pandas as pd
+    from analytics import NutrientMatrix
+    from dashboard_cache import DashboardData
+    user_id, start_date, version = key
+    matrix = NutrientMatrix.from_long(synthetic_totals(user_id, start_date, today))
+    return DashboardData(version, matrix, pd.DataFrame(), None, matrix.macro_breakdown(), matrix.vitamin_breakdown(),
+                         matrix.daily_value_progress())
+
+
+def replica(index, tokens, duration, start, results):
+    from sessions import verify_token
+    from state_store import get_state_store
+    from dashboard_cache import SharedDashboardCache, TIME_RANGES, range_start
+    today = date.today()
+    starts = [range_start(label, today) for label in TIME_RANGES]
+    cache = SharedDashboardCache(get_state_store())
+    rng = random.Random(index)
+    latencies, builds, rejected = [], 0, 0
+    start.wait()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        token = rng.choice(tokens)
+        started = time.perf_counter()
+        session = verify_token(token)
+        if session is None:
+            rejected += 1; continue
+        key = (session.user_id, rng.choice(starts), 1)
+        data = cache.get(key)
+        if data is None:
+            data = build(key, today); cache.set(key, data); builds += 1
+        latencies.append(time.perf_counter() - started)
+    results.put((len(latencies), builds, rejected, latencies))
+
+
+def run(workers, tokens, duration):
+    ctx = multiprocessing.get_context("spawn")
+    start, results = ctx.Event(), ctx.Queue()
+    processes = [ctx.Process(target=replica, args=(i, tokens, duration, start, results)) for i in range(workers)]
+    for p in processes:
+        p.start()
+    time.sleep(2)    # let every replica finish its imports before the clock starts
+    start.set()
+    outcomes = [results.get() for _ in processes]
+    for p in processes:
+        p.join()
+    requests = sum(o[0] for o in outcomes)
+    latencies = [latency for o in outcomes for latency in o[3]]
+    return requests / duration, percentile(latencies, 95) * 1000, sum(o[1] for o in outcomes), sum(o[2] for o in outcomes)
+
+
+def check_revocation():
+    """A session token resumes until it is revoked, then never again."""
+    from sessions import issue_token, resume, revoke
+    session, token = issue_token(1, "user1")
+    before = resume(token) is not None
+    revoke(session.session_id)
+    after = resume(token)
+    ok = before and after is None
+    print(f"token revoked on logout: {'yes' if ok else 'NO'}")
+    return ok
+
+
+def main(worker_counts, duration, users):
+    from sessions import issue_token
+    if not check_revocation():
+        sys.exit(1)
+    from state_store import STATE_BACKEND
+    from dashboard_cache import TIME_RANGES
+    tokens = [issue_token(user_id, f"user{user_id}")[1] for user_id in range(1, users + 1)]
+    print(f"STATE_BACKEND={STATE_BACKEND}, {os.cpu_count()} CPUs, {users} users x {len(TIME_RANGES)} ranges = "
+          f"{users * len(TIME_RANGES)} distinct dashboards, {duration:.0f} s per run")
+    print(f"{'workers':>7}{'req/s':>10}{'p95 ms':>9}{'scaling':>9}{'builds':>8}{'rejected':>10}")
+    single = None
+    for workers in worker_counts:
+        throughput, p95, builds, rejected = run(workers, tokens, duration)
+        single = single or throughput / workers
+        print(f"{workers:>7}{throughput:>10.0f}{p95:>9.2f}{throughput / (single * workers):>9.0%}{builds:>8}{rejected:>10}")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main([int(w) for w in args[0].split(",")] if args else WORKERS,
+         float(args[1]) if len(args) > 1 else 10, int(args[2]) if len(args) > 2 else 50)
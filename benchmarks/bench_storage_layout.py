@@ -0,0 +1,99 @@
+# benchmarks/bench_storage_layout.py - meal_nutrients rows vs wide REAL[] columns on meals
+#
+# For each layout (see nutrient_storage.py) a throwaway user gets the same
+# analyses: a bulk COPY import, then single saves through add_meal_entry. The
+# script reports the on-disk size of that user's meals + meal_nutrients (copied
+# into fresh temp tables with the production indexes, so heap, TOAST and index
+# bytes are measured without bloat from earlier runs) and insert throughput. It
+# also reports the median latency of the raw read (get_user_data), of a rollup
+# rebuild from the stored nutrients and of the rollup read the dashboard uses
+# (get_daily_totals). Both layouts must return the same nutrient sums, or the
+# script exits non-zero.
+#
+# Usage: DATABASE_URL=postgresql://... python benchmarks/bench_storage_layout.py [meals] [single_saves] [reruns]
+
+import sys
+import time
+import random
+import statistics
+from datetime import datetime, timedelta
+
+from common import bench_user, sample_analysis
+from db import connection
+from migrations import migrate
+from meal_store import bulk_import_meals, add_meal_entry, rebuild_daily_totals
+from aggregates import get_user_data, get_daily_totals
+
+SIZE_SQL = [
+    "CREATE TEMP TABLE size_meals ON COMMIT DROP AS SELECT * FROM meals WHERE user_id = %(user_id)s;",
+    "CREATE TEMP TABLE size_nutrients ON COMMIT DROP AS SELECT n.* FROM meal_nutrients n JOIN meals m ON m.id = n.meal_id WHERE m.user_id = %(user_id)s;",
+    "ALTER TABLE size_meals ADD PRIMARY KEY (id); ALTER TABLE size_nutrients ADD PRIMARY KEY (id);",
+    "CREATE INDEX ON size_meals (user_id, created_at DESC, id DESC) INCLUDE (meal_title);",
+    "CREATE INDEX ON size_nutrients (meal_id) INCLUDE (nutrient_name, amount, unit);",
+    "SELECT pg_total_relation_size('size_meals') + pg_total_relation_size('size_nutrients');",
+]
+
+
+def layout_bytes(user_id):
+    with connection() as conn, conn.cursor() as cur:
+        for statement in SIZE_SQL:
+            cur.execute(statement, {"user_id": user_id})
+        size = cur.fetchone()[0]; conn.commit()
+    return size
+
+
+def median_ms(fn, reruns):
+    samples = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def run_layout(layout, records, singles, start_date, reruns):
+    with bench_user() as user_id:
+        started = time.perf_counter()
+        bulk_import_meals(({**record, "user_id": user_id} for record in records), layout=layout)
+        bulk_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        for analysis in singles:
+            add_meal_entry(user_id, analysis, layout=layout)
+        single_seconds = time.perf_counter() - started
+        result = {
+            "disk MB": layout_bytes(user_id) / 2**20,
+            "bulk meals/s": len(records) / bulk_seconds,
+            "single saves/s": len(singles) / single_seconds,
+            "get_user_data ms": median_ms(lambda: get_user_data(user_id, start_date, layout=layout), reruns),
+            "rollup rebuild ms": median_ms(lambda: rebuild_daily_totals(user_id, layout=layout), reruns),
+            "get_daily_totals ms": median_ms(lambda: get_daily_totals(user_id, start_date), reruns),
+        }
+        sums = get_user_data(user_id, start_date, layout=layout).groupby('nutrient_name')['amount'].sum()
+    return result, sums
+
+
+def main(meal_count, single_count, reruns):
+    migrate()
+    rng = random.Random(42)
+    now = datetime.now()
+    records = [{**sample_analysis(rng), "created_at": (now - timedelta(minutes=rng.randint(0, 90 * 24 * 60))).isoformat()}
+               for _ in range(meal_count)]
+    singles = [sample_analysis(rng) for _ in range(single_count)]
+    start_date = (now - timedelta(days=91)).date()
+    results, sums = {}, {}
+    for layout in ("rows", "wide"):
+        results[layout], sums[layout] = run_layout(layout, records, singles, start_date, reruns)
+    # REAL keeps ~7 significant digits against NUMERIC(10, 3); compare sums relatively.
+    same = sums["rows"].index.equals(sums["wide"].index) and ((sums["rows"] - sums["wide"]).abs() <= sums["rows"].abs() * 1e-5 + 1e-3).all()
+    print(f"{meal_count} imported + {single_count} saved meals per layout, median of {reruns} reads")
+    print(f"{'':<22}{'rows':>12}{'wide':>12}{'wide/rows':>11}")
+    for metric in results["rows"]:
+        rows, wide = results["rows"][metric], results["wide"][metric]
+        print(f"{metric:<22}{rows:>12.2f}{wide:>12.2f}{wide / rows if rows else float('nan'):>10.2f}x")
+    print(f"nutrient sums: {'same' if same else 'DIFFERENT'}")
+    sys.exit(0 if same else 1)
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [5000, 200, 10][len(args):]))
@@ -0,0 +1,49 @@
+# benchmarks/common.py - shared fixtures for the benchmark scripts
+
+import os
+import sys
+import time
+import uuid
+import random
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import connection  # noqa: E402
+from nutrients import NUTRIENTS  # noqa: E402
+
+
+def sample_analysis(rng=random):
+    nutrients = [{"nutrient": name, "amount": round(rng.uniform(0, 500), 3), "unit": unit,
+                  "percent_dv": round(rng.uniform(0, 100), 2)} for name, unit, _ in NUTRIENTS]
+    return {"title": f"Benchmark Meal {rng.randint(1, 10**6)}", "full_text": "Meal Title: Benchmark Meal", "nutrients": nutrients}
+
+
+@contextmanager
+def bench_user():
+    """Create a throwaway user and remove it with all of its meals afterwards."""
+    name = f"bench_{uuid.uuid4().hex[:12]}"
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO users (username, email, password_hash) VALUES (%s, %s, 'x') RETURNING id;", (name, f"{name}@bench.local"))
+        user_id = cur.fetchone()[0]; conn.commit()
+    try:
+        yield user_id
+    finally:
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM daily_nutrient_totals WHERE user_id = %s;", (user_id,))
+            cur.execute("DELETE FROM meals WHERE user_id = %s;", (user_id,))
+            cur.execute("DELETE FROM users WHERE id = %s;", (user_id,))
+            conn.commit()
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile, p in 0-100."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+@contextmanager
+def timer(results, key):
+    started = time.perf_counter()
+    yield
+    results[key] = time.perf_counter() - started
@@ -0,0 +1,102 @@
+# benchmarks/explain_dashboard.py - check that dashboard queries use index scans
+#
+# Seeds a multi-million-row dataset (SEED_USERS users x MEALS_PER_USER meals x 33
+# nutrients), runs EXPLAIN on each dashboard query for one of the seeded users
+# and fails if any plan falls back to a sequential scan on a large table.
+#
+# Usage: DATABASE_URL=postgresql://... python benchmarks/explain_dashboard.py [--drop]
+
+import sys
+import json
+from datetime import date, timedelta
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from db import connection
+from nutrients import NUTRIENTS
+from migrations import migrate
+from meal_store import rebuild_daily_totals
+from aggregates import DASHBOARD_AGGREGATE_SQL, MEAL_PAGE_SQL, USER_DATA_SQL
+from nutrient_storage import ROWS_SOURCE_SQL
+
+SEED_PREFIX = "explain_seed_"
+SEED_USERS = 200
+MEALS_PER_USER = 500
+CHECKED_TABLES = {"meals", "meal_nutrients", "daily_nutrient_totals"}
+
+
+def seed(cur):
+    cur.execute("SELECT id FROM users WHERE username LIKE %s ORDER BY id LIMIT 1;", (SEED_PREFIX + "%",))
+    row = cur.fetchone()
+    if row:
+        return row[0]
+    cur.execute("""
+        INSERT INTO users (username, email, password_hash)
+        SELECT %s || g, %s || g || '@bench.local', 'x' FROM generate_series(1, %s) g;
+    """, (SEED_PREFIX, SEED_PREFIX, SEED_USERS))
+    cur.execute("""
+        INSERT INTO meals (user_id, meal_title, analysis_text, created_at)
+        SELECT u.id, 'Seed Meal ' || g, NULL, now() - (g * interval '7 hours')
+        FROM users u, generate_series(1, %s) g
+        WHERE u.username LIKE %s;
+    """, (MEALS_PER_USER, SEED_PREFIX + "%"))
+    names = [name for name, _, _ in NUTRIENTS]
+    units = [unit for _, unit, _ in NUTRIENTS]
+    cur.execute("""
+        INSERT INTO meal_nutrients (meal_id, nutrient_name, amount, unit)
+        SELECT m.id, n.name, round((random() * 500)::numeric, 3), n.unit
+        FROM meals m JOIN users u ON u.id = m.user_id,
+             unnest(%s::text[], %s::text[]) AS n(name, unit)
+        WHERE u.username LIKE %s;
+    """, (names, units, SEED_PREFIX + "%"))
+    cur.execute("SELECT id FROM users WHERE username LIKE %s ORDER BY id LIMIT 1;", (SEED_PREFIX + "%",))
+    return cur.fetchone()[0]
+
+
+def drop(cur):
+    cur.execute("DELETE FROM daily_nutrient_totals WHERE user_id IN (SELECT id FROM users WHERE username LIKE %s);", (SEED_PREFIX + "%",))
+    cur.execute("DELETE FROM meals WHERE user_id IN (SELECT id FROM users WHERE username LIKE %s);", (SEED_PREFIX + "%",))
+    cur.execute("DELETE FROM users WHERE username LIKE %s;", (SEED_PREFIX + "%",))
+
+
+def scans(plan):
+    """Yield (node type, relation) for every scan node in a JSON plan tree."""
+    if "Relation Name" in plan:
+        yield plan["Node Type"], plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        yield from scans(child)
+
+
+def main():
+    migrate()
+    with connection() as conn, conn.cursor() as cur:
+        if "--drop" in sys.argv:
+            drop(cur); conn.commit(); print("Seed data removed."); return
+        user_id = seed(cur); conn.commit()
+        cur.execute("ANALYZE users; ANALYZE meals; ANALYZE meal_nutrients;")
+        conn.commit()
+    rebuild_daily_totals(layout="rows")
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("ANALYZE daily_nutrient_totals;"); conn.commit()
+        # label -> (sql, params after (user_id, start_date))
+        queries = {
+            "dashboard aggregates (rollup)": (DASHBOARD_AGGREGATE_SQL, ()),
+            "meal history, first page": (MEAL_PAGE_SQL.format(after=""), (21,)),
+            "meal history, deep page": (MEAL_PAGE_SQL.format(after="AND (created_at, id) < (%s, %s)"), (date.today() - timedelta(days=3), 10**9, 21)),
+            "raw nutrient rows": (USER_DATA_SQL.format(nutrients=ROWS_SOURCE_SQL), ()),
+        }
+        failures = 0
+        for label, (sql, extra) in queries.items():
+            for days in (7, 365):
+                cur.execute("EXPLAIN (FORMAT JSON) " + sql.strip().rstrip(';'), (user_id, date.today() - timedelta(days=days)) + extra)
+                plan = cur.fetchone()[0]
+                plan = plan if isinstance(plan, list) else json.loads(plan)
+                nodes = list(scans(plan[0]["Plan"]))
+                seq = [rel for node, rel in nodes if node == "Seq Scan" and rel in CHECKED_TABLES]
+                status = "FAIL" if seq else "ok"
+                failures += bool(seq)
+                print(f"[{status}] {label}, last {days} days: " + ", ".join(f"{node} on {rel}" for node, rel in nodes))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
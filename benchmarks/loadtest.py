@@ -0,0 +1,273 @@
+# benchmarks/loadtest.py - concurrent users against signup/login, analyze+save and the dashboard
+#
+# Drives the same functions app.py calls, from `--concurrency` threads standing
+# in for Streamlit sessions, one scenario at a time for `--duration` seconds:
+#
+#   signup          users.create_user with a fresh name
+#   login           users.authenticate_user for a seeded user
+#   analyze_save    analysis.analyze_image on the stub model, then meal_store.add_meal_entry
+#   dashboard       dashboard_cache.get_dashboard_data (shared cache, as on a rerun)
+#   dashboard_cold  dashboard_cache.build_dashboard_data (every load misses the cache)
+#   user_data       aggregates.get_user_data
+#
+# The dashboard scenarios cycle through every TIME_RANGES range. Each scenario
+# reports p50/p95/p99 latency, throughput, errors and DB round trips per
+# operation (statements counted in db.pool_stats()). The analysis cache is
+# bypassed by fresh random image bytes per call.
+#
+#   python benchmarks/loadtest.py seed [--users 20] [--meals 500]      synthetic users with a year of meals each
+#   python benchmarks/loadtest.py run [--concurrency 16] [--duration 15] [--scenarios login,dashboard]
+#                                     [--save-baseline [FILE]] [--compare [FILE]] [--tolerance 0.2]
+#   python benchmarks/loadtest.py drop                                  remove everything seeded or created
+#
+# --compare exits non-zero if any scenario's p95 rose, or its throughput fell,
+# by more than the tolerance against the baseline, or if it now needs more
+# round trips per operation. Baselines are only comparable on the same machine
+# and scale: each records the host, CPU count and Python version, and --compare
+# warns when they differ. Without FILE both use fixtures/loadtest_baseline.json.
+# No baseline is committed, because numbers from another machine would only
+# produce false alarms. Record one from a known-good commit on the machine that
+# runs the gate (see "Load-test regression gate" in the Readme).
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import platform
+import threading
+from datetime import datetime, timedelta
+
+from common import sample_analysis, percentile
+from db import connection, pool_stats
+from migrations import migrate
+from users import hash_password, create_user, authenticate_user
+from meal_store import add_meal_entry, bulk_import_meals
+from aggregates import get_user_data
+from dashboard_cache import TIME_RANGES, range_start, get_dashboard_data, build_dashboard_data
+from analysis import analyze_image, input_prompt
+from stub_model import StubModel
+from nutrient_storage import NUTRIENT_STORAGE
+
+SEED_PREFIX = "load_"
+LOAD_PASSWORD = "load-test-password"
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "loadtest_baseline.json")
+RANGES = list(TIME_RANGES)
+
+
+# --- SYNTHETIC DATA ---
+def seed(users, meals_per_user, seed=42):
+    """Create `users` load-test users (all with LOAD_PASSWORD) and spread their meals over the last year."""
+    migrate()
+    password_hash = hash_password(LOAD_PASSWORD)
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO users (username, email, password_hash)
+            SELECT %s || g, %s || g || '@load.local', %s FROM generate_series(1, %s) g
+            ON CONFLICT DO NOTHING;
+        """, (SEED_PREFIX, SEED_PREFIX, password_hash, users))
+        cur.execute("SELECT id FROM users WHERE username ~ %s ORDER BY id;", (f"^{SEED_PREFIX}[0-9]+$",))
+        user_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+    rng = random.Random(seed)
+    now = datetime.now()
+    records = ({**sample_analysis(rng), "user_id": user_id,
+                "created_at": (now - timedelta(minutes=rng.randint(0, 365 * 24 * 60))).isoformat()}
+               for user_id in user_ids for _ in range(meals_per_user))
+    meals, nutrients = bulk_import_meals(records)
+    print(f"Seeded {len(user_ids)} users and {meals} meals ({nutrients} nutrients, {NUTRIENT_STORAGE} layout).")
+
+
+def seeded_users():
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id, username FROM users WHERE username ~ %s ORDER BY id;", (f"^{SEED_PREFIX}[0-9]+$",))
+        rows = cur.fetchall()
+        conn.commit()
+    if not rows:
+        sys.exit("No load-test users; run `python benchmarks/loadtest.py seed` first.")
+    return rows
+
+
+def drop():
+    users = "SELECT id FROM users WHERE username LIKE %s"
+    with connection() as conn, conn.cursor() as cur:
+        for table in ("daily_nutrient_totals", "meals", "users"):
+            cur.execute(f"DELETE FROM {table} WHERE {'id' if table == 'users' else 'user_id'} IN ({users});", (SEED_PREFIX.replace("_", r"\_") + "%",))
+        conn.commit()
+    print("Load-test data removed.")
+
+
+# --- SCENARIOS ---
+# Each takes (users, rng, i) where i counts the thread's operations, and returns the range label it used (or None).
+def scenario_signup(users, rng, i):
+    name = f"{SEED_PREFIX}new_{uuid.uuid4().hex[:12]}"
+    if not create_user(name, f"{name}@load.local", LOAD_PASSWORD):
+        raise RuntimeError("signup rejected")
+
+
+def scenario_login(users, rng, i):
+    if authenticate_user(rng.choice(users)[1], LOAD_PASSWORD) is None:
+        raise RuntimeError("login rejected")
+
+
+def make_scenario_analyze_save(model):
+    def scenario_analyze_save(users, rng, i):
+        image = [{"mime_type": "image/jpeg", "data": rng.randbytes(32 * 1024)}]
+        add_meal_entry(rng.choice(users)[0], analyze_image(image, input_prompt, model=model))
+    return scenario_analyze_save
+
+
+def _ranged(fn):
+    def scenario(users, rng, i):
+        label = RANGES[i % len(RANGES)]
+        fn(rng.choice(users)[0], range_start(label))
+        return label
+    return scenario
+
+
+def build_scenarios(stub_latency):
+    return {
+        "signup": scenario_signup,
+        "login": scenario_login,
+        "analyze_save": make_scenario_analyze_save(StubModel(latency=stub_latency)),
+        "dashboard": _ranged(get_dashboard_data),
+        "dashboard_cold": _ranged(build_dashboard_data),
+        "user_data": _ranged(get_user_data),
+    }
+
+
+# --- RUNNER ---
+def run_scenario(op, users, concurrency, duration):
+    samples, by_range, errors = [], {}, []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def session(index):
+        rng = random.Random(index)
+        i = index   # threads start on different ranges
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                label = op(users, rng, i)
+            except Exception as e:
+                with lock: errors.append(f"{type(e).__name__}: {e}")
+                continue
+            finally:
+                i += 1
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                samples.append(elapsed)
+                if label: by_range.setdefault(label, []).append(elapsed)
+
+    statements = pool_stats()["statements"]
+    started = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(concurrency)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    wall = time.perf_counter() - started
+    ops = len(samples) + len(errors)
+    result = {"ops": len(samples), "errors": len(errors), "throughput": len(samples) / wall,
+              "round_trips": (pool_stats()["statements"] - statements) / ops if ops else 0.0}
+    if samples:
+        result.update(p50=percentile(samples, 50), p95=percentile(samples, 95), p99=percentile(samples, 99))
+    if by_range:
+        result["p95_by_range"] = {label: percentile(by_range[label], 95) for label in RANGES if label in by_range}
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+
+def print_results(results):
+    print(f"{'scenario':<16}{'ops':>8}{'err':>6}{'ops/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'trips/op':>10}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['ops']:>8}{r['errors']:>6}{r['throughput']:>9.1f}{r.get('p50', 0):>10.1f}"
+              f"{r.get('p95', 0):>10.1f}{r.get('p99', 0):>10.1f}{r['round_trips']:>10.1f}")
+        if 'p95_by_range' in r:
+            print("    p95 by range: " + ", ".join(f"{label} {ms:.1f}" for label, ms in r['p95_by_range'].items()))
+        if 'first_error' in r:
+            print(f"    first error: {r['first_error']}")
+
+
+def compare(results, baseline, tolerance):
+    """Print the change against a baseline; returns the regressions found."""
+    regressions = []
+    print(f"\ncompared with baseline from {baseline['recorded_at']} (tolerance {tolerance:.0%})")
+    for name, r in results.items():
+        base = baseline["results"].get(name)
+        if base is None or 'p95' not in r or 'p95' not in base:
+            print(f"  {name:<16} no baseline"); continue
+        p95_change = r['p95'] / base['p95'] - 1
+        throughput_change = r['throughput'] / base['throughput'] - 1
+        problems = []
+        if p95_change > tolerance: problems.append(f"p95 +{p95_change:.0%}")
+        if throughput_change < -tolerance: problems.append(f"throughput {throughput_change:.0%}")
+        if r['round_trips'] > base['round_trips'] + 0.5: problems.append(f"round trips {base['round_trips']:.1f} -> {r['round_trips']:.1f}")
+        if r['errors'] and not base['errors']: problems.append(f"{r['errors']} errors")
+        regressions += [f"{name}: {p}" for p in problems]
+        print(f"  {name:<16} p95 {p95_change:+7.1%}  throughput {throughput_change:+7.1%}  "
+              f"round trips {r['round_trips'] - base['round_trips']:+.1f}  {'REGRESSION' if problems else 'ok'}")
+    return regressions
+
+
+def machine():
+    return {"host": platform.node(), "cpus": os.cpu_count(), "python": platform.python_version()}
+
+
+def run(args):
+    if args.compare and not os.path.exists(args.compare):
+        sys.exit(f"no baseline at {args.compare}; record one on this machine from a known-good commit with the same "
+                 f"options and --save-baseline first")
+    migrate()
+    users = seeded_users()
+    scenarios = build_scenarios(args.stub_latency)
+    names = args.scenarios.split(",") if args.scenarios else list(scenarios)
+    unknown = set(names) - set(scenarios)
+    if unknown:
+        sys.exit(f"unknown scenarios: {', '.join(sorted(unknown))}; choose from {', '.join(scenarios)}")
+    print(f"{len(users)} users, {args.concurrency} concurrent sessions, {args.duration}s per scenario, {NUTRIENT_STORAGE} layout")
+    results = {name: run_scenario(scenarios[name], users, args.concurrency, args.duration) for name in names}
+    print_results(results)
+    config = {"users": len(users), "concurrency": args.concurrency, "duration": args.duration,
+              "stub_latency": args.stub_latency, "nutrient_storage": NUTRIENT_STORAGE}
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"recorded_at": datetime.now().isoformat(timespec="seconds"), "machine": machine(), "config": config,
+                       "results": results}, f, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["config"] != config:
+            print(f"\nwarning: baseline was recorded with {baseline['config']}")
+        if baseline.get("machine") != machine():
+            print(f"\nwarning: baseline was recorded on {baseline.get('machine')}, this is {machine()}; timings are not comparable")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            sys.exit("regressions: " + "; ".join(regressions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the analyze / save / dashboard flow.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    seed_parser = commands.add_parser("seed")
+    seed_parser.add_argument("--users", type=int, default=20)
+    seed_parser.add_argument("--meals", type=int, default=500, help="meals per user")
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--duration", type=float, default=15)
+    run_parser.add_argument("--scenarios", help="comma-separated, default all")
+    run_parser.add_argument("--stub-latency", type=float, default=0.0, help="seconds per stub model call")
+    run_parser.add_argument("--save-baseline", nargs="?", const=BASELINE_PATH)
+    run_parser.add_argument("--compare", nargs="?", const=BASELINE_PATH)
+    run_parser.add_argument("--tolerance", type=float, default=0.2)
+    commands.add_parser("drop")
+    args = parser.parse_args()
+    if args.command == "seed": seed(args.users, args.meals)
+    elif args.command == "run": run(args)
+    else: drop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/parse_corpus.py - parse success rate over recorded model responses
+#
+# Runs every response in fixtures/responses.jsonl (well-formed ones plus the
+# format drift seen in practice: title variants, fence variants, trailing commas,
+# placeholders, unit and name variants, structured-output JSON) through the
+# original regex parser and through response_parser. A response counts as parsed
+# when the title matches the recorded one and the expected number of canonical
+# nutrients come back with numeric amounts in canonical units, and any amounts
+# the case lists ("amounts", e.g. "1,200 mg" read as 1200) match.
+# Exits non-zero if the current parser misses any response.
+#
+# Usage: python benchmarks/parse_corpus.py [-v]
+
+import os
+import re
+import sys
+import json
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from nutrients import NUTRIENT_UNITS
+from response_parser import parse_summary_from_response
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "responses.jsonl")
+
+
+def legacy_parse(response_text):
+    """The parser as it was before format drift handling, kept for comparison."""
+    results = {}
+    title_match = re.search(r"Meal Title: (.*)", response_text, re.IGNORECASE)
+    if title_match:
+        results['title'] = title_match.group(1).strip()
+    else:
+        lines = response_text.split('\n')
+        first_meaningful_line = next((line for line in lines if line.strip()), "Untitled Meal")
+        results['title'] = first_meaningful_line.strip().replace('**', '')
+    results['full_text'] = response_text
+    json_match = re.search(r"```json\n([\s\S]*?)\n```", response_text)
+    if json_match:
+        try: results['nutrients'] = json.loads(json_match.group(1))
+        except json.JSONDecodeError: results['nutrients'] = []
+    else: results['nutrients'] = []
+    return results
+
+
+def usable_nutrients(nutrients):
+    """Canonical nutrients with a numeric amount in the canonical unit."""
+    return {n['nutrient'] for n in nutrients if isinstance(n, dict) and NUTRIENT_UNITS.get(n.get('nutrient')) == n.get('unit')
+            and isinstance(n.get('amount'), (int, float)) and not isinstance(n.get('amount'), bool)}
+
+
+def evaluate(parse, case):
+    started = time.perf_counter()
+    results = parse(case["text"])
+    elapsed = time.perf_counter() - started
+    problems = []
+    if results['title'] != case["title"]:
+        problems.append(f"title {results['title'][:40]!r}")
+    found = len(usable_nutrients(results['nutrients']))
+    if found != case["nutrients"]:
+        problems.append(f"{found}/{case['nutrients']} nutrients")
+    amounts = {n.get('nutrient'): n.get('amount') for n in results['nutrients'] if isinstance(n, dict)}
+    for name, expected in case.get("amounts", {}).items():
+        if not isinstance(amounts.get(name), (int, float)) or abs(amounts[name] - expected) > 1e-6:
+            problems.append(f"{name} {amounts.get(name)!r} != {expected}")
+    return problems, elapsed
+
+
+def main(verbose):
+    with open(CORPUS, encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    totals = {}
+    print(f"{'response':<28} {'legacy':<34} current")
+    for case in corpus:
+        row = []
+        for label, parse in (("legacy", legacy_parse), ("current", parse_summary_from_response)):
+            problems, elapsed = evaluate(parse, case)
+            ok, time_total = totals.get(label, (0, 0.0))
+            totals[label] = (ok + (not problems), time_total + elapsed)
+            row.append("ok" if not problems else "; ".join(problems))
+        if verbose or row[1] != "ok" or row[0] != "ok":
+            print(f"{case['name']:<28} {row[0][:34]:<34} {row[1]}")
+    print()
+    for label, (ok, time_total) in totals.items():
+        print(f"{label:<8} {ok}/{len(corpus)} parsed ({ok / len(corpus):.0%}), {time_total / len(corpus) * 1e6:.0f} us/response")
+    sys.exit(0 if totals["current"][0] == len(corpus) else 1)
+
+
+if __name__ == '__main__':
+    main("-v" in sys.argv)
@@ -0,0 +1,84 @@
+# benchmarks/replay_stream_chunks.py - streaming parser vs recorded chunk sequences
+#
+# Replays the recorded (delay, text) chunk sequences in fixtures/stream_chunks.jsonl
+# through StreamingSummaryParser on a virtual clock. For each one it reports when
+# the title, first text and nutrient table become available compared with waiting
+# for the full response, and checks that the streamed result is identical to
+# parse_summary_from_response. The same texts are then re-split at every single
+# position and at random points to check that chunk boundaries never matter.
+# Exits non-zero on any mismatch.
+#
+# Usage: python benchmarks/replay_stream_chunks.py
+
+import os
+import sys
+import json
+import random
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from response_parser import StreamingSummaryParser, parse_summary_from_response
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "stream_chunks.jsonl")
+
+
+def replay(chunks):
+    """Feed chunks, returning (first-seen time per event kind, events, final results, total time)."""
+    parser, clock, first_seen, events = StreamingSummaryParser(), 0.0, {}, []
+
+    def record(new_events):
+        for kind, value in new_events:
+            if kind != "text" or value.strip():
+                first_seen.setdefault(kind, clock)
+            events.append((kind, value))
+
+    for delay, text in chunks:
+        clock += delay
+        record(parser.feed(text))
+    tail, results = parser.finish()
+    record(tail)
+    return first_seen, events, results, clock
+
+
+def seconds(first_seen, kind):
+    return f"{first_seen[kind]:8.2f}" if kind in first_seen else f"{'-':>8}"
+
+
+def check(chunks, expected):
+    _, events, results, _ = replay(chunks)
+    streamed_nutrients = next((value for kind, value in events if kind == "nutrients"), [])
+    problems = []
+    if results != expected:
+        problems.append("final results differ from parse_summary_from_response")
+    if streamed_nutrients != expected["nutrients"]:
+        problems.append("streamed nutrients differ from final nutrients")
+    if sum(kind == "title" for kind, _ in events) != 1:
+        problems.append("expected exactly one title event")
+    return problems
+
+
+def main():
+    with open(FIXTURES, encoding="utf-8") as f:
+        sequences = [json.loads(line) for line in f if line.strip()]
+    rng = random.Random(0)
+    failures = 0
+    print(f"{'sequence':<26} {'title s':>8} {'text s':>8} {'table s':>8} {'full s':>8}  result")
+    for sequence in sequences:
+        chunks = sequence["chunks"]
+        full_text = "".join(text for _, text in chunks)
+        expected = parse_summary_from_response(full_text)
+        first_seen, _, _, total = replay(chunks)
+        problems = check(chunks, expected)
+        for cut in range(len(full_text) + 1):
+            problems += check([(0, full_text[:cut]), (0, full_text[cut:])], expected)
+        for _ in range(50):
+            cuts = sorted(rng.sample(range(len(full_text)), rng.randint(1, 60)))
+            problems += check([(0, full_text[a:b]) for a, b in zip([0] + cuts, cuts + [len(full_text)])], expected)
+        failures += bool(problems)
+        print(f"{sequence['name']:<26} {seconds(first_seen, 'title')} {seconds(first_seen, 'text')} "
+              f"{seconds(first_seen, 'nutrients')} {total:8.2f}  "
+              + ("ok" if not problems else "FAIL: " + "; ".join(sorted(set(problems)))))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+# dashboard_cache.py - dashboard data, computed once per (user, range start, data version)
+
+# Every widget interaction reruns render_dashboard_page. The nutrient matrix,
+# the first page of meal history and the frames derived from them only
+# change when the user's meals do, so they are built once and kept in a
+# process-wide LRU.
+#
+# The key includes the user's row in user_data_versions, which meal_store bumps
+# in the same transaction as every write. A save handled by any server process
+# therefore changes the key everywhere, and stale entries are never served. A
+# rerun costs one primary-key lookup instead of the aggregate queries and the
+# pandas work.
+#
+# With DASHBOARD_CACHE_BACKEND=shared, entries are also written to the state
+# store (state_store.py), so a range built by one replica is not rebuilt by the
+# others. Each process still keeps its own LRU in front of the store. Entries
+# are stored as data, not pickles: the matrix arrays in an .npz archive (loaded
+# with allow_pickle=False) and the meal page as JSON. Reading an entry back
+# runs no code from the store, and replicas on different pandas versions can
+# share entries. The derived frames are recomputed from the matrix on load.
+
+import io
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from aggregates import get_daily_totals, get_meal_page, get_data_version
+from analytics import NutrientMatrix
+from instrumentation import span, register_stats
+from state_store import get_state_store
+
+DASHBOARD_CACHE_MAX_ENTRIES = int(os.getenv("DASHBOARD_CACHE_MAX_ENTRIES", "256"))
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "300"))
+DASHBOARD_CACHE_BACKEND = os.getenv("DASHBOARD_CACHE_BACKEND", "local")     # local | shared
+
+# Dashboard time range label -> length (None = all time), in the order the selectbox shows them.
+TIME_RANGES = {
+    "Last Day": timedelta(days=1), "Last 7 Days": timedelta(days=7),
+    "Last 15 Days": timedelta(days=15), "Last 30 Days": timedelta(days=30),
+    "Last 3 Months": timedelta(days=90), "Last 6 Months": timedelta(days=180),
+    "Last 12 Months": timedelta(days=365), "All Time": None
+}
+
+
+def range_start(label, today=None):
+    """First day of a TIME_RANGES range."""
+    length = TIME_RANGES[label]
+    return (today or date.today()) - length if length else date(1970, 1, 1)
+
+
+class DashboardData:
+    """Everything the dashboard renders for one range. Shared between sessions: treat as read-only."""
+
+    def __init__(self, version, matrix, meals, meals_cursor, macros, vitamins, progress):
+        self.version = version      # user data version the entry was built from
+        self.matrix = matrix        # analytics.NutrientMatrix of daily totals
+        self.totals = matrix.totals     # Series of summed amounts indexed by nutrient name
+        self.meals = meals          # first page of meal history with Date / Time display columns
+        self.meals_cursor = meals_cursor    # keyset cursor for the next page, None if that was all
+        self.macros = macros        # macro pie frame, or None without calorie/macro data
+        self.vitamins = vitamins    # non-zero vitamin totals with unit, %DV and tooltip columns
+        self.progress = progress    # average daily %DV per nutrient with a Daily Value
+
+
+def meal_page(user_id, start_date, after=None):
+    """A page of meal history with display columns, and the cursor for the next one."""
+    meals, cursor = get_meal_page(user_id, start_date, after)
+    if not meals.empty:
+        created_at = pd.to_datetime(meals['created_at'])
+        meals['Date'] = created_at.dt.strftime('%Y-%m-%d')
+        meals['Time'] = created_at.dt.strftime('%H:%M')
+    return meals, cursor
+
+
+def build_dashboard_data(user_id, start_date, version=0):
+    with span("dashboard.build"):
+        totals = get_daily_totals(user_id, start_date)
+        with span("dashboard.matrix"):
+            matrix = NutrientMatrix.from_long(totals)
+            macros, vitamins, progress = matrix.macro_breakdown(), matrix.vitamin_breakdown(), matrix.daily_value_progress()
+        meals, cursor = meal_page(user_id, start_date)
+        return DashboardData(version, matrix, meals, cursor, macros, vitamins, progress)
+
+
+# --- SERIALIZATION ---
+def dashboard_to_bytes(data):
+    """DashboardData as an .npz archive of plain arrays, with the small parts as JSON; no pickled objects."""
+    matrix = data.matrix
+    cursor = None if data.meals_cursor is None else [data.meals_cursor[0].isoformat(), data.meals_cursor[1]]
+    header = {"version": data.version, "nutrients": list(matrix.nutrients), "cursor": cursor,
+              "meals": data.meals.to_json(orient="table", index=False, date_format="iso")}
+    arrays = {"header": np.frombuffer(json.dumps(header).encode(), dtype=np.uint8),
+              "days": matrix.days.values, "values": matrix.values, "present": matrix.present}
+    if matrix.percent is not None:
+        arrays["percent"] = matrix.percent
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def dashboard_from_bytes(payload):
+    """The DashboardData written by dashboard_to_bytes."""
+    with np.load(io.BytesIO(payload), allow_pickle=False) as archive:
+        header = json.loads(archive["header"].tobytes())
+        matrix = NutrientMatrix(pd.DatetimeIndex(archive["days"], name="date"), pd.Index(header["nutrients"], name="nutrient_name"),
+                                archive["values"], archive["present"], archive["percent"] if "percent" in archive else None)
+    meals = pd.read_json(io.StringIO(header["meals"]), orient="table")
+    cursor = header["cursor"] and (datetime.fromisoformat(header["cursor"][0]), header["cursor"][1])
+    return DashboardData(header["version"], matrix, meals, cursor, matrix.macro_breakdown(), matrix.vitamin_breakdown(),
+                         matrix.daily_value_progress())
+
+
+# --- CACHE ---
+class DashboardCache:
+    """LRU of DashboardData bounded by entry count, each entry expiring after `ttl` seconds."""
+
+    def __init__(self, max_entries=DASHBOARD_CACHE_MAX_ENTRIES, ttl=DASHBOARD_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                self._entries.pop(key, None); self.misses += 1
+                return None
+            self._entries.move_to_end(key); self.hits += 1
+            return entry[0]
+
+    def set(self, key, data):
+        with self._lock:
+            self._entries[key] = (data, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+class SharedDashboardCache:
+    """A local DashboardCache in front of the state store, which holds serialized entries for every replica."""
+
+    def __init__(self, store, local=None, ttl=DASHBOARD_CACHE_TTL):
+        self.store = store
+        self.local = local or DashboardCache(ttl=ttl)
+        self.ttl = ttl
+        self.shared_hits = 0
+
+    @staticmethod
+    def _store_key(key):
+        user_id, start_date, version = key
+        return f"dashboard:{user_id}:{start_date.isoformat()}:{version}"
+
+    def get(self, key):
+        data = self.local.get(key)
+        if data is None:
+            payload = self.store.get(self._store_key(key))
+            if payload is not None:
+                data = dashboard_from_bytes(payload)
+                self.local.set(key, data); self.shared_hits += 1
+        return data
+
+    def set(self, key, data):
+        self.local.set(key, data)
+        self.store.set(self._store_key(key), dashboard_to_bytes(data), self.ttl)
+
+    def stats(self):
+        return {**self.local.stats(), "shared_hits": self.shared_hits}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_dashboard_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SharedDashboardCache(get_state_store()) if DASHBOARD_CACHE_BACKEND == "shared" else DashboardCache()
+    return _cache
+
+
+def get_dashboard_data(user_id, start_date, cache=None):
+    """DashboardData for a user's range, rebuilt only when their data version has moved."""
+    cache = cache or get_dashboard_cache()
+    with span("dashboard.version"):
+        version = get_data_version(user_id)
+    key = (user_id, start_date, version)
+    data = cache.get(key)
+    if data is None:
+        data = build_dashboard_data(user_id, start_date, version)
+        cache.set(key, data)
+    return data
+
+
+register_stats("app_dashboard_cache", lambda: _cache.stats() if _cache else {})
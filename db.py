@@ -0,0 +1,137 @@
+# db.py - process-wide pooled database access
+
+# Streamlit re-executes app.py on every interaction, but imported modules stay
+# in sys.modules, so the engine below is built once per server process and
+# shared by every session and every rerun.
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+import psycopg2.extensions
+import sqlalchemy
+from sqlalchemy import event
+from dotenv import load_dotenv
+
+from instrumentation import span, register_stats
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+DB_URL = os.getenv("DATABASE_URL")
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+_engine = None
+_engine_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"connects": 0, "checkouts": 0, "statements": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
+
+def _count_statement():
+    with _stats_lock:
+        _stats["statements"] += 1
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """Counts statements sent to the server (database round trips) in pool_stats()."""
+
+    def execute(self, query, vars=None):
+        _count_statement()
+        with span("db.query"):
+            return super().execute(query, vars)
+
+    def copy_expert(self, sql, file, size=8192):
+        _count_statement()
+        with span("db.copy"):
+            return super().copy_expert(sql, file, size)
+
+
+def _on_connect(dbapi_connection, connection_record):
+    # Every cursor on the pool's connections, including pandas' and execute_values', counts its statements.
+    dbapi_connection.cursor_factory = CountingCursor
+    with _stats_lock:
+        _stats["connects"] += 1
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    with _stats_lock:
+        _stats["checkouts"] += 1
+
+
+def get_engine():
+    """Return the shared SQLAlchemy engine, creating it on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = sqlalchemy.create_engine(
+                    DB_URL,
+                    pool_size=POOL_SIZE,
+                    max_overflow=POOL_MAX_OVERFLOW,
+                    pool_timeout=POOL_TIMEOUT,
+                    pool_recycle=POOL_RECYCLE,
+                    pool_pre_ping=True,
+                )
+                event.listen(engine, "connect", _on_connect)
+                event.listen(engine, "checkout", _on_checkout)
+                _engine = engine
+    return _engine
+
+
+def _record_wait(seconds):
+    with _stats_lock:
+        _stats["wait_seconds_total"] += seconds
+        _stats["wait_seconds_max"] = max(_stats["wait_seconds_max"], seconds)
+
+
+def get_db_connection():
+    """Check a raw psycopg2 connection out of the pool. Calling close() returns it."""
+    started = time.perf_counter()
+    with span("db.connect"):
+        conn = get_engine().raw_connection()
+    _record_wait(time.perf_counter() - started)
+    return conn
+
+
+@contextmanager
+def connection():
+    """Pooled raw connection that is rolled back on error and always returned."""
+    conn = get_db_connection()
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def read_sql(query, params=None):
+    """Run a SELECT through the pool and return a DataFrame."""
+    import pandas as pd     # only the dashboard reads DataFrames; keep pandas off the analyzer's cold start
+    started = time.perf_counter()
+    # The nested db.query span is the server round trip; the rest of db.read_sql is checkout and DataFrame building.
+    with span("db.read_sql"), get_engine().connect() as conn:
+        _record_wait(time.perf_counter() - started)
+        return pd.read_sql_query(query, conn, params=params)
+
+
+def pool_stats():
+    """Snapshot of pool sizing metrics for tuning against concurrent sessions."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["handshakes_avoided"] = stats["checkouts"] - stats["connects"]
+    stats["wait_seconds_avg"] = stats["wait_seconds_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+    if _engine is not None:
+        pool = _engine.pool
+        stats.update(pool_size=pool.size(), checked_out=pool.checkedout(), checked_in=pool.checkedin(), overflow=pool.overflow())
+    else:
+        stats.update(pool_size=POOL_SIZE, checked_out=0, checked_in=0, overflow=0)
+    return stats
+
+
+register_stats("app_db_pool", pool_stats)
@@ -0,0 +1,123 @@
+# export.py - stream a user's meal and nutrient history to CSV or Parquet
+
+# get_user_data() builds a DataFrame of the whole range, which for a long
+# history is millions of (meal x nutrient) rows in memory at once. An export
+# instead reads through a server-side (named) cursor, EXPORT_CHUNK_ROWS rows
+# per round trip, and writes each chunk out before fetching the next: a CSV
+# block, or one Parquet row group. Memory stays flat however long the
+# history is, and rows come from either nutrient storage layout. That bound
+# holds for the CLI, which writes to a file or stdout. The dashboard writes to a
+# temporary file, and Streamlit then reads the finished file into memory once to
+# serve the download.
+#
+# Parquet needs pyarrow, which is optional (`pip install pyarrow`); without it
+# only CSV is offered.
+#
+#   python export.py USER_ID csv|parquet [--since YYYY-MM-DD] [--output FILE]
+
+import io
+import os
+import csv
+import sys
+import uuid
+import argparse
+import tempfile
+import importlib.util
+from datetime import date
+
+from db import connection
+from nutrient_storage import nutrient_source
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "10000"))
+
+EXPORT_COLUMNS = ("meal_id", "eaten_at", "meal_title", "nutrient", "amount", "unit", "percent_dv")
+EXPORT_SQL = """
+    SELECT m.id, m.created_at, m.meal_title, n.nutrient_name, n.amount::float8, n.unit, n.percent_dv::float8
+    FROM meals m {nutrients}
+    WHERE m.user_id = %s AND m.created_at >= %s
+    ORDER BY m.created_at, m.id;
+"""
+# format -> (MIME type, file extension)
+FORMATS = {"csv": ("text/csv", "csv"), "parquet": ("application/vnd.apache.parquet", "parquet")}
+
+
+def available_formats():
+    """The FORMATS that can be written here: Parquet only when pyarrow is installed."""
+    return [fmt for fmt in FORMATS if fmt != "parquet" or importlib.util.find_spec("pyarrow") is not None]
+
+
+def iter_export_chunks(user_id, start_date, chunk_rows=EXPORT_CHUNK_ROWS, layout=None):
+    """Lists of up to `chunk_rows` row tuples (in EXPORT_COLUMNS order), oldest meal first."""
+    source, params = nutrient_source(layout)
+    with connection() as conn:
+        # A named cursor keeps the result set on the server; each fetchmany is one round trip.
+        with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cur:
+            cur.itersize = chunk_rows
+            cur.execute(EXPORT_SQL.format(nutrients=source), (*params, user_id, start_date))
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield rows
+        conn.commit()
+
+
+# --- WRITERS ---
+def write_csv(chunks, out):
+    """Write chunks as UTF-8 CSV to the binary file `out`; returns the number of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    total = 0
+    for rows in chunks:
+        writer.writerows((meal_id, eaten_at.isoformat(), *rest) for meal_id, eaten_at, *rest in rows)
+        out.write(buffer.getvalue().encode("utf-8"))
+        buffer.seek(0); buffer.truncate()
+        total += len(rows)
+    out.write(buffer.getvalue().encode("utf-8"))
+    return total
+
+
+def write_parquet(chunks, out):
+    """Write chunks to the binary file `out` as Parquet, one row group per chunk; returns the number of rows."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([("meal_id", pa.int64()), ("eaten_at", pa.timestamp("us", tz="UTC")), ("meal_title", pa.string()),
+                        ("nutrient", pa.string()), ("amount", pa.float64()), ("unit", pa.string()), ("percent_dv", pa.float64())])
+    total = 0
+    with pq.ParquetWriter(out, schema, compression="zstd") as writer:
+        for rows in chunks:
+            writer.write_batch(pa.record_batch([list(column) for column in zip(*rows)], schema=schema))
+            total += len(rows)
+    return total
+
+
+WRITERS = {"csv": write_csv, "parquet": write_parquet}
+
+
+def export_history(user_id, out, fmt="csv", start_date=None, chunk_rows=EXPORT_CHUNK_ROWS, layout=None):
+    """Stream a user's meals and nutrients since `start_date` (default: all) into `out`; returns the number of rows."""
+    chunks = iter_export_chunks(user_id, start_date or date(1970, 1, 1), chunk_rows, layout)
+    return WRITERS[fmt](chunks, out)
+
+
+def export_file(user_id, fmt="csv", start_date=None):
+    """The export in a temporary file, rewound for reading; it is deleted when closed."""
+    out = tempfile.TemporaryFile()
+    export_history(user_id, out, fmt, start_date)
+    out.seek(0)
+    return out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export a user's meal and nutrient history.")
+    parser.add_argument("user_id", type=int)
+    parser.add_argument("format", choices=list(FORMATS))
+    parser.add_argument("--since", type=date.fromisoformat, help="first day to include (default: all history)")
+    parser.add_argument("--output", help="file to write (default: stdout)")
+    args = parser.parse_args()
+    if args.format not in available_formats():
+        parser.error(f"{args.format} export needs pyarrow: pip install pyarrow")
+    with (open(args.output, "wb") if args.output else sys.stdout.buffer) as out:
+        rows = export_history(args.user_id, out, args.format, args.since)
+    print(f"Exported {rows} rows.", file=sys.stderr)
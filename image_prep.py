@@ -0,0 +1,46 @@
+# image_prep.py - shrink uploads before they are sent to the model
+
+# Phone photos are 8-12 MB, but the model does not need more than ~1024px to
+# recognise a meal. We decode once, fix EXIF orientation, downsample, and
+# re-encode as JPEG; the same decoded image also backs the on-page preview.
+
+import io
+import os
+
+from PIL import Image, ImageOps
+
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1024"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+PREVIEW_MAX_EDGE = 700  # shown at 350px, doubled for high-DPI screens
+
+
+class PreparedImage:
+    def __init__(self, data, mime_type, image, preview, original_bytes):
+        self.data = data                      # re-encoded bytes sent to the model
+        self.mime_type = mime_type
+        self.image = image                    # decoded, oriented, downsampled PIL image
+        self.preview = preview                # small copy for st.image
+        self.original_bytes = original_bytes  # size of the upload, for reporting
+
+    def api_payload(self):
+        return [{"mime_type": self.mime_type, "data": self.data}]
+
+
+def prepare_image(raw_bytes, max_edge=IMAGE_MAX_EDGE, quality=IMAGE_JPEG_QUALITY):
+    image = Image.open(io.BytesIO(raw_bytes))
+    # For JPEGs this lets libjpeg decode straight at a reduced scale (1/2, 1/4, 1/8).
+    image.draft("RGB", (max_edge, max_edge))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image.convert("RGBA"), mask=image.convert("RGBA").getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=quality, optimize=True)
+    preview = image.copy()
+    preview.thumbnail((PREVIEW_MAX_EDGE, PREVIEW_MAX_EDGE), Image.BILINEAR)
+    return PreparedImage(buf.getvalue(), "image/jpeg", image, preview, len(raw_bytes))
@@ -0,0 +1,224 @@
+# instrumentation.py - timing spans, Prometheus metrics and per-rerun profiles
+
+# `with span("db.query"):` times a block. Every span feeds a process-wide
+# latency histogram; that costs two perf_counter() calls and one locked dict
+# update, which is noise next to the work being timed (the hottest span,
+# db.query, wraps a network round trip).
+#
+# A span tree is only built while a profile is active on the current context,
+# which the app does per session when the profiler panel is switched on
+# (PROFILER=on shows the switch). Worker threads (batch analysis) have their
+# own context and only feed the histograms.
+#
+# With METRICS_PORT set, start_metrics_server() serves /metrics in Prometheus
+# text format from a daemon thread: the span histograms plus whatever other
+# modules registered with register_stats() (pool, caches, model client).
+
+import os
+import time
+import bisect
+import warnings
+import threading
+import contextvars
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))     # 0 = no endpoint
+PROFILER = os.getenv("PROFILER", "off")
+# Histogram bucket upper bounds, in seconds.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_current = contextvars.ContextVar("instrumentation_span", default=None)
+_histograms = {}
+_stats_sources = {}
+_lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)     # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+
+def _observe(name, seconds, failed):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        histogram.count += 1; histogram.sum += seconds
+        if failed: histogram.errors += 1
+
+
+class SpanNode:
+    __slots__ = ("name", "started", "duration", "children")
+
+    def __init__(self, name, started):
+        self.name = name
+        self.started = started
+        self.duration = None        # seconds, None while still open
+        self.children = []
+
+
+# --- SPANS ---
+class span:
+    """Context manager timing a block under `name`; also usable as a decorator via timed()."""
+
+    __slots__ = ("name", "started", "node", "token")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        parent = _current.get()
+        self.started = time.perf_counter()
+        if parent is None:
+            self.node = None
+        else:
+            self.node = SpanNode(self.name, self.started)
+            parent.children.append(self.node)
+            self.token = _current.set(self.node)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        if self.node is not None:
+            self.node.duration = elapsed
+            _current.reset(self.token)
+        _observe(self.name, elapsed, exc_type is not None)
+        return False
+
+
+def timed(name):
+    """Decorator form of span()."""
+    def decorate(fn):
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        wrapper.__name__, wrapper.__doc__, wrapper.__wrapped__ = fn.__name__, fn.__doc__, fn
+        return wrapper
+    return decorate
+
+
+# --- PROFILES ---
+def begin_profile(enabled, name="rerun"):
+    """Start collecting a span tree on this context if `enabled`, else stop; returns the root or None.
+
+    Call it at the top of every rerun: it always replaces whatever the previous run
+    on this thread left behind, even if that run was cut short by st.rerun().
+    """
+    root = SpanNode(name, time.perf_counter()) if enabled else None
+    _current.set(root)
+    return root
+
+
+def end_profile(root):
+    if root is not None:
+        root.duration = time.perf_counter() - root.started
+    _current.set(None)
+    return root
+
+
+def format_profile(root, min_ms=0.05):
+    """Indented text tree; repeated sibling spans (e.g. db.query) are folded into one line with a count."""
+    lines = []
+
+    def walk(node, depth):
+        groups = {}
+        for child in node.children:
+            groups.setdefault(child.name, []).append(child)
+        for name, nodes in groups.items():
+            total = sum(n.duration or 0.0 for n in nodes) * 1000
+            if total < min_ms:
+                continue
+            count = f" ×{len(nodes)}" if len(nodes) > 1 else ""
+            lines.append(f"{'  ' * depth}{name}{count}  {total:.1f} ms")
+            if len(nodes) == 1:
+                walk(nodes[0], depth + 1)
+            else:
+                merged = SpanNode(name, 0.0); merged.children = [c for n in nodes for c in n.children]
+                walk(merged, depth + 1)
+    lines.append(f"{root.name}  {(root.duration or 0.0) * 1000:.1f} ms")
+    walk(root, 1)
+    return "\n".join(lines)
+
+
+# --- PROMETHEUS EXPORT ---
+def register_stats(prefix, source):
+    """Export `source()`'s numeric values (and dicts of them, as labelled series) as `<prefix>_<key>` gauges."""
+    with _lock:
+        _stats_sources[prefix] = source
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text():
+    with _lock:
+        snapshot = {name: (list(h.buckets), h.count, h.sum, h.errors) for name, h in _histograms.items()}
+        sources = dict(_stats_sources)
+    lines = ["# HELP app_span_duration_seconds Time spent in instrumented spans.",
+             "# TYPE app_span_duration_seconds histogram"]
+    for name, (buckets, count, total, _) in sorted(snapshot.items()):
+        cumulative = 0
+        for bound, hits in zip(BUCKETS + ("+Inf",), buckets):
+            cumulative += hits
+            lines.append(f'app_span_duration_seconds_bucket{{span="{_label(name)}",le="{bound}"}} {cumulative}')
+        lines.append(f'app_span_duration_seconds_sum{{span="{_label(name)}"}} {total}')
+        lines.append(f'app_span_duration_seconds_count{{span="{_label(name)}"}} {count}')
+    lines += ["# HELP app_span_errors_total Spans that ended with an exception.", "# TYPE app_span_errors_total counter"]
+    lines += [f'app_span_errors_total{{span="{_label(name)}"}} {errors}' for name, (_, _, _, errors) in sorted(snapshot.items())]
+    for prefix, source in sorted(sources.items()):
+        try:
+            values = source()
+        except Exception:
+            continue
+        for key, value in values.items():
+            metric = f"{prefix}_{key}"
+            if isinstance(value, bool) or not isinstance(value, (int, float, dict)):
+                continue
+            lines.append(f"# TYPE {metric} gauge")
+            if isinstance(value, dict):
+                lines += [f'{metric}{{key="{_label(k)}"}} {v}' for k, v in value.items() if isinstance(v, (int, float))]
+            else:
+                lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404); return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics on `port` once per process; a no-op when port is 0 (or binding already failed)."""
+    global _server
+    if not port or _server is not None:
+        return _server or None
+    with _server_lock:
+        if _server is None:
+            try:
+                server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError as e:
+                warnings.warn(f"metrics endpoint not started on port {port}: {e}")
+                _server = False; return None
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+            _server = server
+    return _server
@@ -0,0 +1,171 @@
+# jobs.py - background analysis jobs queued in Postgres
+
+# With ANALYSIS_QUEUE=on, "Analyze Meal" only inserts a row into analysis_jobs
+# and polls it; the model call runs in worker processes started with
+# `python jobs.py worker N`. Workers claim rows with FOR UPDATE SKIP LOCKED, so
+# any number of them, on any number of hosts, share the queue without handing
+# the same job out twice, and the web tier never waits on the model.
+#
+# A job's key is the analysis cache key (image + prompt + model), so double
+# clicks, page refreshes and identical uploads from many users all map to one
+# job. A failed job is queued again when it is resubmitted. A job whose worker
+# died is reclaimed once its lease runs out; after JOB_MAX_ATTEMPTS claims it
+# is marked failed. Finished jobs are purged after JOB_RETENTION seconds.
+#
+#   python jobs.py worker [processes]      run a worker pool (default JOB_WORKERS)
+
+import os
+import sys
+import time
+import json
+import signal
+import multiprocessing
+
+from db import connection
+from analysis import analyze_image, get_model
+from analysis_cache import cache_key
+
+ANALYSIS_QUEUE = os.getenv("ANALYSIS_QUEUE", "off")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_LEASE = int(os.getenv("JOB_LEASE", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", str(24 * 3600)))
+PURGE_EVERY = 200
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+SUBMIT_SQL = """
+    INSERT INTO analysis_jobs (job_key, user_id, mime_type, image, prompt)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (job_key) DO UPDATE
+    SET status = 'queued', attempts = 0, error = NULL, image = EXCLUDED.image, created_at = now(), finished_at = NULL
+    WHERE analysis_jobs.status = 'failed';
+"""
+# The oldest claimable job: queued, or running on a worker whose lease has run out.
+CLAIM_SQL = """
+    UPDATE analysis_jobs j
+    SET status = 'running', attempts = j.attempts + 1, started_at = now(),
+        lease_expires_at = now() + %s * interval '1 second'
+    WHERE j.id = (
+        SELECT id FROM analysis_jobs
+        WHERE status = 'queued' OR (status = 'running' AND lease_expires_at < now())
+        ORDER BY id LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING j.id, j.mime_type, j.image, j.prompt, j.attempts;
+"""
+FINISH_SQL = """
+    UPDATE analysis_jobs SET status = %s, result = %s::jsonb, error = %s, image = NULL, finished_at = now()
+    WHERE id = %s;
+"""
+JOB_SQL = """
+    SELECT status, result, error,
+           CASE WHEN status = 'queued' THEN (SELECT count(*) FROM analysis_jobs q WHERE q.status = 'queued' AND q.id < j.id) END
+    FROM analysis_jobs j WHERE job_key = %s;
+"""
+PURGE_SQL = "DELETE FROM analysis_jobs WHERE finished_at < now() - %s * interval '1 second';"
+
+
+# --- SUBMITTING & POLLING (web tier) ---
+def submit_job(image_data, prompt, user_id=None, model=None):
+    """Queue an analysis and return its job key; resubmitting the same work returns the same key."""
+    model = model or get_model()
+    part = image_data[0]
+    job_key = cache_key(part['data'], prompt, model.model_name)
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(SUBMIT_SQL, (job_key, user_id, part['mime_type'], part['data'], prompt))
+        conn.commit()
+    return job_key
+
+
+def get_job(job_key):
+    """``{"status", "result", "error", "ahead"}`` for a job, or None if it does not exist (or was purged)."""
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(JOB_SQL, (job_key,))
+        row = cur.fetchone()
+        conn.commit()
+    if row is None:
+        return None
+    status, result, error, ahead = row
+    return {"status": status, "result": result, "error": error, "ahead": ahead}
+
+
+# --- WORKERS ---
+def claim_job(lease=JOB_LEASE):
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(CLAIM_SQL, (lease,))
+        row = cur.fetchone()
+        conn.commit()
+    return row
+
+
+def finish_job(job_id, result=None, error=None):
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(FINISH_SQL, (FAILED if error else DONE, json.dumps(result) if result is not None else None, error, job_id))
+        conn.commit()
+
+
+def purge_jobs(retention=JOB_RETENTION):
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(PURGE_SQL, (retention,))
+        conn.commit()
+
+
+def run_job(job, model=None):
+    job_id, mime_type, image, prompt, attempts = job
+    if attempts > JOB_MAX_ATTEMPTS:
+        finish_job(job_id, error=f"gave up after {JOB_MAX_ATTEMPTS} attempts (worker lost)"); return
+    try:
+        # The model client already retries transient errors; anything that escapes is final.
+        analysis = analyze_image([{"mime_type": mime_type, "data": bytes(image)}], prompt, model=model)
+    except Exception as e:
+        finish_job(job_id, error=f"{type(e).__name__}: {e}"); return
+    finish_job(job_id, result=analysis)
+
+
+def work(stop=None, model=None, poll_interval=JOB_POLL_INTERVAL):
+    """Claim and run jobs one at a time until `stop` (an Event) is set. Returns the number run."""
+    done = 0
+    while not (stop and stop.is_set()):
+        job = claim_job()
+        if job is None:
+            stop.wait(poll_interval) if stop else time.sleep(poll_interval)
+            continue
+        run_job(job, model); done += 1
+        if done % PURGE_EVERY == 0:
+            purge_jobs()
+    return done
+
+
+def _worker_main(stop):
+    # Ctrl+C reaches the whole process group; let the parent decide, and finish the current job.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(stop)
+
+
+def run_worker_pool(processes=JOB_WORKERS):
+    """Run `processes` worker processes until SIGINT/SIGTERM, then let them finish their current job."""
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    workers = [context.Process(target=_worker_main, args=(stop,), name=f"analysis-worker-{i}") for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        while not stop.is_set() and any(worker.is_alive() for worker in workers):
+            stop.wait(1)
+    except KeyboardInterrupt:
+        pass
+    stop.set()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'worker':
+        processes = int(sys.argv[2]) if len(sys.argv) > 2 else JOB_WORKERS
+        print(f"Starting {processes} analysis workers (model: {get_model().model_name}).")
+        run_worker_pool(processes)
+    else:
+        sys.exit("usage: python jobs.py worker [PROCESSES]")
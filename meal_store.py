@@ -0,0 +1,293 @@
+# meal_store.py - meal persistence: single saves and bulk backfills
+
+import io
+import csv
+import sys
+import json
+from datetime import datetime
+
+from psycopg2.extras import execute_values
+
+from db import connection
+from response_parser import clean_title
+from nutrient_storage import resolve_layout, nutrient_source, wide_values, pg_array
+from nutrients import NUTRIENT_NAMES, DAILY_VALUES, stored_percent_dv, normalize_nutrients
+from near_duplicates import to_signed
+
+MEAL_INSERT_SQL = "INSERT INTO meals (user_id, meal_title, analysis_text, created_at, image_hash) VALUES (%s, %s, %s, %s, %s) RETURNING id;"
+WIDE_MEAL_INSERT_SQL = """
+    INSERT INTO meals (user_id, meal_title, analysis_text, created_at, image_hash, nutrient_amounts, nutrient_dv, extra_nutrients)
+    VALUES (%s, %s, %s, %s, %s, %s::real[], %s::real[], %s::jsonb) RETURNING id;
+"""
+NUTRIENT_INSERT_SQL = "INSERT INTO meal_nutrients (meal_id, nutrient_name, amount, unit, percent_dv) VALUES %s;"
+IMPORT_BATCH_SIZE = 1000
+BACKFILL_BATCH_SIZE = 5000      # meals (or users, for the rollup) per backfill transaction
+
+# daily_nutrient_totals is a rollup of meal nutrients per (user, day, nutrient),
+# read from either storage layout (nutrient_storage.py). It is updated in the
+# same transaction as every write below, so the dashboard can read it instead of
+# scanning the full meal history. percent_dv is the day's summed %DV (NULL for
+# nutrients without a Daily Value), so goal progress needs no unit conversion.
+ROLLUP_UPSERT_SQL = """
+    INSERT INTO daily_nutrient_totals (user_id, day, nutrient_name, amount, entries, percent_dv)
+    SELECT m.user_id, m.created_at::date, n.nutrient_name, COALESCE(SUM(n.amount), 0), COUNT(*), SUM(n.percent_dv)
+    FROM meals m {nutrients}
+    WHERE m.id = ANY(%s)
+    GROUP BY m.user_id, m.created_at::date, n.nutrient_name
+    ON CONFLICT (user_id, day, nutrient_name) DO UPDATE
+    SET amount = daily_nutrient_totals.amount + EXCLUDED.amount,
+        entries = daily_nutrient_totals.entries + EXCLUDED.entries,
+        percent_dv = COALESCE(daily_nutrient_totals.percent_dv + EXCLUDED.percent_dv, daily_nutrient_totals.percent_dv, EXCLUDED.percent_dv);
+"""
+ROLLUP_REBUILD_SQL = """
+    INSERT INTO daily_nutrient_totals (user_id, day, nutrient_name, amount, entries, percent_dv)
+    SELECT m.user_id, m.created_at::date, n.nutrient_name, COALESCE(SUM(n.amount), 0), COUNT(*), SUM(n.percent_dv)
+    FROM meals m {nutrients}
+    {where}
+    GROUP BY m.user_id, m.created_at::date, n.nutrient_name;
+"""
+
+# user_data_versions.version changes whenever a user's meals do, so caches in
+# any server process can key on it (see dashboard_cache.py).
+DATA_VERSION_BUMP_SQL = """
+    INSERT INTO user_data_versions (user_id, version)
+    SELECT DISTINCT user_id, 1 FROM {source}
+    ON CONFLICT (user_id) DO UPDATE SET version = user_data_versions.version + 1;
+"""
+
+
+# Fills the wide columns of meals that only have meal_nutrients rows
+# (`backfill-wide`). Positions follow the registry passed as the first
+# parameter; names outside it go to extra_nutrients.
+WIDE_BACKFILL_SQL = """
+    UPDATE meals m
+    SET nutrient_amounts = w.amounts, nutrient_dv = w.dv, extra_nutrients = w.extra
+    FROM (
+        SELECT mm.id,
+               ARRAY(SELECT (SELECT n.amount::real FROM meal_nutrients n WHERE n.meal_id = mm.id AND n.nutrient_name = r.name ORDER BY n.id LIMIT 1)
+                     FROM unnest(%s::text[]) WITH ORDINALITY AS r(name, pos) ORDER BY r.pos) AS amounts,
+               ARRAY(SELECT (SELECT n.percent_dv::real FROM meal_nutrients n WHERE n.meal_id = mm.id AND n.nutrient_name = r.name ORDER BY n.id LIMIT 1)
+                     FROM unnest(%s::text[]) WITH ORDINALITY AS r(name, pos) ORDER BY r.pos) AS dv,
+               (SELECT jsonb_object_agg(n.nutrient_name, jsonb_build_object('amount', n.amount, 'unit', n.unit, 'percent_dv', n.percent_dv))
+                FROM meal_nutrients n WHERE n.meal_id = mm.id AND n.nutrient_name <> ALL(%s::text[])) AS extra
+        FROM meals mm
+        WHERE mm.nutrient_amounts IS NULL AND EXISTS (SELECT 1 FROM meal_nutrients n WHERE n.meal_id = mm.id)
+    ) w
+    WHERE m.id = w.id;
+"""
+WIDE_BACKFILL_PARAMS = (NUTRIENT_NAMES, NUTRIENT_NAMES, NUTRIENT_NAMES)
+
+# Recompute stored %DVs from amounts and nutrients.DAILY_VALUES (`backfill-dv`),
+# replacing whatever the model reported, one id range per transaction. The second
+# parameter lines up with the registry and is NULL for nutrients without a Daily Value.
+DV_BACKFILL_SQL = """
+    UPDATE meal_nutrients n SET percent_dv = round((n.amount / t.dv * 100)::numeric, 1)
+    FROM unnest(%s::text[], %s::float8[]) AS t(name, dv)
+    WHERE n.nutrient_name = t.name AND n.meal_id BETWEEN %s AND %s;
+"""
+WIDE_DV_BACKFILL_SQL = """
+    UPDATE meals SET nutrient_dv = ARRAY(
+        SELECT round((w.amount / w.dv * 100)::numeric, 1)::real
+        FROM unnest(nutrient_amounts, %s::float8[]) WITH ORDINALITY AS w(amount, dv, pos) ORDER BY w.pos)
+    WHERE nutrient_amounts IS NOT NULL AND id BETWEEN %s AND %s;
+"""
+ROLLUP_DV_BACKFILL_SQL = """
+    UPDATE daily_nutrient_totals d SET percent_dv = round((d.amount / t.dv * 100)::numeric, 1)
+    FROM unnest(%s::text[], %s::float8[]) AS t(name, dv)
+    WHERE d.nutrient_name = t.name AND t.dv IS NOT NULL AND d.user_id BETWEEN %s AND %s;
+"""
+DAILY_VALUE_LIST = [DAILY_VALUES.get(name) for name in NUTRIENT_NAMES]
+
+
+def _meal_title(title):
+    # Titles are stored cleaned so that readers never need to post-process them.
+    return clean_title(title or "") or "Untitled Meal"
+
+
+def _nutrient_rows(meal_id, nutrients):
+    return [(meal_id, n.get('nutrient'), n.get('amount'), n.get('unit'), stored_percent_dv(n)) for n in nutrients]
+
+
+def _insert_meal(cur, user_id, meal_analysis, created_at, layout):
+    title = _meal_title(meal_analysis['title'])
+    # Set by the app from the photo (near_duplicates.image_hash); absent for imports and scripts.
+    image_hash = meal_analysis.get('image_hash')
+    image_hash = to_signed(image_hash) if image_hash is not None else None
+    # Canonical names, units and %DV whatever the caller passed; a no-op for parser output.
+    nutrients = normalize_nutrients(meal_analysis['nutrients'])
+    if layout == "wide":
+        # The whole analysis is one row.
+        cur.execute(WIDE_MEAL_INSERT_SQL, (user_id, title, meal_analysis['full_text'], created_at, image_hash, *wide_values(nutrients)))
+        return cur.fetchone()[0]
+    cur.execute(MEAL_INSERT_SQL, (user_id, title, meal_analysis['full_text'], created_at, image_hash))
+    meal_id = cur.fetchone()[0]
+    rows = _nutrient_rows(meal_id, nutrients)
+    if rows:
+        # One multi-row VALUES statement instead of one INSERT per nutrient.
+        execute_values(cur, NUTRIENT_INSERT_SQL, rows, page_size=len(rows))
+    return meal_id
+
+
+def _update_rollup(cur, meal_ids, layout):
+    source, params = nutrient_source(layout)
+    cur.execute(ROLLUP_UPSERT_SQL.format(nutrients=source), (*params, list(meal_ids)))
+    cur.execute(DATA_VERSION_BUMP_SQL.format(source="meals WHERE id = ANY(%s)"), (list(meal_ids),))
+
+
+def add_meal_entry(user_id, meal_analysis, created_at=None, layout=None):
+    """Save one parsed analysis and its nutrients in a single transaction."""
+    layout = resolve_layout(layout)
+    with connection() as conn:
+        with conn.cursor() as cur:
+            meal_id = _insert_meal(cur, user_id, meal_analysis, created_at or datetime.now(), layout)
+            _update_rollup(cur, [meal_id], layout)
+        conn.commit()
+    return meal_id
+
+
+def add_meal_entries(user_id, meal_analyses, layout=None):
+    """Save several parsed analyses for one user in a single transaction."""
+    layout = resolve_layout(layout)
+    with connection() as conn:
+        with conn.cursor() as cur:
+            now = datetime.now()
+            meal_ids = [_insert_meal(cur, user_id, analysis, now, layout) for analysis in meal_analyses]
+            _update_rollup(cur, meal_ids, layout)
+        conn.commit()
+    return meal_ids
+
+
+# --- BULK IMPORT (COPY) ---
+def _copy_buffer(rows):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    return buf
+
+
+def _copy_batch(cur, batch, layout):
+    cur.execute("SELECT nextval(pg_get_serial_sequence('meals', 'id')) FROM generate_series(1, %s);", (len(batch),))
+    meal_ids = [row[0] for row in cur.fetchall()]
+    meal_rows, nutrient_rows, nutrients_written = [], [], 0
+    for meal_id, record in zip(meal_ids, batch):
+        nutrients = normalize_nutrients(record.get('nutrients'))
+        row = (meal_id, record['user_id'], _meal_title(record['title']),
+               record.get('full_text'), record.get('created_at') or datetime.now().isoformat())
+        if layout == "wide":
+            amounts, percent_dv, extras = wide_values(nutrients)
+            row += (pg_array(amounts), pg_array(percent_dv), extras)
+        else:
+            nutrient_rows.extend(_nutrient_rows(meal_id, nutrients))
+        meal_rows.append(row); nutrients_written += len(nutrients)
+    if layout == "wide":
+        cur.copy_expert("COPY meals (id, user_id, meal_title, analysis_text, created_at, nutrient_amounts, nutrient_dv, extra_nutrients) "
+                        "FROM STDIN WITH (FORMAT csv)", _copy_buffer(meal_rows))
+    else:
+        cur.copy_expert("COPY meals (id, user_id, meal_title, analysis_text, created_at) FROM STDIN WITH (FORMAT csv)", _copy_buffer(meal_rows))
+        cur.copy_expert("COPY meal_nutrients (meal_id, nutrient_name, amount, unit, percent_dv) FROM STDIN WITH (FORMAT csv)", _copy_buffer(nutrient_rows))
+    _update_rollup(cur, meal_ids, layout)
+    return len(meal_rows), nutrients_written
+
+
+def bulk_import_meals(records, batch_size=IMPORT_BATCH_SIZE, layout=None):
+    """Stream already-parsed analyses into the database with COPY.
+
+    Each record is a dict with ``user_id``, ``title``, ``full_text``, ``nutrients``
+    and an optional ISO ``created_at``. Records are consumed lazily and each batch
+    is committed on its own, so arbitrarily large backfills run in constant memory.
+    Returns ``(meals_written, nutrients_written)``.
+    """
+    layout = resolve_layout(layout)
+    meals_written = nutrients_written = 0
+    with connection() as conn:
+        with conn.cursor() as cur:
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    m, n = _copy_batch(cur, batch, layout); conn.commit()
+                    meals_written += m; nutrients_written += n; batch = []
+            if batch:
+                m, n = _copy_batch(cur, batch, layout); conn.commit()
+                meals_written += m; nutrients_written += n
+    return meals_written, nutrients_written
+
+
+def rebuild_daily_totals(user_id=None, layout=None):
+    """Recompute the daily rollup from the stored nutrients, for one user or everyone."""
+    source, params = nutrient_source(layout)
+    with connection() as conn:
+        with conn.cursor() as cur:
+            # Block concurrent saves so none of them is counted twice or missed.
+            cur.execute("LOCK TABLE daily_nutrient_totals IN EXCLUSIVE MODE;")
+            if user_id is None:
+                cur.execute("DELETE FROM daily_nutrient_totals;")
+                cur.execute(ROLLUP_REBUILD_SQL.format(nutrients=source, where=""), params)
+                rows = cur.rowcount
+                cur.execute(DATA_VERSION_BUMP_SQL.format(source="(SELECT id AS user_id FROM users) u"))
+            else:
+                cur.execute("DELETE FROM daily_nutrient_totals WHERE user_id = %s;", (user_id,))
+                cur.execute(ROLLUP_REBUILD_SQL.format(nutrients=source, where="WHERE m.user_id = %s"), (*params, user_id))
+                rows = cur.rowcount
+                cur.execute(DATA_VERSION_BUMP_SQL.format(source="(SELECT %s::int AS user_id) u"), (user_id,))
+        conn.commit()
+    return rows
+
+
+def backfill_wide_nutrients():
+    """Fill the wide nutrient columns of meals saved in rows mode. Returns the meals updated."""
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(WIDE_BACKFILL_SQL, WIDE_BACKFILL_PARAMS)
+            rows = cur.rowcount
+        conn.commit()
+    return rows
+
+
+def backfill_percent_dv(batch_size=BACKFILL_BATCH_SIZE):
+    """Recompute stored %DVs from nutrients.DAILY_VALUES, committing per id range. Returns the rows updated."""
+    rows = 0
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COALESCE(max(id), 0) FROM meals;")
+            last_meal = cur.fetchone()[0]
+            for low in range(1, last_meal + 1, batch_size):
+                high = low + batch_size - 1
+                cur.execute(DV_BACKFILL_SQL, (NUTRIENT_NAMES, DAILY_VALUE_LIST, low, high)); rows += cur.rowcount
+                cur.execute(WIDE_DV_BACKFILL_SQL, (DAILY_VALUE_LIST, low, high)); rows += cur.rowcount
+                conn.commit()
+            cur.execute("SELECT COALESCE(max(id), 0) FROM users;")
+            last_user = cur.fetchone()[0]
+            for low in range(1, last_user + 1, batch_size):
+                high = low + batch_size - 1
+                cur.execute(ROLLUP_DV_BACKFILL_SQL, (NUTRIENT_NAMES, DAILY_VALUE_LIST, low, high)); rows += cur.rowcount
+                cur.execute(DATA_VERSION_BUMP_SQL.format(source="(SELECT id AS user_id FROM users WHERE id BETWEEN %s AND %s) u"), (low, high))
+                conn.commit()
+    return rows
+
+
+def iter_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+if __name__ == '__main__':
+    # python meal_store.py import history.jsonl
+    # python meal_store.py rebuild-rollup [user_id]
+    # python meal_store.py backfill-wide
+    # python meal_store.py backfill-dv
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == 'import':
+        meals, nutrients = bulk_import_meals(iter_jsonl(sys.argv[2]))
+        print(f"Imported {meals} meals and {nutrients} nutrients.")
+    elif command == 'rebuild-rollup':
+        rows = rebuild_daily_totals(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+        print(f"Rebuilt {rows} daily nutrient total rows.")
+    elif command == 'backfill-wide':
+        print(f"Filled wide nutrient columns for {backfill_wide_nutrients()} meals.")
+    elif command == 'backfill-dv':
+        print(f"Recomputed %DV on {backfill_percent_dv()} rows.")
+    else:
+        sys.exit("usage: python meal_store.py import FILE.jsonl | rebuild-rollup [USER_ID] | backfill-wide | backfill-dv")
@@ -0,0 +1,214 @@
+# migrations.py - versioned schema migrations
+
+# Migrations are applied in version order and recorded in schema_migrations.
+# Never edit a migration that has shipped; append a new one instead. A statement
+# is either SQL or an (SQL, params) pair.
+#
+#   python migrations.py            apply pending migrations
+#   python migrations.py status     list applied and pending versions
+
+import sys
+import threading
+
+from db import connection
+
+MIGRATIONS = [
+    (1, "initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY, username VARCHAR(50) UNIQUE NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL, password_hash VARCHAR(255) NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS meals (
+            id SERIAL PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users(id),
+            meal_title TEXT NOT NULL, analysis_text TEXT,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS meal_nutrients (
+            id SERIAL PRIMARY KEY, meal_id INTEGER NOT NULL REFERENCES meals(id) ON DELETE CASCADE,
+            nutrient_name TEXT NOT NULL, amount NUMERIC(10, 3), unit VARCHAR(20),
+            percent_dv NUMERIC(6, 2)
+        );
+        """,
+    ]),
+    (2, "daily nutrient rollup", [
+        """
+        CREATE TABLE IF NOT EXISTS daily_nutrient_totals (
+            user_id INTEGER NOT NULL REFERENCES users(id), day DATE NOT NULL,
+            nutrient_name TEXT NOT NULL, amount NUMERIC(14, 3) NOT NULL DEFAULT 0,
+            entries INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (user_id, day, nutrient_name)
+        );
+        """,
+    ]),
+    (3, "dashboard indexes", [
+        # Every dashboard query filters meals on user_id + created_at range.
+        "CREATE INDEX IF NOT EXISTS idx_meals_user_created ON meals (user_id, created_at DESC, id) INCLUDE (meal_title);",
+        # Joins from meals to their nutrients; covering so the heap is not visited.
+        "CREATE INDEX IF NOT EXISTS idx_meal_nutrients_meal ON meal_nutrients (meal_id) INCLUDE (nutrient_name, amount, unit);",
+    ]),
+    (4, "analysis cache", [
+        """
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            key CHAR(64) PRIMARY KEY, payload BYTEA NOT NULL,
+            expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_analysis_cache_expires ON analysis_cache (expires_at);",
+    ]),
+    (5, "user data versions", [
+        # Bumped in the same transaction as every meal write; dashboard caches key on it.
+        """
+        CREATE TABLE IF NOT EXISTS user_data_versions (
+            user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            version BIGINT NOT NULL DEFAULT 0
+        );
+        """,
+    ]),
+    (6, "meal history keyset index, clean titles", [
+        # Meal history pages on (created_at, id) DESC; the index must match that order.
+        "CREATE INDEX IF NOT EXISTS idx_meals_user_created_id ON meals (user_id, created_at DESC, id DESC) INCLUDE (meal_title);",
+        "DROP INDEX IF EXISTS idx_meals_user_created;",
+        # Titles are cleaned on write from now on; strip "1. **Meal Title:**" style prefixes from old rows once.
+        r"""
+        UPDATE meals SET meal_title = COALESCE(NULLIF(btrim(replace(
+            regexp_replace(regexp_replace(meal_title,
+                '^\s*(\d+\.\s*)?\**\s*meal\s+title\s*\**\s*[:\-–]\s*', '', 'i'),
+                '^\s*\**\s*meal\s+title\s*\**\s*[:\-–]\s*', '', 'i'),
+            '*', '')), ''), 'Untitled Meal')
+        WHERE meal_title ~* 'meal\s+title' OR meal_title LIKE '%*%' OR btrim(meal_title) = '';
+        """,
+    ]),
+    (7, "wide nutrient columns on meals", [
+        # Alternative to meal_nutrients, selected with NUTRIENT_STORAGE=wide (see nutrient_storage.py).
+        # Columns only: copying existing meals is `python meal_store.py backfill-wide`, run when switching.
+        """
+        ALTER TABLE meals ADD COLUMN IF NOT EXISTS nutrient_amounts REAL[],
+                          ADD COLUMN IF NOT EXISTS nutrient_dv REAL[],
+                          ADD COLUMN IF NOT EXISTS extra_nutrients JSONB;
+        """,
+    ]),
+    (8, "analysis job queue", [
+        # See jobs.py. job_key is the analysis cache key, which makes submission idempotent.
+        """
+        CREATE TABLE IF NOT EXISTS analysis_jobs (
+            id BIGSERIAL PRIMARY KEY, job_key CHAR(64) UNIQUE NOT NULL,
+            user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+            status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+            mime_type TEXT NOT NULL, image BYTEA, prompt TEXT NOT NULL,
+            result JSONB, error TEXT, attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP WITH TIME ZONE, lease_expires_at TIMESTAMP WITH TIME ZONE,
+            finished_at TIMESTAMP WITH TIME ZONE
+        );
+        """,
+        # Workers only ever look at unfinished jobs; keep that index small.
+        "CREATE INDEX IF NOT EXISTS idx_analysis_jobs_pending ON analysis_jobs (id) WHERE status IN ('queued', 'running');",
+        "CREATE INDEX IF NOT EXISTS idx_analysis_jobs_finished ON analysis_jobs (finished_at) WHERE finished_at IS NOT NULL;",
+    ]),
+    (9, "meal image hashes", [
+        # 64-bit dHash of the photo, stored signed (see near_duplicates.py); NULL for imported meals.
+        "ALTER TABLE meals ADD COLUMN IF NOT EXISTS image_hash BIGINT;",
+        "CREATE INDEX IF NOT EXISTS idx_meals_user_image_hash ON meals (user_id, id) INCLUDE (image_hash) WHERE image_hash IS NOT NULL;",
+    ]),
+    (10, "percent daily values computed at save", [
+        # %DV is computed from nutrients.DAILY_VALUES on write; NUMERIC(6, 2) overflowed on big meals.
+        # Recomputing it for existing rows is `python meal_store.py backfill-dv`, batched and run by hand.
+        "ALTER TABLE meal_nutrients ALTER COLUMN percent_dv TYPE REAL;",
+        # The day's summed %DV per nutrient, kept up to date by meal_store's rollup upsert.
+        "ALTER TABLE daily_nutrient_totals ADD COLUMN IF NOT EXISTS percent_dv REAL;",
+    ]),
+    (11, "shared state store", [
+        # STATE_BACKEND=postgres (see state_store.py): session state and dashboard data shared by all replicas.
+        """
+        CREATE TABLE IF NOT EXISTS shared_state (
+            key TEXT PRIMARY KEY, payload BYTEA NOT NULL,
+            expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_shared_state_expires ON shared_state (expires_at);",
+    ]),
+    (12, "invalidate dashboards built before the rollup", [
+        # Migration 2 created the rollup empty. Filling it rewrites the table under a lock that blocks
+        # saves, so it is an operator step (`python meal_store.py rebuild-rollup`), not a startup one.
+        # Bumping every user's data version here drops dashboards cached from the old queries.
+        """
+        INSERT INTO user_data_versions (user_id, version) SELECT id, 1 FROM users
+        ON CONFLICT (user_id) DO UPDATE SET version = user_data_versions.version + 1;
+        """,
+    ]),
+]
+
+# Arbitrary constant used as a Postgres advisory lock key so that several app
+# processes starting together apply migrations exactly once.
+MIGRATION_LOCK_KEY = 7310452
+
+_checked = False
+_checked_lock = threading.Lock()
+
+
+def _ensure_version_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY, name TEXT NOT NULL,
+            applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+
+def applied_versions():
+    with connection() as conn, conn.cursor() as cur:
+        _ensure_version_table(cur)
+        cur.execute("SELECT version FROM schema_migrations;")
+        versions = {row[0] for row in cur.fetchall()}
+        conn.commit()
+    return versions
+
+
+def migrate():
+    """Apply pending migrations, each in its own transaction. Returns the versions applied."""
+    applied = []
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_KEY,))
+        try:
+            _ensure_version_table(cur)
+            conn.commit()
+            cur.execute("SELECT version FROM schema_migrations;")
+            done = {row[0] for row in cur.fetchall()}
+            for version, name, statements in sorted(MIGRATIONS):
+                if version in done:
+                    continue
+                for statement in statements:
+                    sql, params = statement if isinstance(statement, tuple) else (statement, None)
+                    cur.execute(sql, params)
+                cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s);", (version, name))
+                conn.commit()
+                applied.append(version)
+        finally:
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_KEY,))
+            conn.commit()
+    return applied
+
+
+def ensure_schema():
+    """Run migrate() once per process; later calls are free."""
+    global _checked
+    if not _checked:
+        with _checked_lock:
+            if not _checked:
+                migrate()
+                _checked = True
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'status':
+        done = applied_versions()
+        for version, name, _ in sorted(MIGRATIONS):
+            print(f"{version:>4}  {'applied' if version in done else 'pending':<8} {name}")
+    else:
+        applied = migrate()
+        print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
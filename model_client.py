@@ -0,0 +1,225 @@
+# model_client.py - resilient wrapper around the model transport
+
+# Every model call in the process goes through one ModelClient, which adds:
+#   - a token-bucket rate limiter shared by all sessions,
+#   - jittered exponential backoff on transient errors (429 / 5xx / timeouts),
+#   - an overall deadline per call, with each attempt's timeout cut to fit,
+#   - a circuit breaker that fails fast while the upstream is degraded,
+#   - per-call latency and outcome metrics.
+#
+# The transport is any callable ``transport(image_data, prompt, timeout=...)``
+# with a ``model_name`` attribute and an optional ``stream`` method, e.g.
+# analysis.get_gemini_response or stub_model.StubModel.
+
+import os
+import time
+import random
+import threading
+from collections import deque, Counter
+
+from google.api_core import exceptions as google_exceptions
+
+from instrumentation import span
+
+MODEL_RATE_PER_SEC = float(os.getenv("MODEL_RATE_PER_SEC", "5"))
+MODEL_BURST = int(os.getenv("MODEL_BURST", "10"))
+MODEL_MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "3"))
+MODEL_BACKOFF_BASE = float(os.getenv("MODEL_BACKOFF_BASE", "0.5"))
+MODEL_BACKOFF_MAX = float(os.getenv("MODEL_BACKOFF_MAX", "8"))
+MODEL_DEADLINE = float(os.getenv("MODEL_DEADLINE", "90"))
+MODEL_BREAKER_THRESHOLD = int(os.getenv("MODEL_BREAKER_THRESHOLD", "5"))
+MODEL_BREAKER_COOLDOWN = float(os.getenv("MODEL_BREAKER_COOLDOWN", "30"))
+
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError, google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable, google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded, TimeoutError, ConnectionError,
+)
+
+
+class ModelUnavailableError(RuntimeError):
+    """Raised without calling upstream: breaker open, or no rate budget before the deadline."""
+
+
+class TokenBucket:
+    def __init__(self, rate=MODEL_RATE_PER_SEC, burst=MODEL_BURST):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline):
+        """Take one token, sleeping as needed; False if none is available before the deadline."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1; return True
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; after `cooldown` lets one probe through.
+
+    The probe must end in record_success, record_failure or release_probe;
+    a probe that ends in none of them would leave the breaker half-open for good.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold=MODEL_BREAKER_THRESHOLD, cooldown=MODEL_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.probe_thread = None    # thread running the half-open probe
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN; self.probe_thread = threading.get_ident()
+                return True
+            return self.state == self.CLOSED
+
+    def release_probe(self):
+        """Reopen, with a fresh cooldown, if this thread's probe ended without an outcome."""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self.probe_thread == threading.get_ident():
+                self.state = self.OPEN; self.opened_at = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED; self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN: self.trips += 1
+                self.state = self.OPEN; self.opened_at = time.monotonic()
+
+
+class ModelClient:
+    def __init__(self, transport, limiter=None, breaker=None, max_retries=MODEL_MAX_RETRIES,
+                 backoff_base=MODEL_BACKOFF_BASE, backoff_max=MODEL_BACKOFF_MAX, deadline=MODEL_DEADLINE):
+        self.transport = transport
+        self.model_name = transport.model_name
+        self.limiter = limiter or TokenBucket()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.outcomes = Counter()
+        self.latencies = deque(maxlen=1000)
+        self._lock = threading.Lock()
+
+    def __call__(self, image_data, prompt, timeout=None):
+        return self._run(lambda attempt_timeout: self.transport(image_data, prompt, timeout=attempt_timeout), timeout)
+
+    def stream(self, image_data, prompt, timeout=None):
+        """Stream chunks; retries only happen before the first chunk has been yielded.
+
+        The outcome and latency recorded cover the whole stream: an error after the
+        first chunk is recorded as a failure, and counts against the breaker if transient.
+        """
+        started = time.monotonic()
+        chunks, retried = self._run(lambda attempt_timeout: self._first_chunk(image_data, prompt, attempt_timeout),
+                                    timeout, started, finish=False)
+        try:
+            yield from chunks
+        except RETRYABLE_ERRORS:
+            self.breaker.record_failure()
+            self._record("failed", started); raise
+        except GeneratorExit:
+            # The caller stopped reading; nothing went wrong upstream.
+            self._record("abandoned", started); raise
+        except Exception:
+            self._record("error", started); raise
+        self._record("ok_after_retry" if retried else "ok", started)
+
+    def _first_chunk(self, image_data, prompt, attempt_timeout):
+        # Pull the first chunk inside the retried section so connection errors are retried.
+        iterator = iter(self.transport.stream(image_data, prompt, timeout=attempt_timeout))
+        first = next(iterator, None)
+        return _prepend(first, iterator)
+
+    def _run(self, attempt, timeout, started=None, finish=True):
+        # For streams the span covers the attempts up to the first chunk; the rest is timed by stream().
+        with span("model.call"):
+            return self._run_attempts(attempt, timeout, started or time.monotonic(), finish)
+
+    def _run_attempts(self, attempt, timeout, started, finish=True):
+        """The result of the first successful attempt. With finish=False the success is not
+        recorded, and ``(result, retried)`` is returned for the caller to record when it is done."""
+        try:
+            return self._attempt_loop(attempt, timeout, started, finish)
+        finally:
+            # A probe that ended without success or failure (e.g. interrupted) must not leave the breaker half-open.
+            self.breaker.release_probe()
+
+    def _attempt_loop(self, attempt, timeout, started, finish):
+        deadline = started + (timeout or self.deadline)
+        for attempt_number in range(self.max_retries + 1):
+            # Rate budget first, so a call turned away by the limiter never takes the half-open probe.
+            if not self.limiter.acquire(deadline):
+                self._record("rejected_rate", started)
+                raise ModelUnavailableError("Too many analyses in progress. Please try again shortly.")
+            if not self.breaker.allow():
+                self._record("rejected_open", started)
+                raise ModelUnavailableError("The AI service is temporarily unavailable. Please try again shortly.")
+            try:
+                result = attempt(max(deadline - time.monotonic(), 0.001))
+            except RETRYABLE_ERRORS:
+                self.breaker.record_failure()
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt_number))
+                if attempt_number == self.max_retries or time.monotonic() + delay >= deadline:
+                    self._record("failed", started); raise
+                self._count("retry")
+                time.sleep(delay)
+            except Exception:
+                # Upstream answered (e.g. invalid request), so it is not degraded.
+                self.breaker.record_success()
+                self._record("error", started); raise
+            else:
+                self.breaker.record_success()
+                if not finish:
+                    return result, attempt_number > 0
+                self._record("ok" if attempt_number == 0 else "ok_after_retry", started)
+                return result
+
+    def _count(self, outcome):
+        with self._lock:
+            self.outcomes[outcome] += 1
+
+    def _record(self, outcome, started):
+        with self._lock:
+            self.outcomes[outcome] += 1
+            self.latencies.append(time.monotonic() - started)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            outcomes = dict(self.outcomes)
+        return {"outcomes": outcomes, "latency_p50": _percentile(latencies, 0.50), "latency_p95": _percentile(latencies, 0.95),
+                "breaker_state": self.breaker.state, "breaker_trips": self.breaker.trips}
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))] if sorted_values else 0.0
+
+
+def _prepend(first, iterator):
+    if first is not None:
+        yield first
+    yield from iterator
@@ -0,0 +1,176 @@
+# near_duplicates.py - recognise new photos of meals a user has already saved
+
+# The analysis cache only matches byte-identical uploads. A photo of the same
+# breakfast taken on another day differs in every byte but looks alike, so each
+# saved meal also stores a 64-bit difference hash (dHash) of its photo. When a
+# new photo's hash is within NEAR_DUPLICATE_DISTANCE bits of one of the user's
+# saved meals, the app offers that meal's stored analysis instead of calling
+# the model, with a "re-analyze anyway" button.
+#
+# Lookups use multi-index hashing (HashIndex): the hash is split into four
+# 16-bit chunks, each with its own table. A match within r bits must be within
+# r // 4 bits in at least one chunk, so a search probes a few hundred table
+# entries instead of every stored hash. Each user's index is built on first
+# use and rebuilt when their data version moves, i.e. after a save by any
+# server process.
+
+import os
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+
+from PIL import Image
+
+from db import connection
+from nutrients import NUTRIENT_NAMES
+from nutrient_storage import nutrient_source
+
+NEAR_DUPLICATES = os.getenv("NEAR_DUPLICATES", "on")
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("NEAR_DUPLICATE_DISTANCE", "6"))   # of 64 bits
+NEAR_DUPLICATE_MAX_USERS = int(os.getenv("NEAR_DUPLICATE_MAX_USERS", "1024"))
+
+CHUNKS, CHUNK_BITS = 4, 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+# --- HASHING ---
+def image_hash(image):
+    """64-bit dHash of a PIL image: whether each pixel of a 9x8 grayscale thumbnail is brighter than its right neighbour."""
+    pixels = image.convert("L").resize((9, 8), Image.LANCZOS).tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+
+def to_signed(value):
+    """Unsigned 64-bit hash as a Postgres BIGINT, and back with to_unsigned()."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value): return value & ((1 << 64) - 1)
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(max_bits):
+    """Every CHUNK_BITS-bit mask with at most `max_bits` bits set."""
+    masks = [0]
+    for _ in range(max_bits):
+        masks = sorted({mask | (1 << bit) for mask in masks for bit in range(CHUNK_BITS)} | set(masks))
+    return tuple(masks)
+
+
+# --- INDEX ---
+class HashIndex:
+    """Exact Hamming-radius search over 64-bit hashes by multi-index hashing."""
+
+    def __init__(self):
+        self.hashes = []            # position -> hash
+        self.values = []            # position -> caller's value (meal id)
+        self.tables = [{} for _ in range(CHUNKS)]     # chunk value -> positions
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def add(self, hash_value, value):
+        position = len(self.hashes)
+        self.hashes.append(hash_value); self.values.append(value)
+        for i, table in enumerate(self.tables):
+            table.setdefault((hash_value >> (i * CHUNK_BITS)) & CHUNK_MASK, []).append(position)
+
+    def search(self, hash_value, radius):
+        """``[(distance, value)]`` for every stored hash within `radius` bits, closest (then latest added) first."""
+        masks = _flip_masks(radius // CHUNKS)
+        hashes, seen, found = self.hashes, set(), []
+        for i, table in enumerate(self.tables):
+            chunk = (hash_value >> (i * CHUNK_BITS)) & CHUNK_MASK
+            for mask in masks:
+                for position in table.get(chunk ^ mask, ()):
+                    if position in seen:
+                        continue
+                    seen.add(position)
+                    distance = (hashes[position] ^ hash_value).bit_count()
+                    if distance <= radius:
+                        found.append((distance, -position))
+        return [(distance, self.values[-negative_position]) for distance, negative_position in sorted(found)]
+
+
+USER_HASHES_SQL = "SELECT id, image_hash FROM meals WHERE user_id = %s AND image_hash IS NOT NULL ORDER BY id;"
+
+
+class UserHashIndexes:
+    """Per-user HashIndex, LRU-bounded, valid for one data version of the user."""
+
+    def __init__(self, max_users=NEAR_DUPLICATE_MAX_USERS):
+        self.max_users = max_users
+        self._indexes = OrderedDict()       # user_id -> (data version, HashIndex)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        # aggregates pulls in pandas, which the analyzer page otherwise never needs
+        from aggregates import get_data_version
+        version = get_data_version(user_id)
+        with self._lock:
+            entry = self._indexes.get(user_id)
+            if entry is not None and entry[0] == version:
+                self._indexes.move_to_end(user_id)
+                return entry[1]
+        index = HashIndex()
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(USER_HASHES_SQL, (user_id,))
+            for meal_id, stored_hash in cur.fetchall():
+                index.add(to_unsigned(stored_hash), meal_id)
+            conn.commit()
+        with self._lock:
+            self._indexes[user_id] = (version, index)
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        return index
+
+
+_indexes = None
+_indexes_lock = threading.Lock()
+
+
+def get_user_indexes():
+    global _indexes
+    if _indexes is None:
+        with _indexes_lock:
+            if _indexes is None:
+                _indexes = UserHashIndexes()
+    return _indexes
+
+
+# --- STORED ANALYSES ---
+MEAL_SQL = "SELECT meal_title, analysis_text, created_at FROM meals WHERE id = %s;"
+MEAL_NUTRIENTS_SQL = "SELECT n.nutrient_name, n.amount::float8, n.unit, n.percent_dv::float8 FROM meals m {nutrients} WHERE m.id = %s;"
+_ORDER = {name: i for i, name in enumerate(NUTRIENT_NAMES)}
+
+
+def load_meal_analysis(meal_id, layout=None):
+    """A saved meal as an analysis dict (title, full_text, nutrients), plus its created_at; None if it is gone."""
+    source, params = nutrient_source(layout)
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(MEAL_SQL, (meal_id,))
+        meal = cur.fetchone()
+        cur.execute(MEAL_NUTRIENTS_SQL.format(nutrients=source), (*params, meal_id))
+        rows = cur.fetchall()
+        conn.commit()
+    if meal is None:
+        return None
+    nutrients = [{"nutrient": name, "amount": amount, "unit": unit, "percent_dv": percent_dv}
+                 for name, amount, unit, percent_dv in sorted(rows, key=lambda row: _ORDER.get(row[0], len(_ORDER)))]
+    return {"title": meal[0], "full_text": meal[1], "nutrients": nutrients}, meal[2]
+
+
+def find_near_duplicate(user_id, hash_value, max_distance=NEAR_DUPLICATE_DISTANCE):
+    """The user's closest saved meal within `max_distance` bits, as
+    ``{"meal_id", "distance", "created_at", "analysis"}``, or None."""
+    for distance, meal_id in get_user_indexes().get(user_id).search(hash_value, max_distance):
+        loaded = load_meal_analysis(meal_id)
+        if loaded is not None:
+            analysis, created_at = loaded
+            return {"meal_id": meal_id, "distance": distance, "created_at": created_at, "analysis": analysis}
+    return None
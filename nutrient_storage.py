@@ -0,0 +1,73 @@
+# nutrient_storage.py - the two on-disk layouts for a meal's nutrients
+
+# "rows" (default) stores one meal_nutrients row per nutrient: ~33 narrow rows,
+# each with its own tuple header, id and index entry, per analysis.
+# "wide" stores them on the meals row itself:
+#   nutrient_amounts REAL[]  amounts in canonical units, position i = NUTRIENTS[i]
+#   nutrient_dv      REAL[]  %DV computed from nutrients.DAILY_VALUES at save, same positions
+#   extra_nutrients  JSONB   {name: {amount, unit, percent_dv}} for names outside the registry
+# Array positions are keyed to nutrients.NUTRIENTS, so that list is append-only.
+# Readers never touch either layout directly: they join nutrient_source(),
+# which yields the same (nutrient_name, amount, unit, percent_dv) rows for both.
+#
+# Migration 7 only adds the wide columns. `python meal_store.py backfill-wide`
+# copies meals saved in rows mode into them, and is run before switching. Nothing
+# copies wide meals back into meal_nutrients, so wide -> rows is not a supported switch.
+
+import os
+import json
+
+from nutrients import NUTRIENT_NAMES, NUTRIENT_UNITS, stored_percent_dv
+
+LAYOUTS = ("rows", "wide")
+NUTRIENT_STORAGE = os.getenv("NUTRIENT_STORAGE", "rows").strip().lower()
+
+NUTRIENT_UNIT_LIST = [NUTRIENT_UNITS[name] for name in NUTRIENT_NAMES]
+
+# Joined after "FROM meals m"; both produce n.nutrient_name, n.amount, n.unit and n.percent_dv.
+ROWS_SOURCE_SQL = "JOIN meal_nutrients n ON m.id = n.meal_id"
+WIDE_SOURCE_SQL = """
+    CROSS JOIN LATERAL (
+        SELECT w.nutrient_name, w.amount::float8 AS amount, w.unit, w.percent_dv
+        FROM unnest(%s::text[], %s::text[], m.nutrient_amounts, m.nutrient_dv) AS w(nutrient_name, unit, amount, percent_dv)
+        WHERE w.amount IS NOT NULL
+        UNION ALL
+        SELECT e.key, (e.value->>'amount')::float8, e.value->>'unit', (e.value->>'percent_dv')::real
+        FROM jsonb_each(m.extra_nutrients) AS e
+    ) n
+"""
+
+
+def resolve_layout(layout=None):
+    layout = layout or NUTRIENT_STORAGE
+    if layout not in LAYOUTS:
+        raise ValueError(f"unknown nutrient storage layout {layout!r}")
+    return layout
+
+
+def nutrient_source(layout=None):
+    """``(sql, params)`` to join after ``FROM meals m`` for the given (or configured) layout."""
+    if resolve_layout(layout) == "wide":
+        return WIDE_SOURCE_SQL, (NUTRIENT_NAMES, NUTRIENT_UNIT_LIST)
+    return ROWS_SOURCE_SQL, ()
+
+
+# --- WIDE VALUES ---
+_POSITIONS = {name: i for i, name in enumerate(NUTRIENT_NAMES)}
+
+
+def wide_values(nutrients):
+    """``(amounts, percent_dv, extras_json)`` for normalised nutrients; extras_json is None if there are none."""
+    amounts, percent_dv, extras = [None] * len(NUTRIENT_NAMES), [None] * len(NUTRIENT_NAMES), {}
+    for n in nutrients:
+        position = _POSITIONS.get(n.get('nutrient'))
+        if position is None:
+            extras[n.get('nutrient')] = {"amount": n.get('amount'), "unit": n.get('unit'), "percent_dv": n.get('percent_dv')}
+        else:
+            amounts[position], percent_dv[position] = n.get('amount'), stored_percent_dv(n)
+    return amounts, percent_dv, json.dumps(extras) if extras else None
+
+
+def pg_array(values):
+    """Postgres array literal for COPY, e.g. ``{1.5,NULL,3.0}``."""
+    return "{" + ",".join("NULL" if v is None else repr(float(v)) for v in values) + "}"
@@ -0,0 +1,192 @@
+# nutrients.py - the canonical nutrient registry
+
+# One list drives the prompt template, the structured-output schema, parsing
+# and unit normalisation, so they can never drift apart. %DV is computed here
+# from DAILY_VALUES when a nutrient is normalised or saved, never taken from
+# the model, so stored %DVs can be summed per day and compared across units.
+
+import re
+
+# (name, canonical unit, whether a %DV is reported) in the order the prompt asks for them.
+NUTRIENTS = [
+    ("Calories", "kcal", False), ("Protein", "g", True), ("Total Fat", "g", True), ("Saturated Fat", "g", True),
+    ("Trans Fat", "g", False), ("Polyunsaturated Fat", "g", False), ("Monounsaturated Fat", "g", False),
+    ("Cholesterol", "mg", True), ("Carbohydrates", "g", True), ("Dietary Fiber", "g", True), ("Total Sugars", "g", False),
+    ("Added Sugars", "g", True), ("Sodium", "mg", True), ("Potassium", "mg", True), ("Calcium", "mg", True),
+    ("Iron", "mg", True), ("Magnesium", "mg", True), ("Phosphorus", "mg", True), ("Zinc", "mg", True),
+    ("Copper", "mg", True), ("Manganese", "mg", True), ("Selenium", "mcg", True), ("Vitamin A", "mcg", True),
+    ("Vitamin C", "mg", True), ("Vitamin D", "mcg", True), ("Vitamin E", "mg", True), ("Vitamin K", "mcg", True),
+    ("Thiamin (B1)", "mg", True), ("Riboflavin (B2)", "mg", True), ("Niacin (B3)", "mg", True),
+    ("Vitamin B6", "mg", True), ("Folate (B9)", "mcg", True), ("Vitamin B12", "mcg", True),
+]
+NUTRIENT_NAMES = [name for name, _, _ in NUTRIENTS]
+NUTRIENT_UNITS = {name: unit for name, unit, _ in NUTRIENTS}
+MACROS = ['Protein', 'Carbohydrates', 'Total Fat']
+VITAMINS = ['Vitamin A', 'Vitamin C', 'Vitamin D', 'Vitamin E', 'Vitamin K', 'Thiamin (B1)', 'Riboflavin (B2)',
+            'Niacin (B3)', 'Vitamin B6', 'Folate (B9)', 'Vitamin B12']
+
+# FDA Daily Values for adults, in each nutrient's canonical unit.
+DAILY_VALUES = {
+    "Calories": 2000, "Protein": 50, "Total Fat": 78, "Saturated Fat": 20, "Cholesterol": 300, "Carbohydrates": 275,
+    "Dietary Fiber": 28, "Added Sugars": 50, "Sodium": 2300, "Potassium": 4700, "Calcium": 1300, "Iron": 18,
+    "Magnesium": 420, "Phosphorus": 1250, "Zinc": 11, "Copper": 0.9, "Manganese": 2.3, "Selenium": 55,
+    "Vitamin A": 900, "Vitamin C": 90, "Vitamin D": 20, "Vitamin E": 15, "Vitamin K": 120, "Thiamin (B1)": 1.2,
+    "Riboflavin (B2)": 1.3, "Niacin (B3)": 16, "Vitamin B6": 1.7, "Folate (B9)": 400, "Vitamin B12": 2.4,
+}
+
+# Other spellings the model uses, keyed by _key(); canonical names map to themselves.
+ALIASES = {
+    "energy": "Calories", "calorie": "Calories", "kcal": "Calories",
+    "fat": "Total Fat", "total fats": "Total Fat", "saturated fats": "Saturated Fat", "trans fats": "Trans Fat",
+    "polyunsaturated fats": "Polyunsaturated Fat", "monounsaturated fats": "Monounsaturated Fat",
+    "carbs": "Carbohydrates", "carbohydrate": "Carbohydrates", "total carbohydrates": "Carbohydrates",
+    "total carbohydrate": "Carbohydrates", "fiber": "Dietary Fiber", "fibre": "Dietary Fiber", "dietary fibre": "Dietary Fiber",
+    "sugar": "Total Sugars", "sugars": "Total Sugars", "added sugar": "Added Sugars",
+    "thiamin": "Thiamin (B1)", "thiamine": "Thiamin (B1)", "vitamin b1": "Thiamin (B1)",
+    "riboflavin": "Riboflavin (B2)", "vitamin b2": "Riboflavin (B2)", "niacin": "Niacin (B3)", "vitamin b3": "Niacin (B3)",
+    "folate": "Folate (B9)", "folic acid": "Folate (B9)", "vitamin b9": "Folate (B9)",
+    "vitamin b 6": "Vitamin B6", "vitamin b 12": "Vitamin B12", "cobalamin": "Vitamin B12",
+}
+# Compounds reported in place of a nutrient, keyed by _key(): (nutrient, its mass fraction,
+# unit assumed when none is given). Salt is about 39.3% sodium and is labelled in g.
+COMPOUNDS = {"salt": ("Sodium", 0.393, "g"), "sodium chloride": ("Sodium", 0.393, "g")}
+UNIT_ALIASES = {"g": "g", "gram": "g", "grams": "g", "mg": "mg", "milligram": "mg", "milligrams": "mg",
+                "mcg": "mcg", "µg": "mcg", "μg": "mcg", "ug": "mcg", "microgram": "mcg", "micrograms": "mcg",
+                "kcal": "kcal", "cal": "kcal", "calories": "kcal", "kj": "kj", "iu": "iu"}
+MASS_IN_MG = {"g": 1000.0, "mg": 1.0, "mcg": 0.001}
+# IU -> canonical unit for the vitamins that are still labelled in IU.
+IU_FACTORS = {"Vitamin A": 0.3, "Vitamin D": 0.025, "Vitamin E": 0.67}
+KJ_PER_KCAL = 4.184
+
+# "1,200" and "12,500.5" are thousands-grouped; any other comma is a decimal comma ("1,5").
+_NUMBER_RE = re.compile(r"(?P<grouped>-?\d{1,3}(?:,\d{3})+(?!\d)(?:\.\d+)?)|-?\d+(?:[.,]\d+)?")
+_NON_KEY_RE = re.compile(r"[^a-z0-9 ]+")
+_BRACKETS_RE = re.compile(r"\(.*?\)")
+
+
+def _key(name):
+    return _NON_KEY_RE.sub("", name.lower().replace("-", " ")).strip()
+
+
+_LOOKUP = {**{_key(name): name for name in NUTRIENT_NAMES}, **ALIASES}
+
+
+def canonical_name(name):
+    """Canonical nutrient name for a model-supplied name, or None if unknown."""
+    if not isinstance(name, str):
+        return None
+    key = _key(name)
+    # "Vitamin B1 (Thiamin)" -> try the part outside the brackets as well
+    return _LOOKUP.get(key) or _LOOKUP.get(_key(_BRACKETS_RE.sub("", name)))
+
+
+def to_number(value):
+    """Coerce 12, "12.5", "~12 g", "<1", "1,200 mg" and "1,5" to floats; None if there is no number."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER_RE.search(str(value))
+    if match is None:
+        return None
+    return float(match.group().replace(",", "" if match.lastgroup == "grouped" else "."))
+
+
+def convert_amount(name, amount, unit):
+    """Convert an amount in `unit` to the nutrient's canonical unit; None if impossible."""
+    target = NUTRIENT_UNITS[name]
+    unit = UNIT_ALIASES.get(str(unit or target).strip().lower(), None)
+    if unit is None or unit == target:
+        return amount if unit else None
+    if unit in MASS_IN_MG and target in MASS_IN_MG:
+        return amount * MASS_IN_MG[unit] / MASS_IN_MG[target]
+    if unit == "iu" and name in IU_FACTORS:
+        return amount * IU_FACTORS[name]
+    if unit == "kj" and target == "kcal":
+        return amount / KJ_PER_KCAL
+    return None
+
+
+def percent_of_daily_value(name, amount):
+    """`amount` (in the canonical unit) as % of the nutrient's Daily Value; None without a DV or an amount."""
+    daily_value = DAILY_VALUES.get(name)
+    if daily_value is None or amount is None:
+        return None
+    return round(amount / daily_value * 100, 1)
+
+
+def stored_percent_dv(nutrient):
+    """The %DV to store for a normalised entry: computed for registry nutrients, as given for the rest."""
+    if nutrient.get("nutrient") in NUTRIENT_UNITS:
+        return percent_of_daily_value(nutrient["nutrient"], to_number(nutrient.get("amount")))
+    return nutrient.get("percent_dv")
+
+
+def normalize_nutrient(entry):
+    """Validate one ``{"nutrient", "amount", "unit", "percent_dv"}`` entry.
+
+    Known nutrients get their canonical name and unit, with the amount converted;
+    a compound such as salt becomes its nutrient (COMPOUNDS).
+    Returns None for entries that cannot be used (no name, or a unit that cannot
+    be converted). Unknown nutrients are kept as given, with numbers coerced.
+    """
+    if not isinstance(entry, dict) or not entry.get("nutrient"):
+        return None
+    amount = to_number(entry.get("amount"))
+    percent_dv = to_number(entry.get("percent_dv"))
+    name, unit = canonical_name(entry["nutrient"]), entry.get("unit")
+    if name is None and _key(str(entry["nutrient"])) in COMPOUNDS:
+        name, fraction, default_unit = COMPOUNDS[_key(str(entry["nutrient"]))]
+        amount, unit = None if amount is None else amount * fraction, unit or default_unit
+    if name is None:
+        return {"nutrient": str(entry["nutrient"]).strip(), "amount": amount if amount is not None else 0,
+                "unit": entry.get("unit"), "percent_dv": percent_dv}
+    if amount is not None:
+        amount = convert_amount(name, amount, unit)
+        if amount is None:
+            return None
+        amount = round(amount, 3)
+    amount = amount if amount is not None else 0
+    return {"nutrient": name, "amount": amount, "unit": NUTRIENT_UNITS[name], "percent_dv": percent_of_daily_value(name, amount)}
+
+
+def normalize_nutrients(entries):
+    """Normalise a parsed list, dropping invalid entries and duplicate nutrients."""
+    normalized, seen = [], set()
+    for entry in entries if isinstance(entries, list) else []:
+        nutrient = normalize_nutrient(entry)
+        if nutrient and nutrient["nutrient"] not in seen:
+            seen.add(nutrient["nutrient"]); normalized.append(nutrient)
+    return normalized
+
+
+def coverage(nutrients):
+    """Fraction of the canonical nutrients present in a parsed list."""
+    present = {n.get("nutrient") for n in nutrients}
+    return sum(name in present for name in NUTRIENT_NAMES) / len(NUTRIENT_NAMES)
+
+
+# --- PROMPT & SCHEMA GENERATION ---
+def prompt_nutrient_list():
+    """"Calories (kcal), Protein (g)*, ..." with * marking nutrients that need a %DV."""
+    return ", ".join(f"{name} ({unit})" + ("*" if has_dv else "") for name, unit, has_dv in NUTRIENTS)
+
+
+def response_schema():
+    """JSON schema (OpenAPI subset accepted by Gemini) for structured-output mode."""
+    nutrient_properties = {
+        name: {"type": "object", "properties": {"amount": {"type": "number"}, "percent_dv": {"type": "number", "nullable": True}},
+               "required": ["amount"]}
+        for name in NUTRIENT_NAMES
+    }
+    return {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string"},
+            "advantages": {"type": "array", "items": {"type": "string"}},
+            "disadvantages": {"type": "array", "items": {"type": "string"}},
+            "fun_fact": {"type": "string"},
+            "nutrients": {"type": "object", "properties": nutrient_properties, "required": NUTRIENT_NAMES},
+        },
+        "required": ["title", "advantages", "disadvantages", "fun_fact", "nutrients"],
+    }
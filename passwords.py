@@ -0,0 +1,81 @@
+# passwords.py - bcrypt hashing off the request thread
+
+# bcrypt is deliberately slow CPU work and holds the GIL for most of it, so
+# hashing inside the Streamlit script stalls every other session in the
+# process. Hashes and verifications run in a shared pool of PASSWORD_WORKERS
+# processes instead. At most PASSWORD_QUEUE_LIMIT of them may be queued or
+# running at once; past that a caller waits up to PASSWORD_ADMIT_TIMEOUT
+# seconds for a slot and then gets PasswordServiceBusy, so a login burst
+# queues a bounded amount of work instead of an unbounded backlog.
+#
+# PASSWORD_HASH_ROUNDS is the bcrypt cost. Raising it makes older hashes
+# "need update", and verify_and_update() returns a fresh hash for them.
+#
+# This module imports nothing but passlib, so the worker processes start fast.
+
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))   # 0 = hash in the calling thread
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", str(max(PASSWORD_WORKERS, 1) * 4)))
+PASSWORD_ADMIT_TIMEOUT = float(os.getenv("PASSWORD_ADMIT_TIMEOUT", "2"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto",
+                           bcrypt__default_rounds=PASSWORD_HASH_ROUNDS, bcrypt__min_rounds=PASSWORD_HASH_ROUNDS)
+
+
+class PasswordServiceBusy(RuntimeError):
+    """Raised without hashing: every pool slot stayed taken for PASSWORD_ADMIT_TIMEOUT seconds."""
+
+
+# --- RUN IN THE WORKER PROCESSES ---
+def _hash(password):
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password, hashed_password):
+    try:
+        return pwd_context.verify_and_update(password, hashed_password)
+    except ValueError:      # not a hash this context recognises
+        return False, None
+
+
+# --- POOL & ADMISSION ---
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(PASSWORD_QUEUE_LIMIT)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn: forking a process that already runs server threads is not safe
+                _executor = ProcessPoolExecutor(max_workers=PASSWORD_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def _run(fn, *args):
+    if not _slots.acquire(timeout=PASSWORD_ADMIT_TIMEOUT):
+        raise PasswordServiceBusy("Too many sign-ins in progress. Please try again shortly.")
+    try:
+        if PASSWORD_WORKERS <= 0:
+            return fn(*args)
+        return get_executor().submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password: str) -> str: return _run(_hash, password)
+def verify_password(plain_password: str, hashed_password: str) -> bool: return _run(_verify_and_update, plain_password, hashed_password)[0]
+
+
+def verify_and_update(plain_password, hashed_password):
+    """``(matches, new_hash)``; new_hash is set when the stored hash is below the configured cost."""
+    return _run(_verify_and_update, plain_password, hashed_password)
@@ -0,0 +1,72 @@
+# recordings.py - record live model calls so the pipeline can be replayed offline
+
+# With ANALYSIS_RECORD=path/to/file.jsonl, every successful model call in the
+# process appends one JSON line to that file:
+#
+#   image_sha256   SHA-256 of the image bytes sent (after image_prep)
+#   prompt, model  exactly what was asked, and of which model
+#   response       the raw response text
+#   chunks         the streamed chunks as received (streamed calls only)
+#   latency        seconds for the whole call; first_chunk, seconds to the first chunk
+#   recorded_at    ISO timestamp
+#
+# Only the transport is wrapped, inside ModelClient, so a record is one
+# successful attempt: retries, rate limiting and cache hits are not recorded.
+# replay.py feeds the file back through the parser and meal_store with no
+# network. Images are not stored, only their hash.
+
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+ANALYSIS_RECORD = os.getenv("ANALYSIS_RECORD", "")
+
+
+class RecordingTransport:
+    """Model transport that appends each successful call to a JSONL file, then returns it unchanged."""
+
+    def __init__(self, transport, path=ANALYSIS_RECORD):
+        self.transport = transport
+        self.model_name = transport.model_name
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, image_data, prompt, timeout=None):
+        started = time.perf_counter()
+        response = self.transport(image_data, prompt, timeout=timeout)
+        self._write(image_data, prompt, response, None, time.perf_counter() - started, None)
+        return response
+
+    def stream(self, image_data, prompt, timeout=None):
+        started = time.perf_counter()
+        chunks, first_chunk = [], None
+        for chunk in self.transport.stream(image_data, prompt, timeout=timeout):
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - started
+            chunks.append(chunk)
+            yield chunk
+        # Only reached when the stream completed; an abandoned or failed stream is not recorded.
+        self._write(image_data, prompt, "".join(chunks), chunks, time.perf_counter() - started, first_chunk)
+
+    def _write(self, image_data, prompt, response, chunks, latency, first_chunk):
+        record = {"image_sha256": hashlib.sha256(image_data[0]['data']).hexdigest(), "prompt": prompt, "model": self.model_name,
+                  "response": response, "chunks": chunks, "latency": round(latency, 4),
+                  "first_chunk": None if first_chunk is None else round(first_chunk, 4),
+                  "recorded_at": datetime.now(timezone.utc).isoformat()}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def recording(transport):
+    """`transport` wrapped in a RecordingTransport when ANALYSIS_RECORD is set, else unchanged."""
+    return RecordingTransport(transport) if ANALYSIS_RECORD else transport
+
+
+def load_recordings(path):
+    """The records in a recording file, in the order they were made."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,169 @@
+# replay.py - replay recorded model responses through the pipeline, offline and at full speed
+
+# Reads a recording file (recordings.py) and runs every response through the
+# same steps as a live analysis, minus the model call:
+#
+#   parse   parse_summary_from_response, or StreamingSummaryParser over the
+#           recorded chunks with --stream
+#   save    meal_store.add_meal_entry for a throwaway user (--save, needs the database)
+#
+# It reports parse success (a title and at least one nutrient), nutrient
+# coverage against nutrients.NUTRIENTS, the nutrients most often missing,
+# and per-stage timings, next to the recorded model latency. A prompt, parser
+# or normalisation change can then be checked for accuracy and speed against
+# the same responses:
+#
+#   python replay.py FILE [--stream] [--save] [--repeat N] [--save-baseline BASE.json] [--compare BASE.json] [--tolerance 0.2]
+#
+# --compare exits non-zero if parse success or mean coverage fell, or a stage's
+# p95 rose by more than the tolerance against the baseline. Timings are only
+# comparable on the same machine.
+
+import sys
+import json
+import time
+import uuid
+import argparse
+from collections import Counter
+from contextlib import contextmanager
+
+from nutrients import NUTRIENT_NAMES, coverage
+from recordings import load_recordings
+from response_parser import parse_summary_from_response, StreamingSummaryParser
+
+STAGES = ("parse", "save")
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))] if sorted_values else None
+
+
+def parse_record(record, stream=False):
+    """The analysis for one record, parsed as the app would have parsed it."""
+    if not stream:
+        return parse_summary_from_response(record["response"])
+    parser = StreamingSummaryParser()
+    for chunk in record.get("chunks") or [record["response"]]:
+        parser.feed(chunk)
+    return parser.finish()[1]
+
+
+def parsed_ok(analysis):
+    return bool(analysis["nutrients"]) and analysis["title"] not in ("", "Untitled Meal")
+
+
+@contextmanager
+def replay_user():
+    """A throwaway user for saved replays, removed with its meals afterwards."""
+    from db import connection
+    name = f"replay_{uuid.uuid4().hex[:12]}"
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO users (username, email, password_hash) VALUES (%s, %s, 'x') RETURNING id;", (name, f"{name}@replay.local"))
+        user_id = cur.fetchone()[0]; conn.commit()
+    try:
+        yield user_id
+    finally:
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM daily_nutrient_totals WHERE user_id = %s;", (user_id,))
+            cur.execute("DELETE FROM user_data_versions WHERE user_id = %s;", (user_id,))
+            cur.execute("DELETE FROM meals WHERE user_id = %s;", (user_id,))
+            cur.execute("DELETE FROM users WHERE id = %s;", (user_id,))
+            conn.commit()
+
+
+def replay(records, stream=False, user_id=None, repeat=1):
+    """Run `records` through the pipeline `repeat` times; returns the report dict."""
+    if user_id is not None:
+        from meal_store import add_meal_entry
+    timings = {stage: [] for stage in STAGES}
+    ok, coverages, missing = 0, [], Counter()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for record in records:
+            t = time.perf_counter()
+            analysis = parse_record(record, stream)
+            timings["parse"].append(time.perf_counter() - t)
+            if user_id is not None:
+                t = time.perf_counter()
+                add_meal_entry(user_id, analysis)
+                timings["save"].append(time.perf_counter() - t)
+            ok += parsed_ok(analysis)
+            coverages.append(coverage(analysis["nutrients"]))
+            present = {n["nutrient"] for n in analysis["nutrients"]}
+            missing.update(name for name in NUTRIENT_NAMES if name not in present)
+    elapsed = time.perf_counter() - started
+    runs = len(records) * repeat
+    model = sorted(r["latency"] for r in records if r.get("latency") is not None)
+    report = {
+        "records": len(records), "runs": runs, "mode": "stream" if stream else "whole",
+        "parse_success": ok / runs if runs else 0.0,
+        "coverage_mean": sum(coverages) / runs if runs else 0.0,
+        "full_coverage": sum(c == 1.0 for c in coverages) / runs if runs else 0.0,
+        "most_missing": missing.most_common(5),
+        "runs_per_sec": runs / elapsed if elapsed else 0.0,
+        "model_latency": {"p50": _percentile(model, 0.5), "p95": _percentile(model, 0.95)},
+        "stages": {},
+    }
+    for stage, samples in timings.items():
+        if samples:
+            samples.sort()
+            report["stages"][stage] = {"p50_ms": _percentile(samples, 0.5) * 1000, "p95_ms": _percentile(samples, 0.95) * 1000,
+                                       "mean_ms": sum(samples) / len(samples) * 1000}
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """Regressions of `report` against `baseline`, as readable lines (empty if none)."""
+    problems = []
+    for metric in ("parse_success", "coverage_mean"):
+        if report[metric] < baseline[metric] - 1e-9:
+            problems.append(f"{metric} fell from {baseline[metric]:.1%} to {report[metric]:.1%}")
+    for stage, old in baseline["stages"].items():
+        new = report["stages"].get(stage)
+        if new and new["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            problems.append(f"{stage} p95 rose from {old['p95_ms']:.3f} ms to {new['p95_ms']:.3f} ms")
+    return problems
+
+
+def print_report(report):
+    print(f"{report['records']} recorded responses x {report['runs'] // max(report['records'], 1)} ({report['mode']} parse), "
+          f"{report['runs_per_sec']:.0f} replays/s")
+    print(f"parse success {report['parse_success']:.1%}, nutrient coverage mean {report['coverage_mean']:.1%}, "
+          f"all {len(NUTRIENT_NAMES)} nutrients in {report['full_coverage']:.1%}")
+    if report["most_missing"]:
+        print("most often missing: " + ", ".join(f"{name} ({count})" for name, count in report["most_missing"]))
+    print(f"{'stage':<8}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    for stage, t in report["stages"].items():
+        print(f"{stage:<8}{t['p50_ms']:>10.3f}{t['p95_ms']:>10.3f}{t['mean_ms']:>10.3f}")
+    model = report["model_latency"]
+    if model["p50"] is not None:
+        print(f"{'model':<8}{model['p50'] * 1000:>10.0f}{model['p95'] * 1000:>10.0f}{'':>10}  (recorded, not replayed)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay recorded model responses through the analysis pipeline.")
+    parser.add_argument("recordings", help="JSONL file written with ANALYSIS_RECORD")
+    parser.add_argument("--stream", action="store_true", help="parse the recorded chunks with the streaming parser")
+    parser.add_argument("--save", action="store_true", help="also save every analysis with add_meal_entry (needs DATABASE_URL)")
+    parser.add_argument("--repeat", type=int, default=1, help="replay the file this many times")
+    parser.add_argument("--save-baseline", metavar="FILE", help="write the report as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="fail on regressions against a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 increase for --compare (default 0.2)")
+    args = parser.parse_args()
+    records = load_recordings(args.recordings)
+    if args.save:
+        with replay_user() as user_id:
+            report = replay(records, args.stream, user_id, args.repeat)
+    else:
+        report = replay(records, args.stream, None, args.repeat)
+    print_report(report)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}.")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            problems = compare(report, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        sys.exit(1 if problems else 0)
@@ -0,0 +1,228 @@
+# response_parser.py - turning model responses into {title, full_text, nutrients}
+
+# There is one parser: StreamingSummaryParser, a line-based state machine.
+# parse_summary_from_response feeds it the whole text at once, so a streamed
+# analysis and a non-streamed one can never disagree. The parser tolerates the
+# drift seen in real responses:
+#   - title lines like "**Meal Title:** X", "1. Meal Title - X" or "Meal title: Meal Title: X",
+#   - ```json / ```JSON / bare ``` fences, a closing fence glued to "]", no fence at all,
+#   - trailing commas, "..." placeholders, single quotes, one broken object in the array,
+#   - nutrient aliases ("Carbs", "Vitamin B9") and units (µg, g vs mg, IU, kJ),
+#   - structured-output responses: a JSON object with title/advantages/.../nutrients.
+# Nutrients are validated and normalised to the canonical names and units in nutrients.py.
+
+import re
+import json
+
+from nutrients import normalize_nutrients
+from instrumentation import span
+
+TITLE_RE = re.compile(r"meal\s+title\s*\**\s*[:\-–]\s*\**\s*(.*)", re.IGNORECASE)
+TITLE_PREFIX_RE = re.compile(r"^[\s*_`]*(?:\d+\.\s*)?[\s*_`]*meal\s+title\s*\**\s*[:\-–]\s*", re.IGNORECASE)
+FENCE_RE = re.compile(r"^\s*```\s*(?:json)?\s*(.*)$", re.IGNORECASE)
+TITLE, TEXT, JSON, DONE, STRUCTURED = "title", "text", "json", "done", "structured"
+
+
+def clean_title(raw):
+    """Strip markdown, brackets and repeated "Meal Title:" prefixes from a title."""
+    title = raw.strip()
+    while True:
+        stripped = TITLE_PREFIX_RE.sub("", title, count=1)
+        if stripped == title: break
+        title = stripped
+    return title.strip().strip("*_`\"'[] ").replace('**', '').strip()
+
+
+# --- JSON REPAIR ---
+JSON_REPAIRS = (
+    (re.compile(r"//[^\n]*"), ""),                         # comments
+    (re.compile(r":\s*\.\.\."), ": null"),                 # "amount": ...
+    (re.compile(r",\s*\.\.\.\s*(?=[\]}])"), ""),           # trailing ", ..." item
+    (re.compile(r",\s*([\]}])"), r"\1"),                   # trailing commas
+)
+UNQUOTED_KEY_RE = re.compile(r"([{,]\s*)([A-Za-z_]\w*)\s*:")
+OBJECT_RE = re.compile(r"\{[^{}]*\}")
+
+
+def _repair_json(text):
+    for pattern, replacement in JSON_REPAIRS:
+        text = pattern.sub(replacement, text)
+    if '"' not in text: text = text.replace("'", '"')
+    return UNQUOTED_KEY_RE.sub(r'\1"\2":', text)   # unquoted keys
+
+
+def _loads_tolerant(text):
+    """json.loads, then a repaired retry, then object-by-object salvage; [] if nothing parses."""
+    for candidate in (text, _repair_json(text)):
+        try: return json.loads(candidate)
+        except json.JSONDecodeError: pass
+    salvaged = []
+    for obj in OBJECT_RE.findall(text):
+        try: salvaged.append(json.loads(_repair_json(obj)))
+        except json.JSONDecodeError: continue
+    return salvaged
+
+
+def parse_nutrient_json(text):
+    """Parse the nutrient block, accepting a list, ``{"nutrients": [...]}`` or ``{name: {...}}``."""
+    data = _loads_tolerant(text.strip())
+    if isinstance(data, dict):
+        data = data.get("nutrients", data)
+    if isinstance(data, dict):
+        data = [{"nutrient": name, **(value if isinstance(value, dict) else {"amount": value})} for name, value in data.items()]
+    return normalize_nutrients(data)
+
+
+# --- STRUCTURED OUTPUT ---
+def parse_structured_response(response_text):
+    """Parse a structured-output (JSON object) response, or None if it is not one.
+
+    full_text is rebuilt in the markdown layout of the free-text prompt, so stored
+    meals and the results view look the same whichever mode produced them.
+    """
+    data = _loads_tolerant(response_text.strip())
+    if not isinstance(data, dict) or "nutrients" not in data:
+        return None
+    nutrients = parse_nutrient_json(json.dumps(data["nutrients"]))
+    title = clean_title(str(data.get("title") or "")) or "Untitled Meal"
+    full_text = render_markdown(title, data.get("advantages"), data.get("disadvantages"), data.get("fun_fact"), nutrients)
+    return {'title': title, 'full_text': full_text, 'nutrients': nutrients}
+
+
+def render_markdown(title, advantages, disadvantages, fun_fact, nutrients):
+    def join(items):
+        return "; ".join(items) if isinstance(items, list) else str(items or "")
+    return (f"Meal Title: {title}\n\n- **Advantages:** {join(advantages)}\n- **Disadvantages:** {join(disadvantages)}\n\n"
+            f"***Fun Fact:*** {fun_fact or ''}\n\n```json\n{json.dumps(nutrients, indent=2)}\n```")
+
+
+def parse_summary_from_response(response_text):
+    with span("parse"):
+        parser = StreamingSummaryParser()
+        parser.feed(response_text)
+        return parser.finish()[1]
+
+
+# --- STREAMING ---
+# StreamingSummaryParser lets the analyzer show the meal title and the
+# advantages/disadvantages text while the model is still generating, and the
+# nutrient table as soon as the fenced JSON block closes. It works line by line
+# over arbitrary chunk splits:
+#
+#   TITLE      -> looking for the title line (prose seen before it is held back)
+#   TEXT       -> prose lines are emitted until a ``` fence or a bare JSON array opens
+#   JSON       -> lines are collected until the closing fence (or the end, if unfenced)
+#   DONE       -> the rest is only kept for full_text
+#   STRUCTURED -> the response is a JSON object; everything is emitted by finish()
+
+class StreamingSummaryParser:
+    def __init__(self):
+        self.state = TITLE
+        self.parts = []
+        self._pending = ""      # incomplete trailing line
+        self._held = []         # prose seen before the title line
+        self._json_lines = []
+        self._fenced = True
+        self.title = None
+        self.nutrients = None
+
+    def feed(self, chunk):
+        """Consume a chunk and return the events it completes.
+
+        Events are ``("title", str)``, ``("text", str)`` with one or more full
+        lines, and ``("nutrients", list)`` once the JSON block is closed.
+        """
+        self.parts.append(chunk)
+        lines = (self._pending + chunk).split("\n")
+        self._pending = lines.pop()
+        events = []
+        for line in lines:
+            self._line(line.rstrip("\r"), events)
+        return _merge_text(events)
+
+    def finish(self):
+        """Flush the last partial line and return ``(events, results)``."""
+        events = []
+        if self._pending:
+            self._line(self._pending.rstrip("\r"), events); self._pending = ""
+        full_text = "".join(self.parts)
+        if self.state == STRUCTURED:
+            structured = parse_structured_response(full_text)
+            if structured:
+                prose = structured['full_text'].split("```json")[0].split("\n", 1)[1]
+                events += [("title", structured['title']), ("text", prose), ("nutrients", structured['nutrients'])]
+                return events, structured
+            self.state = JSON; self._fenced = False; self._json_lines = self._held; self._held = []
+        if self.title is None:
+            self._emit_fallback_title(events)
+        if self.state == JSON:
+            self._close_json(events)
+        return _merge_text(events), {'title': self.title, 'full_text': full_text, 'nutrients': self.nutrients or []}
+
+    def _line(self, line, events):
+        if self.state == TITLE:
+            match = TITLE_RE.search(line)
+            if match and clean_title(match.group(1)):
+                self.title = clean_title(match.group(1))
+                events.append(("title", self.title))
+                events.extend(("text", held + "\n") for held in self._held)
+                self._held = []
+                self.state = TEXT
+            elif not any(held.strip() for held in self._held) and line.lstrip().startswith("{"):
+                self.state = STRUCTURED; self._held.append(line)
+            elif self._starts_json(line):
+                self._emit_fallback_title(events); self._open_json(line, events)
+            else:
+                self._held.append(line)
+        elif self.state == TEXT:
+            if self._starts_json(line):
+                self._open_json(line, events)
+            else:
+                events.append(("text", line + "\n"))
+        elif self.state == JSON:
+            stripped = line.strip()
+            if self._fenced and stripped.endswith("```"):
+                self._json_lines.append(stripped[:-3])
+                self._close_json(events)
+            else:
+                self._json_lines.append(line)
+        elif self.state == STRUCTURED:
+            self._held.append(line)
+
+    @staticmethod
+    def _starts_json(line):
+        return bool(FENCE_RE.match(line)) or line.lstrip().startswith("[{") or line.strip() == "["
+
+    def _open_json(self, line, events):
+        fence = FENCE_RE.match(line)
+        self.state, self._fenced = JSON, bool(fence)
+        rest = fence.group(1) if fence else line
+        if fence and rest.endswith("```"):      # ```json [...] ``` on one line
+            self._json_lines.append(rest[:-3]); self._close_json(events)
+        elif rest:
+            self._json_lines.append(rest)
+
+    def _close_json(self, events):
+        self.state = DONE
+        self.nutrients = parse_nutrient_json("\n".join(self._json_lines))
+        events.append(("nutrients", self.nutrients))
+
+    def _emit_fallback_title(self, events):
+        # No title line: use the first non-empty line.
+        first = next((i for i, line in enumerate(self._held) if line.strip()), None)
+        self.title = (clean_title(self._held[first]) if first is not None else "") or "Untitled Meal"
+        events.append(("title", self.title))
+        events.extend(("text", held + "\n") for i, held in enumerate(self._held) if i != first)
+        self._held = []
+        if self.state == TITLE:
+            self.state = TEXT
+
+
+def _merge_text(events):
+    merged = []
+    for kind, value in events:
+        if kind == "text" and merged and merged[-1][0] == "text":
+            merged[-1] = ("text", merged[-1][1] + value)
+        else:
+            merged.append((kind, value))
+    return merged
@@ -0,0 +1,110 @@
+# sessions.py - signed session tokens, so that any server process can pick up a session
+
+# st.session_state lives in the process holding the browser's websocket. When a
+# reconnect lands on another replica, that replica starts with an empty session
+# and the user would be logged out. So the app keeps a signed token in a cookie
+# (app.py), not in the URL, where it would end up in browser history, logs and
+# shared links. It names the user and a random session id, and carries an
+# expiry time. Any replica that has the same SESSION_SECRET can check it with
+# one HMAC (verify_token). The session's page and current analysis are kept
+# under its id in the shared state store (state_store.py).
+#
+# A signature alone cannot be taken back. So issuing a token also writes a
+# session:{id} record to the store, and resume() only accepts a token whose
+# record still exists. Logging out deletes the record (revoke()): the old token
+# stops working on every replica, without waiting for SESSION_TTL. resume()
+# therefore costs one store read. The app calls it once per new connection;
+# reruns on that connection use st.session_state and read neither. With
+# STATE_BACKEND=memory the record only exists in the process that issued it,
+# so several replicas need a shared backend.
+#
+# Set SESSION_SECRET to the same value on every replica. Without it, each
+# process signs with a random secret, and its tokens are only valid in that
+# process.
+
+import os
+import hmac
+import json
+import time
+import base64
+import secrets
+import hashlib
+
+from state_store import get_state_store
+
+SESSION_SECRET = (os.getenv("SESSION_SECRET") or secrets.token_hex(32)).encode()
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+
+SESSION_KEY = "session:{}"          # exists while the session may be resumed
+STATE_KEY = "session_state:{}"      # the session's saved values
+
+
+class Session:
+    def __init__(self, session_id, user_id, username, expires_at):
+        self.session_id = session_id    # random, names the session's entry in the state store
+        self.user_id = user_id          # None for a visitor who has not logged in
+        self.username = username
+        self.expires_at = expires_at    # Unix time
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _signature(payload):
+    return hmac.new(SESSION_SECRET, payload, hashlib.sha256).digest()
+
+
+def issue_token(user_id=None, username=None, ttl=SESSION_TTL):
+    """A new session and its token; a fresh session id every time, so a token seen before login is useless after."""
+    session = Session(secrets.token_urlsafe(16), user_id, username, int(time.time() + ttl))
+    payload = json.dumps([session.session_id, user_id, username, session.expires_at], separators=(",", ":")).encode()
+    get_state_store().set(SESSION_KEY.format(session.session_id), b"1", ttl)
+    return session, f"{_b64encode(payload)}.{_b64encode(_signature(payload))}"
+
+
+def verify_token(token, now=None):
+    """The Session a token was issued for, or None if it is malformed, forged or expired."""
+    try:
+        payload_text, signature_text = token.split(".")
+        payload = _b64decode(payload_text)
+        if not hmac.compare_digest(_b64decode(signature_text), _signature(payload)):
+            return None
+        session = Session(*json.loads(payload))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    return session if session.expires_at > (now or time.time()) else None
+
+
+def resume(token):
+    """The Session for a token that is valid and has not been revoked, or None."""
+    session = verify_token(token)
+    if session is None or get_state_store().get(SESSION_KEY.format(session.session_id)) is None:
+        return None
+    return session
+
+
+def revoke(session_id):
+    """End a session everywhere: its token is no longer accepted by resume() and its values are dropped."""
+    store = get_state_store()
+    store.delete(SESSION_KEY.format(session_id)); store.delete(STATE_KEY.format(session_id))
+
+
+# --- SESSION STATE ---
+def load_state(session_id):
+    """The values last saved for a session, or {}."""
+    payload = get_state_store().get(STATE_KEY.format(session_id))
+    return json.loads(payload) if payload else {}
+
+
+def save_state(session_id, values, previous=None, ttl=SESSION_TTL):
+    """Store a session's JSON-serialisable values for other replicas, unless they equal `previous`
+    (what this returned last time). Returns the payload."""
+    payload = json.dumps(values, sort_keys=True, default=str).encode()
+    if payload != previous:
+        get_state_store().set(STATE_KEY.format(session_id), payload, ttl)
+    return payload
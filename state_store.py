@@ -0,0 +1,176 @@
+# state_store.py - key/value store for state that every server process must see
+
+# A replica only has its own memory. Behind a load balancer without sticky
+# sessions, the next request of a session can land on another replica, and
+# every replica would otherwise redo the same work. What must survive that
+# (session state, see sessions.py) and what is worth computing once
+# (dashboard data, analyses) goes through this store.
+#
+# Every backend stores bytes under a string key with a TTL, and has an atomic
+# counter, incr(), for limits that every replica must share (users.py):
+#   memory    in-process LRU; one process only, the default for a single server
+#   postgres  the shared_state table (see migrations.py)
+#   redis     any Redis-compatible server at REDIS_URL (Redis, Valkey, KeyDB...); needs `pip install redis`
+#
+# Backends are chosen with STATE_BACKEND = memory | postgres | redis.
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from db import connection
+from instrumentation import span
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_MAX_BYTES = int(os.getenv("STATE_MAX_BYTES", str(64 * 1024 * 1024)))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class MemoryStore:
+    """In-process LRU bounded by the total size of the stored payloads."""
+
+    def __init__(self, max_bytes=STATE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at < time.time():
+                self._drop(key); return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def set(self, key, payload, ttl):
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (payload, time.time() + ttl)
+            self.current_bytes += len(payload)
+            while self.current_bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def incr(self, key, ttl):
+        """Add one to the counter at `key`, starting it with a `ttl` if absent or expired.
+        Returns (count, seconds until it expires)."""
+        with self._lock:
+            now = time.time()
+            entry = self._entries.get(key)
+            count, expires_at = (int(entry[0]) + 1, entry[1]) if entry and entry[1] >= now else (1, now + ttl)
+            if entry:
+                self._drop(key)
+            payload = str(count).encode()
+            self._entries[key] = (payload, expires_at)
+            self.current_bytes += len(payload)
+            while self.current_bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+            return count, expires_at - now
+
+    def _drop(self, key):
+        payload, _ = self._entries.pop(key)
+        self.current_bytes -= len(payload)
+
+
+class PostgresStore:
+    """Shared across processes via the shared_state table."""
+
+    PURGE_EVERY = 100
+
+    def __init__(self):
+        self._writes = 0
+
+    def get(self, key):
+        with span("state.get"), connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT payload FROM shared_state WHERE key = %s AND expires_at > now();", (key,))
+            row = cur.fetchone()
+            conn.commit()
+        return bytes(row[0]) if row else None
+
+    def set(self, key, payload, ttl):
+        with span("state.set"), connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO shared_state (key, payload, expires_at) VALUES (%s, %s, now() + %s * interval '1 second')
+                ON CONFLICT (key) DO UPDATE SET payload = EXCLUDED.payload, expires_at = EXCLUDED.expires_at;
+            """, (key, payload, ttl))
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                cur.execute("DELETE FROM shared_state WHERE expires_at <= now();")
+            conn.commit()
+
+    def delete(self, key):
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM shared_state WHERE key = %s;", (key,))
+            conn.commit()
+
+    def incr(self, key, ttl):
+        # The row lock taken by ON CONFLICT serialises concurrent increments across processes.
+        with span("state.incr"), connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO shared_state AS s (key, payload, expires_at) VALUES (%s, '1', now() + %s * interval '1 second')
+                ON CONFLICT (key) DO UPDATE SET
+                    payload = CASE WHEN s.expires_at > now()
+                                   THEN convert_to((convert_from(s.payload, 'UTF8')::bigint + 1)::text, 'UTF8') ELSE '1' END,
+                    expires_at = CASE WHEN s.expires_at > now() THEN s.expires_at ELSE EXCLUDED.expires_at END
+                RETURNING convert_from(payload, 'UTF8')::bigint, extract(epoch FROM expires_at - now());
+            """, (key, ttl))
+            count, expires_in = cur.fetchone()
+            conn.commit()
+        return count, float(expires_in)
+
+
+class RedisStore:
+    """Shared across processes (and hosts) via a Redis-compatible server; keys expire on the server."""
+
+    def __init__(self, url=REDIS_URL, prefix="nutrition:"):
+        import redis      # optional dependency, only needed for this backend
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)     # thread-safe; keeps its own connection pool
+
+    def get(self, key):
+        with span("state.get"):
+            return self._client.get(self.prefix + key)
+
+    def set(self, key, payload, ttl):
+        with span("state.set"):
+            self._client.set(self.prefix + key, payload, ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self._client.delete(self.prefix + key)
+
+    def incr(self, key, ttl):
+        with span("state.incr"):
+            pipe = self._client.pipeline()      # MULTI/EXEC: the three commands run as one
+            pipe.set(self.prefix + key, 0, ex=max(1, int(ttl)), nx=True)
+            pipe.incr(self.prefix + key)
+            pipe.ttl(self.prefix + key)
+            _, count, expires_in = pipe.execute()
+        return count, float(expires_in)
+
+
+STORES = {"memory": MemoryStore, "postgres": PostgresStore, "redis": RedisStore}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_state_store():
+    """Process-wide store using the backend named in STATE_BACKEND."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = STORES[STATE_BACKEND]()
+    return _store
@@ -0,0 +1,73 @@
+# stub_model.py - offline stand-in for the Gemini call
+
+# Returns a well-formed analysis after a configurable delay, so batch mode,
+# workers and benchmarks can run without network access or API cost.
+# Responses are derived from the image bytes, so the same image always gets
+# the same answer. Enable in the app with ANALYSIS_MODEL=stub.
+
+import os
+import json
+import time
+import random
+import hashlib
+
+from google.api_core import exceptions as google_exceptions
+
+from nutrients import NUTRIENTS
+
+STUB_LATENCY = float(os.getenv("STUB_MODEL_LATENCY", "2.0"))
+STUB_STREAM_CHUNKS = 20
+STUB_DISHES = ["Masala Dosa", "Chicken Caesar Salad", "Margherita Pizza", "Oatmeal with Berries",
+               "Vegetable Biryani", "Grilled Salmon with Rice", "Apple", "Instant Noodles"]
+
+
+def stub_response(image_bytes):
+    seed = int.from_bytes(hashlib.sha256(image_bytes).digest()[:8], "big")
+    rng = random.Random(seed)
+    nutrients = [{"nutrient": name, "amount": round(rng.uniform(0, 60), 2), "unit": unit,
+                  "percent_dv": round(rng.uniform(0, 40), 1)} for name, unit, _ in NUTRIENTS]
+    return (f"Meal Title: {rng.choice(STUB_DISHES)}\n\n"
+            "- **Advantages:** Balanced mix of macronutrients and a decent amount of fiber.\n"
+            "- **Disadvantages:** Sodium is on the higher side.\n\n"
+            "***Fun Fact:*** This is a stub response generated offline.\n\n"
+            f"```json\n{json.dumps(nutrients, indent=2)}\n```")
+
+
+# Errors the stub can inject, mirroring what the Gemini API raises under load.
+STUB_ERRORS = [google_exceptions.TooManyRequests, google_exceptions.ServiceUnavailable, google_exceptions.InternalServerError]
+
+
+class StubModel:
+    """Offline model. ``jitter`` adds up to that many seconds of random latency and
+    ``error_rate`` makes that fraction of calls fail with a transient API error."""
+
+    model_name = "stub"
+
+    def __init__(self, latency=STUB_LATENCY, jitter=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+
+    def _delay(self, timeout):
+        delay = self.latency + self._rng.uniform(0, self.jitter)
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"stub model exceeded {timeout}s")
+        if self._rng.random() < self.error_rate:
+            time.sleep(delay / 4)
+            raise self._rng.choice(STUB_ERRORS)("injected stub failure")
+        return delay
+
+    def __call__(self, image_data, prompt, timeout=None):
+        time.sleep(self._delay(timeout))
+        return stub_response(image_data[0]['data'])
+
+    def stream(self, image_data, prompt, timeout=None, chunks=STUB_STREAM_CHUNKS):
+        """Yield the response in even chunks spread over the call's latency."""
+        delay = self._delay(timeout)
+        text = stub_response(image_data[0]['data'])
+        size = -(-len(text) // chunks)
+        for start in range(0, len(text), size):
+            time.sleep(delay / chunks)
+            yield text[start:start + size]
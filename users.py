@@ -0,0 +1,112 @@
+# users.py - accounts: signup and password login
+
+# Kept out of app.py so that workers, scripts and the load tests can create and
+# authenticate users without importing Streamlit. Password hashing itself runs
+# in the process pool in passwords.py.
+#
+# Every login attempt counts against its username and its client IP. Each
+# count starts with the key's first attempt and lasts LOGIN_WINDOW seconds. Once
+# either has LOGIN_USER_ATTEMPTS / LOGIN_IP_ATTEMPTS attempts, further ones are
+# refused before any hashing, so credential stuffing cannot fill the hashing
+# pool. A successful login clears the username's count. Signups count against
+# the IP. The counts live in the state store (state_store.py), so with a shared
+# STATE_BACKEND every replica enforces the same limit.
+#
+# Behind a load balancer or reverse proxy, the connection comes from the proxy,
+# so the client IP is read from X-Forwarded-For. TRUSTED_PROXY_HOPS is the
+# number of proxies in front of the app that append to that header. The
+# address they saw is the one that many entries from the right; anything to its
+# left was sent by the client and cannot be trusted. With 0 (no proxy) the
+# connection's own address is used.
+
+import os
+
+import psycopg2
+
+from db import connection
+from state_store import get_state_store
+from passwords import PasswordServiceBusy, hash_password, verify_password, verify_and_update  # noqa: F401  (re-exported)
+
+LOGIN_WINDOW = float(os.getenv("LOGIN_WINDOW", "300"))
+LOGIN_USER_ATTEMPTS = int(os.getenv("LOGIN_USER_ATTEMPTS", "5"))
+LOGIN_IP_ATTEMPTS = int(os.getenv("LOGIN_IP_ATTEMPTS", "30"))
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+
+class LoginThrottled(RuntimeError):
+    """Raised without checking the password: too many recent attempts for this username or IP."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many attempts. Please try again in {retry_after:.0f} seconds.")
+        self.retry_after = retry_after
+
+
+class AttemptThrottle:
+    """Attempt counts per key in the state store, shared by every session (and, with a shared backend, every replica)."""
+
+    def __init__(self, window=LOGIN_WINDOW, store=None):
+        self.window = window
+        self.store = store
+
+    def hit(self, key, limit):
+        """Count an attempt; raises LoginThrottled if `key` has had more than `limit` in its window."""
+        if key is None:
+            return
+        count, expires_in = (self.store or get_state_store()).incr(self._store_key(key), self.window)
+        if count > limit:
+            raise LoginThrottled(expires_in)
+
+    def clear(self, key):
+        (self.store or get_state_store()).delete(self._store_key(key))
+
+    @staticmethod
+    def _store_key(key):
+        kind, value = key
+        return f"login_attempts:{kind}:{value}"
+
+
+throttle = AttemptThrottle()
+
+
+def client_ip(remote_addr, forwarded_for=None, trusted_hops=TRUSTED_PROXY_HOPS):
+    """The client address to throttle on: `remote_addr` without proxies, otherwise the
+    X-Forwarded-For entry added by the outermost trusted proxy (None if it is missing)."""
+    if trusted_hops <= 0:
+        return remote_addr
+    hops = [hop.strip() for hop in (forwarded_for or "").split(",") if hop.strip()]
+    return hops[-trusted_hops] if len(hops) >= trusted_hops else None
+
+
+def _ip_key(client_ip): return ("ip", client_ip) if client_ip else None
+
+
+def create_user(username, email, password, client_ip=None):
+    """True if the account was created, False if the username or email is taken."""
+    throttle.hit(_ip_key(client_ip), LOGIN_IP_ATTEMPTS)
+    hashed_password = hash_password(password)
+    try:
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s);", (username, email, hashed_password))
+            conn.commit(); return True
+    except psycopg2.IntegrityError: return False
+
+
+def authenticate_user(username, password, client_ip=None):
+    """The user's id if the password matches, otherwise None. Raises LoginThrottled or PasswordServiceBusy."""
+    user_key = ("user", username.lower())
+    throttle.hit(_ip_key(client_ip), LOGIN_IP_ATTEMPTS)
+    throttle.hit(user_key, LOGIN_USER_ATTEMPTS)
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id, password_hash FROM users WHERE username = %s;", (username,))
+        result = cur.fetchone()
+        conn.commit()
+    if result is None: return None
+    matches, new_hash = verify_and_update(password, result[1])
+    if not matches: return None
+    throttle.clear(user_key)
+    if new_hash:
+        # Stored with an older cost factor: upgrade it now that we have the plain password
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s;", (new_hash, result[0], result[1]))
+            conn.commit()
+    return result[0]